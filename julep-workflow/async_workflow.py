@@ -0,0 +1,505 @@
+# async_workflow.py - asyncio front end to the foodie tour workflow
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from cache import normalize_city
+from circuit_breaker import CircuitOpen
+from cuisine_agent import CuisineAgent, CuisineLookup
+from executions import run_execution_async, run_in_background
+from lazy import create_async_julep_client, lazy_property
+from main import FoodieTourWorkflow, TourError, TourJob, TourVariant
+from metrics import metrics, progress
+from registry import is_not_found
+from singleflight import AsyncSingleFlight
+from stage_scheduler import StageScheduler
+from tour_planner import TourPlanner
+from weather_service import Attempts, WeatherService
+
+if TYPE_CHECKING:
+    import httpx
+    from julep import AsyncJulep, Julep
+
+
+def _in_thread(on_late: Optional[Callable[[Any], Any]]) -> Optional[Callable[[Any], Any]]:
+    """Wrap an on_late callback so its cache write runs in a worker thread, not on the event loop"""
+    if on_late is None:
+        return None
+    return lambda result: run_in_background(asyncio.to_thread(on_late, result))
+
+
+async def _resource_id(owner, name: str) -> str:
+    """ID of an agent or task in owner's lazy attribute, created off the event loop on first use"""
+    resource = owner.__dict__.get(name)
+    if resource is None:
+        # The registry lookup may block
+        resource = await asyncio.to_thread(getattr, owner, name)
+    return resource.id
+
+
+class AsyncWeatherService:
+    """Coroutine front end to a WeatherService, sending its requests through an httpx.AsyncClient
+
+    Caches, rate limiting, the circuit breaker, parsing and fallbacks all
+    belong to the wrapped WeatherService. Cache reads and writes run in
+    worker threads, so SQLite never blocks the event loop.
+    """
+
+    def __init__(self, weather_service: WeatherService = None, pool_size: int = 256, **options):
+        self.weather_service = weather_service or WeatherService(pool_size=pool_size, **options)
+        # Connections kept open by the async client
+        self.pool_size = pool_size
+        self.flights = AsyncSingleFlight()
+        self._http = None
+
+    def _http_client(self) -> 'httpx.AsyncClient':
+        if self._http is None:
+            import httpx
+            connect_timeout, read_timeout = self.weather_service.timeout
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def suggest_dining_type(self, weather_data: Dict[str, Any]) -> str:
+        return self.weather_service.suggest_dining_type(weather_data)
+
+    async def get_weather(self, city: str, timeout: float = None) -> Dict[str, Any]:
+        """Get current weather for a city using Open-Meteo API
+
+        When timeout expires, mock weather is returned while the lookup
+        finishes in the background and fills the caches.
+        """
+        lookup = run_in_background(
+            self.flights.do('weather', normalize_city(city), self._get_weather_one, city)
+        )
+        try:
+            weather = await asyncio.wait_for(asyncio.shield(lookup), timeout)
+        except asyncio.TimeoutError:
+            metrics.inc('deadline_fallback_total', stage='weather')
+            return self.weather_service._get_mock_weather(city)
+        return dict(weather, city=city)
+
+    async def _get_weather_one(self, city: str) -> Dict[str, Any]:
+        return (await self.get_weather_many([city]))[0]
+
+    async def get_weather_many(self, cities: List[str]) -> List[Dict[str, Any]]:
+        """Get current weather for several cities, fetching every chunk concurrently"""
+        import httpx
+
+        service = self.weather_service
+        coordinates = await asyncio.gather(*(self._get_coordinates(city) for city in cities))
+        results, pending = await asyncio.to_thread(service._from_weather_cache, cities, coordinates)
+
+        chunks = service._chunks(list(pending))
+        fetched = await asyncio.gather(*(self._fetch_chunk(chunk) for chunk in chunks), return_exceptions=True)
+        for chunk, currents in zip(chunks, fetched):
+            if isinstance(currents, (httpx.HTTPError, KeyError, CircuitOpen)):
+                service._fill_mock_weather(cities, results, pending, chunk, currents)
+            elif isinstance(currents, BaseException):
+                raise currents
+            else:
+                await asyncio.to_thread(service._fill_weather, cities, results, pending, chunk, currents)
+
+        return results
+
+    async def prefetch_weather(self, cities: List[str]):
+        """WeatherService.prefetch_weather, with the batches running as background tasks"""
+        service = self.weather_service
+        try:
+            located = await asyncio.to_thread(service._located, cities)
+        except Exception as e:
+            progress(f"Weather prefetch failed: {e}")
+            return
+        claimed = self.flights.start_many('weather', located)
+        for start in range(0, len(claimed), service.batch_size):
+            keys = claimed[start:start + service.batch_size]
+            run_in_background(self._prefetch_chunk(keys, [located[key] for key in keys]))
+
+    async def _prefetch_chunk(self, keys: List[str], cities: List[str]):
+        try:
+            await self.flights.finish_many('weather', keys, self.get_weather_many, cities)
+        except Exception as e:
+            progress(f"Weather prefetch failed: {e}")
+
+    async def _get_coordinates(self, city: str) -> tuple:
+        service = self.weather_service
+        cached = await asyncio.to_thread(service._cached_coordinates, city)
+        if cached is not None:
+            return cached
+
+        with metrics.span('geocode'):
+            lat, lon = await self._geocode(city)
+        return await asyncio.to_thread(service._store_coordinates, city, lat, lon)
+
+    async def _geocode(self, city: str) -> tuple:
+        try:
+            response = await self._request(self.weather_service.geocoding_url, {'name': city, 'count': 1})
+            return self.weather_service._parse_geocode(response.json())
+        except Exception:
+            return None, None
+
+    async def _fetch_chunk(self, chunk: List[tuple]) -> List[Dict[str, Any]]:
+        service = self.weather_service
+        with metrics.span('weather_fetch'):
+            response = await self._request(service.weather_url, service._current_params(chunk))
+            currents = service._parse_current(response.json())
+        metrics.inc('weather_locations_fetched_total', len(chunk))
+        return currents
+
+    async def _request(self, url: str, params: Dict[str, Any]) -> 'httpx.Response':
+        with self.weather_service.breaker.guard():
+            return await self._send(url, params)
+
+    async def _send(self, url: str, params: Dict[str, Any]) -> 'httpx.Response':
+        """WeatherService._send on the async client: same limiter, retry and throttle policy"""
+        import httpx
+
+        service = self.weather_service
+        attempts = Attempts(service)
+        while True:
+            await service.rate_limiter.acquire_async()
+            service._count_request()
+            try:
+                response = await self._http_client().get(url, params=params)
+            except httpx.TransportError:
+                if attempts.last():
+                    raise
+                delay = attempts.retry()
+            else:
+                delay = attempts.after_response(response)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+
+
+class AsyncCuisineAgent:
+    """Coroutine front end to a CuisineAgent, running its executions on an AsyncJulep client
+
+    Cache and knowledge pack lookups, parsing and fallbacks belong to the
+    wrapped agent and run in worker threads; agents and tasks are still
+    resolved through its registry.
+    """
+
+    def __init__(self, cuisine_agent: CuisineAgent = None, async_client: 'AsyncJulep' = None):
+        self.cuisine_agent = cuisine_agent or CuisineAgent()
+        if async_client is not None:
+            self.async_client = async_client
+        self.flights = AsyncSingleFlight()
+
+    @lazy_property
+    def async_client(self) -> 'AsyncJulep':
+        return create_async_julep_client()
+
+    async def get_local_dishes(self, city: str, refresh: bool = False, timeout: float = None) -> List[str]:
+        """Get 3 iconic local dishes for a city"""
+        return list(await self._lookup(self.cuisine_agent._dishes_lookup(city, refresh), timeout))
+
+    async def find_restaurants(self, city: str, dishes: List[str], refresh: bool = False,
+                               timeout: float = None) -> List[str]:
+        """Find restaurants for the dishes"""
+        return list(await self._lookup(self.cuisine_agent._restaurants_lookup(city, dishes, refresh), timeout))
+
+    async def get_dishes_and_restaurants(self, city: str, refresh: bool = False,
+                                         timeout: float = None) -> Tuple[List[str], List[str]]:
+        """Get dishes and their restaurants in one execution"""
+        dishes, restaurants = await self._lookup(self.cuisine_agent._cuisine_lookup(city, refresh), timeout)
+        return list(dishes), list(restaurants)
+
+    async def _lookup(self, lookup: CuisineLookup, timeout: float = None):
+        """CuisineAgent._lookup: each caller waits on the shared execution for at most its own timeout"""
+        agent = self.cuisine_agent
+        known = await asyncio.to_thread(agent._known, lookup)
+        if known is not None:
+            return known
+        if not agent._budgeted(timeout):
+            return await self._shared_fetch(lookup)
+        try:
+            return await asyncio.wait_for(self._shared_fetch(lookup), max(0, timeout))
+        except asyncio.TimeoutError:
+            return agent._deadline_fallback(lookup)
+
+    async def _shared_fetch(self, lookup: CuisineLookup):
+        return await self.flights.do(lookup.kind, lookup.key, self._fetch, lookup)
+
+    async def _fetch(self, lookup: CuisineLookup, timeout: float = None):
+        agent = self.cuisine_agent
+        if timeout is None:
+            timeout = agent.completion_timeout
+        expires_at = time.monotonic() + timeout
+        try:
+            value = await self._run_task(lookup, timeout)
+        except (TimeoutError, CircuitOpen) as e:
+            return agent._unanswered(lookup, e)
+        if value is None and lookup.kind == 'cuisine':
+            agent._note_unusable(lookup)
+            dishes = await self._fetch_within(agent._dishes_lookup(lookup.city, lookup.refresh), expires_at)
+            return dishes, await self._fetch_within(agent._restaurants_lookup(lookup.city, dishes, lookup.refresh),
+                                                    expires_at)
+        return value if value is not None else lookup.fallback()
+
+    async def _fetch_within(self, lookup: CuisineLookup, expires_at: float):
+        known = await asyncio.to_thread(self.cuisine_agent._known, lookup)
+        if known is not None:
+            return list(known)
+        return list(await self.flights.do(lookup.kind, lookup.key, self._fetch, lookup,
+                                          self.cuisine_agent._remaining(expires_at)))
+
+    async def _run_task(self, lookup: CuisineLookup, timeout: float = None):
+        """CuisineAgent._run_task on the async client"""
+        agent = self.cuisine_agent
+        for attempt in range(2):
+            task_id = await _resource_id(agent, lookup.task)
+            try:
+                result = await run_execution_async(self.async_client, task_id, lookup.execution_input,
+                                                   task=lookup.kind, timeout=timeout,
+                                                   on_late=_in_thread(agent._late_handler(lookup)))
+                break
+            except Exception as e:
+                if attempt or not is_not_found(e):
+                    raise
+                await asyncio.to_thread(agent._forget_resources, task_id)
+        return await asyncio.to_thread(agent._keep, lookup, result)
+
+
+class AsyncTourPlanner:
+    """Coroutine front end to a TourPlanner, generating narratives on an AsyncJulep client"""
+
+    def __init__(self, tour_planner: TourPlanner = None, async_client: 'AsyncJulep' = None):
+        self.tour_planner = tour_planner or TourPlanner()
+        if async_client is not None:
+            self.async_client = async_client
+
+    @lazy_property
+    def async_client(self) -> 'AsyncJulep':
+        return create_async_julep_client()
+
+    async def create_tour(self, city: str, weather_data: Dict[str, Any],
+                          dining_type: str, restaurants: List[str],
+                          dietary_restrictions: List[str] = None, timeout: float = None) -> str:
+        """Create a foodie tour narrative"""
+        planner = self.tour_planner
+        request = (city, weather_data, dining_type, restaurants, dietary_restrictions)
+        try:
+            key = planner._cache_key(*request)
+            cached = await asyncio.to_thread(planner._cache_get, key)
+            if cached is not None:
+                return cached
+
+            result = await self._execute_tour_task(planner._user_message(*request), timeout,
+                                                   _in_thread(planner._late_handler(key, city)))
+            return await asyncio.to_thread(planner._tour_from_result, key, result, *request)
+
+        except Exception as e:
+            progress(f"Exception occurred: {e}")
+            return planner._create_fallback_tour(*request)
+
+    async def create_tour_stream(self, city: str, weather_data: Dict[str, Any],
+                                 dining_type: str, restaurants: List[str],
+                                 dietary_restrictions: List[str] = None,
+                                 timeout: float = None) -> AsyncIterator[str]:
+        """Yield the foodie tour narrative in chunks"""
+        tour = await self.create_tour(city, weather_data, dining_type, restaurants, dietary_restrictions, timeout)
+        for chunk in self.tour_planner.chunk_text(tour):
+            yield chunk
+
+    async def _execute_tour_task(self, user_message: str, timeout: float = None, on_late=None):
+        """TourPlanner._execute_tour_task on the async client"""
+        planner = self.tour_planner
+        try:
+            execution_timeout = planner._execution_timeout(timeout)
+            for attempt in range(2):
+                task_id = await _resource_id(planner, 'tour_task')
+                try:
+                    return await run_execution_async(self.async_client, task_id, {"user_message": user_message},
+                                                     task='tour', timeout=execution_timeout, on_late=on_late)
+                except Exception as e:
+                    if attempt or not is_not_found(e):
+                        raise
+                    await asyncio.to_thread(planner._forget_resources, task_id)
+        except TimeoutError:
+            return planner._timed_out(timeout)
+
+
+class AsyncFoodieTourWorkflow:
+    """asyncio front end to a FoodieTourWorkflow
+
+    Every method that waits on Julep or Open-Meteo is a coroutine, so
+    thousands of cities can be in flight on one event loop without a
+    thread each. The stage graph, caches, agents and fallbacks are those
+    of the wrapped blocking workflow; only the network calls differ.
+    """
+
+    def __init__(self, max_concurrency: int = 256, fused_cuisine: bool = False,
+                 client: 'Julep' = None, async_client: 'AsyncJulep' = None,
+                 weather_service: AsyncWeatherService = None, use_cache: bool = True,
+                 latency_budget: float = None, use_knowledge_pack: bool = True):
+        # Upper bound on cities in flight at once
+        self.max_concurrency = max(1, max_concurrency)
+        self.weather_service = weather_service or AsyncWeatherService(pool_size=self.max_concurrency,
+                                                                      use_knowledge_pack=use_knowledge_pack)
+        self.workflow = FoodieTourWorkflow(max_concurrency=self.max_concurrency, fused_cuisine=fused_cuisine,
+                                           client=client, weather_service=self.weather_service.weather_service,
+                                           use_cache=use_cache, latency_budget=latency_budget,
+                                           use_knowledge_pack=use_knowledge_pack)
+        if async_client is not None:
+            self.async_client = async_client
+
+    @lazy_property
+    def async_client(self) -> 'AsyncJulep':
+        return create_async_julep_client()
+
+    @lazy_property
+    def cuisine_agent(self) -> AsyncCuisineAgent:
+        return AsyncCuisineAgent(self.workflow.cuisine_agent, self.async_client)
+
+    @lazy_property
+    def tour_planner(self) -> AsyncTourPlanner:
+        return AsyncTourPlanner(self.workflow.tour_planner, self.async_client)
+
+    async def aclose(self):
+        """Close the HTTP connections held by the async clients"""
+        await self.weather_service.aclose()
+        if 'async_client' in self.__dict__:
+            await self.async_client.close()
+
+    async def get_weather(self, city: str, timeout: float = None) -> Dict[str, Any]:
+        return await self.weather_service.get_weather(city, timeout=timeout)
+
+    async def get_local_dishes(self, city: str, timeout: float = None) -> List[str]:
+        return await self.cuisine_agent.get_local_dishes(city, timeout=timeout)
+
+    async def find_restaurants(self, city: str, dishes: List[str], timeout: float = None) -> List[str]:
+        return await self.cuisine_agent.find_restaurants(city, dishes, timeout=timeout)
+
+    async def create_tour(self, city: str, weather_data: Dict[str, Any], dining_type: str,
+                          restaurants: List[str], dietary_restrictions: List[str] = None,
+                          timeout: float = None) -> str:
+        return await self.tour_planner.create_tour(city, weather_data, dining_type, restaurants,
+                                                   dietary_restrictions, timeout=timeout)
+
+    async def create_foodie_tour(self, city: str, dining_preference: str = "Weather-based (Auto)",
+                                 dietary_restrictions: List[str] = None,
+                                 latency_budget: float = None) -> Dict[str, Any]:
+        """Create a complete foodie tour for a city"""
+        return await self._run_tour_stages(city, dining_preference, dietary_restrictions,
+                                           include_narrative=True, latency_budget=latency_budget)
+
+    async def prepare_foodie_tour(self, city: str, dining_preference: str = "Weather-based (Auto)",
+                                  dietary_restrictions: List[str] = None,
+                                  latency_budget: float = None) -> Dict[str, Any]:
+        """Gather weather, dishes and restaurants for a city, without the narrative"""
+        return await self._run_tour_stages(city, dining_preference, dietary_restrictions,
+                                           include_narrative=False, latency_budget=latency_budget)
+
+    async def create_foodie_tour_variants(self, city: str, variants: List[TourVariant],
+                                          latency_budget: float = None) -> List[Dict[str, Any]]:
+        """Create one tour per variant, sharing weather, dishes and restaurants"""
+        if not variants:
+            return []
+
+        workflow = self.workflow
+        deadline, started = workflow._deadline(latency_budget), time.perf_counter()
+        shared = await self._run_tour_stages(city, variants[0][0], None, include_narrative=False,
+                                             latency_budget=latency_budget)
+        resolved, unique = workflow._resolve_variants(city, shared, variants)
+
+        created = await asyncio.gather(*(
+            workflow._timed_narrative(self.tour_planner, city, shared, variant, deadline, started)
+            for variant in unique
+        ))
+        return workflow._variant_tours(city, shared, resolved, dict(zip(unique, created)))
+
+    async def _run_tour_stages(self, city: str, dining_preference: str, dietary_restrictions: List[str],
+                               include_narrative: bool, latency_budget: float = None) -> Dict[str, Any]:
+        """The blocking workflow's stage graph, run on the event loop with the async services"""
+        workflow = self.workflow
+        if dietary_restrictions is None:
+            dietary_restrictions = ["None"]
+        scheduler = StageScheduler(workflow._tour_stages(
+            city, dining_preference, dietary_restrictions, include_narrative, workflow._deadline(latency_budget),
+            self.weather_service, self.cuisine_agent, self.tour_planner
+        ))
+        return workflow._tour_from_stages(city, await scheduler.run_async(), dietary_restrictions, scheduler)
+
+    async def stream_tour_narrative(self, tour: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream the narrative for a tour returned by prepare_foodie_tour"""
+        progress("📝  Creating tour narrative...")
+        async for chunk in self.tour_planner.create_tour_stream(
+            tour['city'], tour['weather'], tour['dining_type'], tour['restaurants'], tour['dietary_restrictions']
+        ):
+            yield chunk
+
+    async def run_workflow(self, cities: List[str], dining_preference: str = "Weather-based (Auto)",
+                           dietary_restrictions: List[str] = None,
+                           max_concurrency: int = None, latency_budget: float = None) -> List[Dict[str, Any]]:
+        """Run the complete workflow for multiple cities, returning results in input order"""
+        progress("🚀 Starting Foodie Tour Workflow")
+        progress("=" * 50)
+
+        completed = {}
+        async for index, outcome in self._iter_indexed(cities, dining_preference, dietary_restrictions,
+                                                       max_concurrency, latency_budget):
+            self.workflow._report_outcome(outcome)
+            if not isinstance(outcome, TourError):
+                completed[index] = outcome
+
+        return [completed[index] for index in sorted(completed)]
+
+    async def iter_workflow(self, cities: List[str], dining_preference: str = "Weather-based (Auto)",
+                            dietary_restrictions: List[str] = None, max_concurrency: int = None,
+                            latency_budget: float = None) -> AsyncIterator[Union[Dict[str, Any], TourError]]:
+        """Yield each city's tour (or TourError) as soon as it is ready"""
+        async for _, outcome in self._iter_indexed(cities, dining_preference, dietary_restrictions,
+                                                   max_concurrency, latency_budget):
+            yield outcome
+
+    async def _iter_indexed(self, cities: List[str], dining_preference: str, dietary_restrictions: List[str],
+                            max_concurrency: int = None, latency_budget: float = None):
+        if not cities:
+            return
+
+        # Batched weather prefetch, as in the blocking workflow
+        await self.weather_service.prefetch_weather(cities)
+
+        jobs = ((index, city, dining_preference, dietary_restrictions) for index, city in enumerate(cities))
+        async for item in self.iter_tours(jobs, max_concurrency, latency_budget):
+            yield item
+
+    async def iter_tours(self, jobs: Iterable[TourJob], max_concurrency: int = None,
+                         latency_budget: float = None) -> AsyncIterator[Tuple[Any, Union[Dict[str, Any], TourError]]]:
+        """Run tour jobs as tasks, at most max_concurrency at a time, yielding (key, result) as each completes"""
+        limit = max(1, max_concurrency or self.max_concurrency)
+        jobs = iter(jobs)
+        in_flight = {}
+
+        def submit_next() -> bool:
+            job = next(jobs, None)
+            if job is None:
+                return False
+            key, city, dining_preference, dietary_restrictions = job
+            task = asyncio.ensure_future(self.create_foodie_tour(city, dining_preference, dietary_restrictions,
+                                                                 latency_budget))
+            in_flight[task] = (key, city)
+            return True
+
+        while len(in_flight) < limit and submit_next():
+            pass
+
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key, city = in_flight.pop(task)
+                    submit_next()
+                    yield key, self.workflow._outcome(city, task)
+        finally:
+            for task in in_flight:
+                task.cancel()
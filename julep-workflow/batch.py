@@ -0,0 +1,155 @@
+# batch.py - Bulk tour generation with checkpoint/resume and streaming JSONL output
+
+import argparse
+import csv
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+from main import FoodieTourWorkflow, TourError, TourJob
+from metrics import ProgressSink, metrics
+from storage import read_json, write_json
+
+
+def parse_restrictions(value: Any, default: List[str]) -> List[str]:
+    """Dietary restrictions from a JSON list or a ';'/'|' separated string"""
+    if isinstance(value, list):
+        restrictions = [str(item).strip() for item in value if str(item).strip()]
+    elif isinstance(value, str) and value.strip():
+        restrictions = [item.strip() for item in value.replace('|', ';').split(';') if item.strip()]
+    else:
+        restrictions = []
+    return restrictions or default
+
+
+def read_jobs(path: str, dining_preference: str, dietary_restrictions: List[str]) -> Iterator[TourJob]:
+    """Stream (row index, city, dining preference, restrictions) from a CSV or JSONL file
+
+    Rows may override the defaults with 'dining_preference' and
+    'dietary_restrictions' columns or fields.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            rows = (json.loads(line) if line.strip() else {} for line in f)
+        else:
+            rows = csv.DictReader(f)
+
+        for index, row in enumerate(rows):
+            yield (
+                index,
+                (row.get('city') or '').strip(),
+                (row.get('dining_preference') or '').strip() or dining_preference,
+                parse_restrictions(row.get('dietary_restrictions'), dietary_restrictions)
+            )
+
+
+class Checkpoint:
+    """Which input rows are done, stored as a watermark plus the done rows above it
+
+    Every row below the watermark is complete. Because the worker pool keeps
+    only a bounded window of rows in flight, the set above the watermark stays
+    small, and so does the checkpoint file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        state = read_json(path, {})
+        self.watermark = state.get('watermark', 0)
+        self.completed = set(state.get('completed', []))
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.completed
+
+    def mark_done(self, index: int):
+        self.completed.add(index)
+        while self.watermark in self.completed:
+            self.completed.remove(self.watermark)
+            self.watermark += 1
+        write_json(self.path, {'watermark': self.watermark, 'completed': sorted(self.completed)})
+
+
+def to_record(index: int, outcome) -> Dict[str, Any]:
+    if isinstance(outcome, TourError):
+        return {'index': index, 'status': 'error', **outcome.to_dict()}
+    return {'index': index, 'status': 'ok', **outcome}
+
+
+def run_batch(workflow: FoodieTourWorkflow, input_path: str, output_path: str,
+              dining_preference: str = "Weather-based (Auto)", dietary_restrictions: List[str] = None,
+              max_concurrency: int = None) -> Dict[str, Any]:
+    """Generate tours for every row of input_path, appending results to output_path
+
+    Rows already recorded in the checkpoint are skipped, so re-running the
+    same command after an interruption resumes where it stopped.
+    """
+    checkpoint = Checkpoint(f"{output_path}.checkpoint")
+    counts = {'ok': 0, 'error': 0, 'skipped': 0, 'invalid': 0}
+
+    def pending_jobs() -> Iterator[TourJob]:
+        for job in read_jobs(input_path, dining_preference, dietary_restrictions or ["None"]):
+            index, city = job[0], job[1]
+            if checkpoint.is_done(index):
+                counts['skipped'] += 1
+            elif not city:
+                counts['invalid'] += 1
+                checkpoint.mark_done(index)
+            else:
+                yield job
+
+    started = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as output:
+        for index, outcome in workflow.iter_tours(pending_jobs(), max_concurrency):
+            record = to_record(index, outcome)
+            output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+            # Output first, then checkpoint: a crash in between repeats a row rather than losing it
+            checkpoint.mark_done(index)
+            counts[record['status']] += 1
+
+    elapsed = time.perf_counter() - started
+    processed = counts['ok'] + counts['error']
+    return {
+        **counts,
+        'processed': processed,
+        'elapsed_seconds': elapsed,
+        'cities_per_second': processed / elapsed if elapsed else 0.0
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate foodie tours for many cities from a CSV or JSONL file")
+    parser.add_argument('input', help="CSV (with a 'city' column) or JSONL file of cities")
+    parser.add_argument('--output', default='tours.jsonl', help="JSONL file results are appended to")
+    parser.add_argument('--concurrency', type=int, default=8, help="Cities processed at once")
+    parser.add_argument('--dining-preference', default="Weather-based (Auto)",
+                        help="Default dining preference for rows without one")
+    parser.add_argument('--dietary-restrictions', default='',
+                        help="Default ';'-separated dietary restrictions for rows without any")
+    parser.add_argument('--fused', action='store_true', help="Use the fused dishes+restaurants task")
+    parser.add_argument('--restart', action='store_true',
+                        help="Discard the checkpoint and existing output and start over")
+    parser.add_argument('--verbose', action='store_true', help="Print per-city progress")
+    args = parser.parse_args()
+
+    if args.restart:
+        for path in (args.output, f"{args.output}.checkpoint"):
+            if os.path.exists(path):
+                os.remove(path)
+    if args.verbose:
+        metrics.add_sink(ProgressSink())
+
+    workflow = FoodieTourWorkflow(max_concurrency=args.concurrency, fused_cuisine=args.fused)
+    try:
+        summary = run_batch(workflow, args.input, args.output, args.dining_preference,
+                            parse_restrictions(args.dietary_restrictions, ["None"]), args.concurrency)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted. Run the same command again to resume from {args.output}.checkpoint")
+        raise SystemExit(130)
+
+    print(f"✅ Processed {summary['processed']} cities ({summary['ok']} ok, {summary['error']} failed) "
+          f"in {summary['elapsed_seconds']:.1f}s — {summary['cities_per_second']:.2f} cities/s")
+    if summary['skipped']:
+        print(f"Skipped {summary['skipped']} rows already completed in a previous run")
+    if summary['invalid']:
+        print(f"Ignored {summary['invalid']} rows without a city")
@@ -0,0 +1,232 @@
+# benchmark.py - Offline latency and throughput benchmarks for the workflow
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from fake_backends import FakeJulep, LatencyModel, OpenMeteoStub
+
+CITIES = [
+    "Paris", "Tokyo", "New York", "Mumbai", "Mexico City", "Istanbul", "Bangkok", "Lima",
+    "Rome", "Seoul", "Lisbon", "Hanoi", "Marrakesh", "Osaka", "Barcelona", "Chicago"
+]
+
+# Run in a fresh interpreter so nothing is already imported
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from main import FoodieTourWorkflow
+imported = time.perf_counter()
+workflow = FoodieTourWorkflow()
+constructed = time.perf_counter()
+loaded = [name for name in ('julep', 'yaml', 'requests') if name in sys.modules]
+import julep, yaml, requests
+deferred = time.perf_counter()
+print(json.dumps({'import': imported - started, 'construct': constructed - imported,
+                  'deferred_imports': deferred - constructed, 'loaded': loaded}))
+"""
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': sum(values) / len(values) if values else 0.0
+    }
+
+
+def city_list(count: int) -> List[str]:
+    """Distinct city names, cycling through CITIES with a suffix when needed"""
+    return [CITIES[i % len(CITIES)] + (f" {i // len(CITIES) + 1}" if i >= len(CITIES) else "")
+            for i in range(count)]
+
+
+def build_workflow(args, julep: FakeJulep, stub: OpenMeteoStub):
+    """Workflow wired to the stand-in backends, with every cache cold"""
+    from geocode_cache import GeocodeCache
+    from main import FoodieTourWorkflow
+    from weather_service import WeatherService
+
+    # A tiny TTL puts every lookup in its own bucket, so nothing is served locally
+    weather_options = dict(
+        geocode_cache=GeocodeCache(),
+        weather_ttl=1e-9,
+        pool_size=args.concurrency,
+        geocoding_url=stub.geocoding_url,
+        weather_url=stub.weather_url,
+        use_knowledge_pack=False
+    )
+    if args.async_workflow:
+        from async_workflow import AsyncFoodieTourWorkflow, AsyncWeatherService
+        return AsyncFoodieTourWorkflow(
+            max_concurrency=args.concurrency,
+            fused_cuisine=args.fused,
+            client=julep,
+            async_client=julep.as_async(),
+            weather_service=AsyncWeatherService(**weather_options),
+            use_cache=False,
+            use_knowledge_pack=False
+        )
+
+    weather_service = WeatherService(**weather_options)
+    return FoodieTourWorkflow(
+        max_concurrency=args.concurrency,
+        fused_cuisine=args.fused,
+        client=julep,
+        weather_service=weather_service,
+        use_cache=False,
+        use_knowledge_pack=False
+    )
+
+
+async def run_async_workflow(workflow, cities: List[str]) -> List[Dict[str, Any]]:
+    try:
+        return await workflow.run_workflow(cities)
+    finally:
+        await workflow.aclose()
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    julep = FakeJulep(
+        execution_latency=LatencyModel(args.execution_latency, args.distribution, seed=args.seed),
+        api_latency=LatencyModel(args.api_latency, args.distribution, seed=args.seed),
+        failure_rate=args.failure_rate,
+        seed=args.seed
+    )
+    stub = OpenMeteoStub(
+        latency=LatencyModel(args.weather_latency, args.distribution, seed=args.seed),
+        failure_rate=args.weather_failure_rate,
+        seed=args.seed
+    )
+
+    stage_durations: Dict[str, List[float]] = {}
+    workflow_runs = {}
+
+    with stub, tempfile.TemporaryDirectory() as cache_dir:
+        os.environ['FOODIE_CACHE_DIR'] = cache_dir
+        for count in args.city_counts:
+            cities = city_list(count)
+            wall_times, completed = [], 0
+            for iteration in range(args.iterations):
+                # Fresh cache directory per run so geocoding is not served from disk
+                os.environ['FOODIE_CACHE_DIR'] = os.path.join(cache_dir, f"{count}-{iteration}")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    workflow = build_workflow(args, julep, stub)
+                    started = time.perf_counter()
+                    if args.async_workflow:
+                        results = asyncio.run(run_async_workflow(workflow, cities))
+                    else:
+                        results = workflow.run_workflow(cities)
+                    wall_times.append(time.perf_counter() - started)
+
+                completed += len(results)
+                for result in results:
+                    for stage, timing in result.get('stage_timings', {}).items():
+                        stage_durations.setdefault(stage, []).append(timing['end'] - timing['start'])
+
+            workflow_runs[count] = {
+                **summarize(wall_times),
+                'throughput': completed / sum(wall_times) if sum(wall_times) else 0.0,
+                'completed': completed,
+                'requested': count * args.iterations
+            }
+
+    return {
+        'config': vars(args),
+        'stages': {stage: summarize(values) for stage, values in stage_durations.items()},
+        'run_workflow': workflow_runs,
+        'backend_calls': dict(julep.calls, **{'open_meteo': stub.requests})
+    }
+
+
+def run_startup_benchmark(iterations: int) -> Dict[str, Any]:
+    """Time importing main and constructing a workflow, each run in a new process"""
+    samples = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, FOODIE_CACHE_DIR=cache_dir)
+        for _ in range(iterations):
+            completed = subprocess.run(
+                [sys.executable, '-c', STARTUP_SCRIPT],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=env, capture_output=True, text=True, check=True
+            )
+            samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    return {
+        'config': {'iterations': iterations},
+        'startup': {phase: summarize([sample[phase] for sample in samples])
+                    for phase in ('import', 'construct', 'deferred_imports')},
+        'loaded_at_startup': samples[-1]['loaded'] if samples else []
+    }
+
+
+def print_startup_report(report: Dict[str, Any]):
+    print(f"{'Startup phase':<20}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for phase, stats in report['startup'].items():
+        print(f"{phase:<20}{stats['count']:>6}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+    loaded = ", ".join(report['loaded_at_startup']) or "none"
+    print(f"\nHeavy modules loaded before first use: {loaded}")
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'Stage':<20}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<20}{stats['count']:>6}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+
+    print(f"\n{'run_workflow':<20}{'runs':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'cities/s':>10}")
+    for count, stats in report['run_workflow'].items():
+        label = f"{count} cities"
+        print(f"{label:<20}{stats['count']:>6}{stats['p50']:>10.3f}{stats['p95']:>10.3f}"
+              f"{stats['p99']:>10.3f}{stats['throughput']:>10.2f}")
+
+    print(f"\nBackend calls: {report['backend_calls']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the foodie tour workflow against offline backends")
+    parser.add_argument('--city-counts', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--fused', action='store_true', help="Use the fused dishes+restaurants task")
+    parser.add_argument('--async-workflow', action='store_true', help="Benchmark AsyncFoodieTourWorkflow")
+    parser.add_argument('--distribution', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    parser.add_argument('--execution-latency', type=float, default=0.5, help="Median Julep execution time (s)")
+    parser.add_argument('--api-latency', type=float, default=0.02, help="Median Julep API call time (s)")
+    parser.add_argument('--weather-latency', type=float, default=0.05, help="Median Open-Meteo response time (s)")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of Julep executions that fail")
+    parser.add_argument('--weather-failure-rate', type=float, default=0.0, help="Fraction of Open-Meteo requests that fail")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--startup', action='store_true',
+                        help="Measure import and construction time instead of the workflow")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = run_startup_benchmark(args.iterations)
+        print_startup_report(report)
+    else:
+        report = run_benchmark(args)
+        print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
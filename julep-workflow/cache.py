@@ -0,0 +1,227 @@
+# cache.py - In-memory and on-disk cache building blocks
+
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_city(city: str) -> str:
+    """Fold case, whitespace and diacritics so 'São  Paulo' matches 'sao paulo'"""
+    decomposed = unicodedata.normalize('NFKD', city)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(stripped.casefold().split())
+
+
+class LRUCache:
+    """Thread-safe in-memory least-recently-used cache"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class TTLCache:
+    """LRU cache whose entries expire when the clock enters the next ttl-sized bucket
+
+    Bucketing aligns expiry for every entry, so lookups made within the same
+    window always agree with each other.
+    """
+
+    def __init__(self, ttl: float = 900, maxsize: int = 1024):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+
+    def _bucket(self) -> int:
+        return int(time.time() // self.ttl)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        bucket, value = entry
+        if bucket != self._bucket():
+            self._entries.pop(key)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries.set(key, (self._bucket(), value))
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """SQLite key/value store for JSON values with TTL expiry and size-capped LRU eviction"""
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Stored value, or None when missing or expired"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(value, created_at) of a stored value, or None when missing or expired"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any):
+        """Store a JSON-serialisable value, evicting least recently used entries over max_bytes"""
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode('utf-8')), now, now)
+            )
+            self._evict()
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class TieredCache:
+    """In-memory LRU in front of a persistent DiskCache, sharing the disk tier's TTL"""
+
+    def __init__(self, disk: DiskCache, memory_size: int = 256):
+        self.disk = disk
+        self._memory = LRUCache(memory_size)
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or time.time() < expires_at:
+                self._count('memory_hits')
+                return value
+            self._memory.pop(key)
+
+        entry = self.disk.get_entry(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count('disk_hits')
+        value, created_at = entry
+        self._memory.set(key, (self._expires_at(created_at), value))
+        return value
+
+    def set(self, key: str, value: Any):
+        self.disk.set(key, value)
+        self._memory.set(key, (self._expires_at(time.time()), value))
+
+    def delete(self, key: str):
+        self._memory.pop(key)
+        self.disk.delete(key)
+
+    def clear(self):
+        self._memory.clear()
+        self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for both tiers"""
+        with self._stats_lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'disk_entries': len(self.disk),
+            'memory_hits': memory_hits,
+            'disk_hits': disk_hits,
+            'misses': misses,
+            'hit_ratio': self.hit_ratio()
+        }
+
+    def hit_ratio(self) -> float:
+        """Fraction of lookups served by either tier"""
+        with self._stats_lock:
+            hits, lookups = self.memory_hits + self.disk_hits, self.memory_hits + self.disk_hits + self.misses
+        return hits / lookups if lookups else 0.0
+
+    def _expires_at(self, created_at: float) -> Optional[float]:
+        # A memory entry expires with the disk entry it came from
+        return created_at + self.disk.ttl if self.disk.ttl is not None else None
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
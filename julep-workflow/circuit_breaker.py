@@ -0,0 +1,151 @@
+# circuit_breaker.py - Per-backend circuit breakers
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from metrics import metrics
+
+# Starting points per backend
+DEFAULT_BREAKERS = {
+    'julep': {'failure_threshold': 5, 'reset_timeout': 30.0},
+    'open-meteo': {'failure_threshold': 5, 'reset_timeout': 15.0},
+}
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+# Gauge values for circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a backend whose breaker is open"""
+
+    def __init__(self, backend: str):
+        super().__init__(f"Circuit breaker for {backend} is open")
+        self.backend = backend
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Whether an error means the backend is unhealthy
+
+    Server errors and failures without any response (connection errors,
+    timeouts) count. Client errors and rate limiting (429) do not: the
+    backend answered, and throttling is the rate limiter's job.
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None:
+        return not isinstance(error, (ValueError, KeyError, CircuitOpen))
+    return status >= 500
+
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker for one backend
+
+    Closed: calls go through. failure_threshold consecutive failures open it.
+    Open: calls fail immediately with CircuitOpen, so callers go straight to
+    their fallbacks. After reset_timeout one call is let through as a probe
+    and the breaker is half-open.
+    Half-open: other calls still fail fast. The probe succeeding closes the
+    breaker; failing reopens it. If the probe never reports back, another is
+    let through after reset_timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the backend now"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+                self._probe_at = now
+                return True
+            if self._state == HALF_OPEN and now - self._probe_at >= self.reset_timeout:
+                self._probe_at = now
+                return True
+            self._rejected += 1
+        metrics.inc('circuit_rejected_total', backend=self.name)
+        return False
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def record(self, error: BaseException = None):
+        """on_success, or on_failure if error means the backend is unhealthy"""
+        if error is None:
+            self.on_success()
+        elif is_backend_failure(error):
+            self.on_failure()
+
+    @contextmanager
+    def guard(self):
+        """Run a block against the backend, raising CircuitOpen instead while the breaker is open"""
+        if not self.allow():
+            raise CircuitOpen(self.name)
+        try:
+            yield
+        except Exception as e:
+            self.record(e)
+            raise
+        self.on_success()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': self.name,
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'rejected': self._rejected
+            }
+
+    def _transition(self, state: str):
+        self._state = state
+        metrics.inc('circuit_transitions_total', backend=self.name, state=state)
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('circuit_state', STATE_VALUES[self._state], backend=self.name)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(backend: str) -> CircuitBreaker:
+    """Process-wide breaker shared by every client of a backend"""
+    with _breakers_lock:
+        breaker = _breakers.get(backend)
+        if breaker is None:
+            breaker = _breakers[backend] = CircuitBreaker(backend, **DEFAULT_BREAKERS.get(backend, {}))
+        return breaker
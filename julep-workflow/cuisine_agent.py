@@ -1,129 +1,467 @@
-from julep import Julep
-import yaml
-import time
-import os
-from typing import List
-
-
-class CuisineAgent:
-    def __init__(self):
-        self.client = Julep(api_key=os.getenv('JULEP_API_KEY'))
-        self.agent = self._create_agent()
-        self.dishes_task = self._create_dishes_task()
-        self.restaurants_task = self._create_restaurants_task()
-
-    def _create_agent(self):
-        """Create the foodie agent"""
-        return self.client.agents.create(
-            name="Foodie Guide",
-            model="gpt-4o",
-            about="A culinary expert that knows local dishes and restaurants worldwide."
-        )
-
-    def _create_dishes_task(self):
-        """Create task to get iconic local dishes"""
-        task_definition = yaml.safe_load("""
-    name: Get Local Dishes
-    description: Get 3 iconic local dishes for a city
-    main:
-    - prompt:
-        - role: system
-          content: You are a culinary expert. Provide exactly 3 iconic local dishes for the given city.
-        - role: user
-          content: "List 3 iconic local dishes from {{steps[0].input.city}}. Return only the dish names, one per line, no descriptions."
-    """)
-        return self.client.tasks.create(
-            agent_id=self.agent.id,
-            **task_definition
-        )
-
-    def _create_restaurants_task(self):
-        """Create task to find restaurants"""
-        task_definition = yaml.safe_load("""
-        name: Find Restaurants
-        description: Find top-rated restaurants for specific dishes
-        main:
-        - prompt:
-            - role: system
-              content: You are a restaurant guide expert. Provide restaurant recommendations.
-            - role: user
-              content: "For {{steps[0].input.city}}, suggest 1 top-rated restaurant for each dish: {{steps[0].input.dishes}}. Return ONLY the restaurant suggestions, one per line, in the format 'Dish - Restaurant Name'. Do not include any introductory text or explanations."
-        """)
-        return self.client.tasks.create(
-            agent_id=self.agent.id,
-            **task_definition
-        )
-
-    def get_local_dishes(self, city: str) -> List[str]:
-        """Get 3 iconic local dishes for a city"""
-        execution = self.client.executions.create(
-            task_id=self.dishes_task.id,
-            input={"city": city}
-        )
-        result = self._wait_for_completion(execution.id)
-        if result.status == "succeeded":
-            output_text = ""
-            if isinstance(result.output, dict) and 'choices' in result.output:
-                choices = result.output.get('choices', [])
-                if choices and isinstance(choices, list) and 'message' in choices[0]:
-                    output_text = choices[0]['message'].get('content', '')
-            dishes = [dish.strip() for dish in output_text.split('\n') if dish.strip()]
-            return dishes[:3]
-        return [f"{city} Special Dish {i + 1}" for i in range(3)]
-
-    def find_restaurants(self, city: str, dishes: List[str]) -> List[str]:
-        """Find restaurants for the dishes"""
-        dishes_str = ", ".join(dishes)
-        execution = self.client.executions.create(
-            task_id=self.restaurants_task.id,
-            input={"city": city, "dishes": dishes_str}
-        )
-        result = self._wait_for_completion(execution.id)
-        if result.status == "succeeded":
-            output_text = ""
-            if isinstance(result.output, dict) and 'choices' in result.output:
-                choices = result.output.get('choices', [])
-                if choices and isinstance(choices, list) and 'message' in choices[0]:
-                    output_text = choices[0]['message'].get('content', '')
-            restaurants = [
-                rest.strip() for rest in output_text.split('\n')
-                if rest.strip() and '-' in rest
-            ]
-            return restaurants
-        return [f"Restaurant for {dish}" for dish in dishes]
-
-    def _wait_for_completion(self, execution_id: str):
-        """Wait for task execution to complete"""
-        while True:
-            result = self.client.executions.get(execution_id)
-            if result.status in ['succeeded', 'failed']:
-                return result
-            time.sleep(1)
-
-
-if __name__ == "__main__":
-    cuisine_agent = CuisineAgent()
-    city = "Tokyo"
-    dishes = cuisine_agent.get_local_dishes(city)
-    print(f"Local dishes in {city}:")
-    for dish in dishes:
-        print(f"- {dish}")
-    restaurants = cuisine_agent.find_restaurants(city, dishes)
-    print(f"\nRestaurants in {city}:")
-    for restaurant in restaurants:
-        print(f"- {restaurant}")
-
-"""
-#example code
-if __name__ == "__main__":
-    cuisine_agent = CuisineAgent()
-    city = "Tokyo"
-    dishes = cuisine_agent.get_local_dishes(city)
-    print(f"Local dishes in {city}:")
-    for dish in dishes:
-        print(f"- {dish}")
-    restaurants = cuisine_agent.find_restaurants(city, dishes)
-    print(f"\nRestaurants in {city}:")
-    for restaurant in restaurants:
-        print(f"- {restaurant}")
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from cache import DiskCache, TieredCache, normalize_city
+from circuit_breaker import CircuitOpen
+from executions import ExecutionPoller, run_execution
+from knowledge_pack import KnowledgePack, default_pack
+from lazy import create_julep_client, lazy_property
+from metrics import metrics, progress
+from registry import AgentRegistry, default_registry, is_not_found
+from singleflight import SingleFlight, default_group
+from storage import cache_path, definition_hash
+
+if TYPE_CHECKING:
+    from julep import Julep
+
+AGENT_DEFINITION = {
+    "name": "Foodie Guide",
+    "model": "gpt-4o",
+    "about": "A culinary expert that knows local dishes and restaurants worldwide."
+}
+
+DISHES_TASK_YAML = """
+name: Get Local Dishes
+description: Get 3 iconic local dishes for a city
+main:
+- prompt:
+    - role: system
+      content: You are a culinary expert. Provide exactly 3 iconic local dishes for the given city.
+    - role: user
+      content: "List 3 iconic local dishes from {{steps[0].input.city}}. Return only the dish names, one per line, no descriptions."
+"""
+
+RESTAURANTS_TASK_YAML = """
+name: Find Restaurants
+description: Find top-rated restaurants for specific dishes
+main:
+- prompt:
+    - role: system
+      content: You are a restaurant guide expert. Provide restaurant recommendations.
+    - role: user
+      content: "For {{steps[0].input.city}}, suggest 1 top-rated restaurant for each dish: {{steps[0].input.dishes}}. Return ONLY the restaurant suggestions, one per line, in the format 'Dish - Restaurant Name'. Do not include any introductory text or explanations."
+"""
+
+CUISINE_TASK_YAML = """
+name: Get Dishes And Restaurants
+description: Get 3 iconic local dishes for a city and a top-rated restaurant for each
+main:
+- prompt:
+    - role: system
+      content: You are a culinary expert and restaurant guide. Always answer with valid JSON only.
+    - role: user
+      content: 'List 3 iconic local dishes from {{steps[0].input.city}} and suggest 1 top-rated restaurant in {{steps[0].input.city}} for each dish. Respond with ONLY a JSON object of the form {"dishes": [{"dish": "Dish name", "restaurant": "Restaurant name"}]}. No markdown, no explanations.'
+"""
+
+# Dishes and restaurants for a city rarely change, so results are kept for a week
+CACHE_TTL = 7 * 24 * 3600
+
+
+def placeholder_dishes(city: str) -> List[str]:
+    """Dishes used when no real answer is available"""
+    return [f"{city} Special Dish {i + 1}" for i in range(3)]
+
+
+def placeholder_restaurants(dishes: List[str]) -> List[str]:
+    return [f"Restaurant for {dish}" for dish in dishes]
+
+
+class CuisineLookup:
+    """One dishes, restaurants or fused cuisine request
+
+    kind names the task and the coalescing key space. from_pack picks the
+    answer out of a knowledge pack entry (or returns None when the entry
+    does not fit), parse turns a finished execution into the answer (or
+    None), and fallback builds the placeholder answer. A lookup that is
+    not answerable goes straight to its fallback, with no execution.
+    """
+
+    def __init__(self, kind: str, city: str, key: str, task: str, execution_input: Dict[str, Any],
+                 parse: Callable[[Any], Any], from_pack: Callable[[Tuple[List[str], List[str]]], Any],
+                 fallback: Callable[[], Any], refresh: bool = False, answerable: bool = True):
+        self.kind = kind
+        self.city = city
+        # Cache key
+        self.key = key
+        # CuisineAgent attribute holding the Julep task
+        self.task = task
+        self.execution_input = execution_input
+        self.parse = parse
+        self.from_pack = from_pack
+        self.fallback = fallback
+        self.refresh = refresh
+        self.answerable = answerable
+
+
+class CuisineAgent:
+    # Seconds to wait for an execution before using the placeholders
+    completion_timeout = 30
+    # Threads running lookups whose callers have a deadline
+    background_workers = 64
+
+    def __init__(self, registry: AgentRegistry = None, client: 'Julep' = None,
+                 poller: ExecutionPoller = None, cache: TieredCache = None,
+                 use_cache: bool = True, cache_ttl: float = CACHE_TTL, flights: SingleFlight = None,
+                 knowledge_pack: KnowledgePack = None, use_knowledge_pack: bool = True):
+        # The client, poller, agent and tasks are created on first use
+        if client is not None:
+            self.client = client
+        if poller is not None:
+            self.poller = poller
+        self.registry = registry or default_registry()
+        # Successful results only; placeholder fallbacks are never cached
+        if use_cache and cache is None:
+            cache = TieredCache(DiskCache(cache_path('cuisine_cache.sqlite3'), ttl=cache_ttl))
+        self.cache = cache if use_cache else None
+        # Concurrent lookups of the same city share one execution
+        self.flights = flights or default_group()
+        # Precomputed answers for popular cities, consulted before any execution
+        self.knowledge_pack = (knowledge_pack or default_pack()) if use_knowledge_pack else None
+        # Runs lookups that must finish within a caller's deadline, so a late
+        # one can complete (and fill the cache) after the caller has moved on
+        self._background = ThreadPoolExecutor(max_workers=self.background_workers, thread_name_prefix="cuisine")
+
+    @lazy_property
+    def client(self) -> 'Julep':
+        return create_julep_client()
+
+    @lazy_property
+    def poller(self) -> ExecutionPoller:
+        return ExecutionPoller(self.client)
+
+    @lazy_property
+    def agent(self):
+        return self._create_agent()
+
+    @lazy_property
+    def dishes_task(self):
+        return self._create_dishes_task()
+
+    @lazy_property
+    def restaurants_task(self):
+        return self._create_restaurants_task()
+
+    @lazy_property
+    def cuisine_task(self):
+        # Only created the first time fused mode is used
+        return self._create_cuisine_task()
+
+    def _create_agent(self):
+        """Create the foodie agent"""
+        return self.registry.get_or_create_agent(self.client, **AGENT_DEFINITION)
+
+    def _create_dishes_task(self):
+        """Create task to get iconic local dishes"""
+        import yaml
+        task_definition = yaml.safe_load(DISHES_TASK_YAML)
+        return self.registry.get_or_create_task(self.client, self.agent.id, task_definition)
+
+    def _create_restaurants_task(self):
+        """Create task to find restaurants"""
+        import yaml
+        task_definition = yaml.safe_load(RESTAURANTS_TASK_YAML)
+        return self.registry.get_or_create_task(self.client, self.agent.id, task_definition)
+
+    def _create_cuisine_task(self):
+        """Create task returning dishes and their restaurants in one JSON response"""
+        import yaml
+        task_definition = yaml.safe_load(CUISINE_TASK_YAML)
+        return self.registry.get_or_create_task(self.client, self.agent.id, task_definition)
+
+    def get_local_dishes(self, city: str, refresh: bool = False, timeout: float = None) -> List[str]:
+        """Get 3 iconic local dishes for a city
+
+        Set refresh to ignore any cached answer and run the task again. When
+        timeout (or completion_timeout, when none is given) expires,
+        placeholder dishes are returned while the execution finishes in the
+        background and fills the cache.
+        """
+        return list(self._lookup(self._dishes_lookup(city, refresh), timeout))
+
+    def find_restaurants(self, city: str, dishes: List[str], refresh: bool = False,
+                         timeout: float = None) -> List[str]:
+        """Find restaurants for the dishes"""
+        return list(self._lookup(self._restaurants_lookup(city, dishes, refresh), timeout))
+
+    def get_dishes_and_restaurants(self, city: str, refresh: bool = False,
+                                   timeout: float = None) -> Tuple[List[str], List[str]]:
+        """Get dishes and their restaurants in one execution
+
+        Falls back to the two-step get_local_dishes/find_restaurants path when
+        the fused response is missing or cannot be parsed, and straight to
+        placeholders when timeout expires.
+        """
+        dishes, restaurants = self._lookup(self._cuisine_lookup(city, refresh), timeout)
+        return list(dishes), list(restaurants)
+
+    def _dishes_lookup(self, city: str, refresh: bool = False) -> 'CuisineLookup':
+        return CuisineLookup('dishes', city, self._cache_key(DISHES_TASK_YAML, city), 'dishes_task',
+                             {"city": city}, self._parse_dishes, lambda packed: packed[0],
+                             lambda: self._fallback_dishes(city), refresh)
+
+    def _restaurants_lookup(self, city: str, dishes: List[str], refresh: bool = False) -> 'CuisineLookup':
+        dishes_str = ", ".join(dishes)
+        return CuisineLookup('restaurants', city, self._cache_key(RESTAURANTS_TASK_YAML, city, dishes_str),
+                             'restaurants_task', {"city": city, "dishes": dishes_str}, self._parse_restaurants,
+                             lambda packed: packed[1] if packed[0] == list(dishes) else None,
+                             lambda: self._fallback_restaurants(dishes), refresh,
+                             # Restaurants for placeholder dishes would be made up too
+                             answerable=list(dishes) != placeholder_dishes(city))
+
+    def _cuisine_lookup(self, city: str, refresh: bool = False) -> 'CuisineLookup':
+        def fallback():
+            dishes = self._fallback_dishes(city)
+            return dishes, self._fallback_restaurants(dishes)
+
+        return CuisineLookup('cuisine', city, self._cache_key(CUISINE_TASK_YAML, city), 'cuisine_task',
+                             {"city": city}, self._parse_cuisine, lambda packed: packed, fallback, refresh)
+
+    def _lookup(self, lookup: 'CuisineLookup', timeout: float = None):
+        """The lookup's answer, or its fallback once this caller's timeout expires
+
+        Concurrent callers share one execution, but each waits only as long
+        as its own timeout allows; the execution itself gets
+        completion_timeout.
+        """
+        known = self._known(lookup)
+        if known is not None:
+            return known
+        if not self._budgeted(timeout):
+            return self._shared_fetch(lookup)
+
+        future = self._background.submit(self._shared_fetch, lookup)
+        try:
+            return future.result(timeout=max(0, timeout))
+        except FutureTimeoutError:
+            return self._deadline_fallback(lookup)
+
+    def _shared_fetch(self, lookup: 'CuisineLookup'):
+        return self.flights.do(lookup.kind, lookup.key, self._fetch, lookup)
+
+    def _fetch(self, lookup: 'CuisineLookup', timeout: float = None):
+        """Run the lookup's execution, giving up after timeout (default completion_timeout)
+
+        An unusable fused answer falls back to the two-step lookup within
+        whatever is left of that time.
+        """
+        if timeout is None:
+            timeout = self.completion_timeout
+        expires_at = time.monotonic() + timeout
+        try:
+            value = self._run_task(lookup, timeout)
+        except (TimeoutError, CircuitOpen) as e:
+            return self._unanswered(lookup, e)
+        if value is None and lookup.kind == 'cuisine':
+            self._note_unusable(lookup)
+            dishes = self._fetch_within(self._dishes_lookup(lookup.city, lookup.refresh), expires_at)
+            return dishes, self._fetch_within(self._restaurants_lookup(lookup.city, dishes, lookup.refresh),
+                                              expires_at)
+        return value if value is not None else lookup.fallback()
+
+    def _fetch_within(self, lookup: 'CuisineLookup', expires_at: float):
+        known = self._known(lookup)
+        if known is not None:
+            return list(known)
+        return list(self.flights.do(lookup.kind, lookup.key, self._fetch, lookup, self._remaining(expires_at)))
+
+    def _run_task(self, lookup: 'CuisineLookup', timeout: float = None):
+        """Run the lookup's task and return its parsed, cached answer, or None if it failed
+
+        An execution that outlives timeout raises TimeoutError but keeps
+        running, and its answer is cached when it arrives. With caching off
+        nobody would use that answer, so the execution is cancelled instead.
+        """
+        for attempt in range(2):
+            task_id = getattr(self, lookup.task).id
+            try:
+                result = run_execution(self.poller, task_id, lookup.execution_input,
+                                       task=lookup.kind, timeout=timeout, on_late=self._late_handler(lookup))
+                break
+            except Exception as e:
+                if attempt or not is_not_found(e):
+                    raise
+                # The task or agent was deleted on the server: create them again, once
+                self._forget_resources(task_id)
+        return self._keep(lookup, result)
+
+    # The steps below are shared with AsyncCuisineAgent, which only replaces
+    # the execution itself
+
+    def _known(self, lookup: 'CuisineLookup'):
+        """Answer from the cache or the knowledge pack, or None
+
+        A lookup that is not answerable gets its fallback here.
+        """
+        if not lookup.answerable:
+            return lookup.fallback()
+        cached = self._cache_get(lookup.key, lookup.refresh)
+        if cached is not None:
+            return cached
+        packed = self._pack_get(lookup.city, lookup.refresh)
+        return lookup.from_pack(packed) if packed is not None else None
+
+    def _keep(self, lookup: 'CuisineLookup', result):
+        """Parse a finished execution, caching a usable answer"""
+        value = lookup.parse(result)
+        if value is not None:
+            self._cache_set(lookup.key, value)
+        return value
+
+    def _forget_resources(self, stale_id: str):
+        self.registry.forget_resources(self, stale_id, 'agent', 'dishes_task', 'restaurants_task', 'cuisine_task')
+
+    def _late_handler(self, lookup: 'CuisineLookup') -> Optional[Callable[[Any], Any]]:
+        return (lambda result: self._keep(lookup, result)) if self.cache is not None else None
+
+    def _budgeted(self, timeout: float = None) -> bool:
+        return timeout is not None and timeout < self.completion_timeout
+
+    @staticmethod
+    def _remaining(expires_at: float) -> float:
+        return max(0.0, expires_at - time.monotonic())
+
+    @staticmethod
+    def _deadline_fallback(lookup: 'CuisineLookup'):
+        metrics.inc('deadline_fallback_total', stage=lookup.kind)
+        return lookup.fallback()
+
+    @staticmethod
+    def _unanswered(lookup: 'CuisineLookup', error: Exception):
+        if isinstance(error, TimeoutError):
+            progress(f"Timed out waiting for {lookup.kind} for {lookup.city}. Using placeholders.")
+        return lookup.fallback()
+
+    @staticmethod
+    def _note_unusable(lookup: 'CuisineLookup'):
+        metrics.inc('fallback_total', kind='cuisine')
+        progress(f"Fused cuisine lookup for {lookup.city} was unusable. Using two-step lookup.")
+
+    def _parse_dishes(self, result) -> Optional[List[str]]:
+        if result.status != "succeeded":
+            return None
+        with metrics.span('parse', task='dishes'):
+            output_text = self._output_text(result)
+            dishes = [dish.strip() for dish in output_text.split('\n') if dish.strip()]
+        return dishes[:3]
+
+    def _parse_restaurants(self, result) -> Optional[List[str]]:
+        if result.status != "succeeded":
+            return None
+        with metrics.span('parse', task='restaurants'):
+            output_text = self._output_text(result)
+            return [
+                rest.strip() for rest in output_text.split('\n')
+                if rest.strip() and '-' in rest
+            ]
+
+    def _parse_cuisine(self, result) -> Optional[Tuple[List[str], List[str]]]:
+        if result.status != "succeeded":
+            return None
+        with metrics.span('parse', task='cuisine'):
+            return self._parse_cuisine_json(self._output_text(result))
+
+    @staticmethod
+    def _fallback_dishes(city: str) -> List[str]:
+        metrics.inc('fallback_total', kind='dishes')
+        return placeholder_dishes(city)
+
+    @staticmethod
+    def _fallback_restaurants(dishes: List[str]) -> List[str]:
+        metrics.inc('fallback_total', kind='restaurants')
+        return placeholder_restaurants(dishes)
+
+    @staticmethod
+    def _cache_key(task_yaml: str, city: str, *extra: str) -> str:
+        """Cache key from the normalised city, inputs and agent/task definitions"""
+        definition = definition_hash([AGENT_DEFINITION, task_yaml])[:16]
+        return ":".join([definition, normalize_city(city), *extra])
+
+    def _pack_get(self, city: str, refresh: bool = False) -> Optional[Tuple[List[str], List[str]]]:
+        """(dishes, restaurants) from the knowledge pack, or None"""
+        if self.knowledge_pack is None or refresh:
+            return None
+        return self.knowledge_pack.cuisine(city)
+
+    def _cache_get(self, key: str, refresh: bool = False):
+        if self.cache is None or refresh:
+            return None
+        value = self.cache.get(key)
+        metrics.inc('cache_lookups_total', cache='cuisine', result='miss' if value is None else 'hit')
+        metrics.set_gauge('cache_hit_ratio', self.cache.hit_ratio(), cache='cuisine')
+        return value
+
+    def _cache_set(self, key: str, value):
+        # Empty answers are not worth keeping
+        if self.cache is not None and value:
+            self.cache.set(key, value)
+
+    @staticmethod
+    def _parse_cuisine_json(output_text: str) -> Optional[Tuple[List[str], List[str]]]:
+        """Parse and validate the fused JSON response into (dishes, restaurants)"""
+        start, end = output_text.find('{'), output_text.rfind('}')
+        if start == -1 or end < start:
+            return None
+        try:
+            data = json.loads(output_text[start:end + 1])
+        except ValueError:
+            return None
+
+        entries = data.get('dishes') if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            return None
+
+        dishes, restaurants = [], []
+        for entry in entries[:3]:
+            if not isinstance(entry, dict):
+                return None
+            dish, restaurant = entry.get('dish'), entry.get('restaurant')
+            if not isinstance(dish, str) or not isinstance(restaurant, str):
+                return None
+            if not dish.strip() or not restaurant.strip():
+                return None
+            dishes.append(dish.strip())
+            # Same 'Dish - Restaurant Name' format as find_restaurants
+            restaurants.append(f"{dish.strip()} - {restaurant.strip()}")
+
+        if not dishes:
+            return None
+        return dishes, restaurants
+
+    @staticmethod
+    def _output_text(result) -> str:
+        """Extract the message content from a chat-style execution output"""
+        if isinstance(result.output, dict) and 'choices' in result.output:
+            choices = result.output.get('choices', [])
+            if choices and isinstance(choices, list) and 'message' in choices[0]:
+                return choices[0]['message'].get('content', '')
+        return ""
+
+
+if __name__ == "__main__":
+    cuisine_agent = CuisineAgent()
+    city = "Tokyo"
+    dishes = cuisine_agent.get_local_dishes(city)
+    print(f"Local dishes in {city}:")
+    for dish in dishes:
+        print(f"- {dish}")
+    restaurants = cuisine_agent.find_restaurants(city, dishes)
+    print(f"\nRestaurants in {city}:")
+    for restaurant in restaurants:
+        print(f"- {restaurant}")
+
+"""
+#example code
+if __name__ == "__main__":
+    cuisine_agent = CuisineAgent()
+    city = "Tokyo"
+    dishes = cuisine_agent.get_local_dishes(city)
+    print(f"Local dishes in {city}:")
+    for dish in dishes:
+        print(f"- {dish}")
+    restaurants = cuisine_agent.find_restaurants(city, dishes)
+    print(f"\nRestaurants in {city}:")
+    for restaurant in restaurants:
+        print(f"- {restaurant}")
 """
\ No newline at end of file
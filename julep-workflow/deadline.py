@@ -0,0 +1,38 @@
+# deadline.py - Per-request latency budgets split across tour stages
+
+import time
+from typing import Dict
+
+# Fraction of the whole budget each stage may use. Stages on the same path
+# (dishes -> restaurants -> tour_narrative) add up to the full budget; weather
+# runs alongside the cuisine lookups.
+STAGE_SHARES = {
+    'weather': 0.2,
+    'cuisine': 0.5,
+    'dishes': 0.25,
+    'restaurants': 0.25,
+    'tour_narrative': 0.5,
+}
+
+
+class Deadline:
+    """Latency budget for one request
+
+    Each stage may wait for at most its share of the budget, and never past
+    the overall deadline. A stage that runs out of time returns its fallback.
+    """
+
+    def __init__(self, budget: float, shares: Dict[str, float] = None):
+        self.budget = budget
+        self.shares = shares or STAGE_SHARES
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def timeout_for(self, stage: str) -> float:
+        """Seconds the stage may take, bounded by what is left of the budget"""
+        return min(self.remaining(), self.budget * self.shares.get(stage, 1.0))
@@ -0,0 +1,408 @@
+# executions.py - Shared completion poller for Julep executions
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Tuple
+
+from circuit_breaker import CircuitBreaker, get_breaker
+from metrics import metrics, progress
+from rate_limiter import AdaptiveRateLimiter, get_limiter, is_throttle_error
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+# Statuses of an execution that has not started running yet
+QUEUED_STATUSES = ('queued', 'starting')
+# Error text of executions that failed because a model provider was saturated
+THROTTLE_MARKERS = ('429', 'rate limit', 'rate_limit', 'too many requests', 'overloaded')
+
+
+class _PollerStopped(Exception):
+    """The poll executor takes no new work because it, or the interpreter, is shutting down"""
+
+
+class _PendingExecution:
+    def __init__(self, interval: float, task: str):
+        self.future = Future()
+        self.task = task
+        self.interval = interval
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.next_poll = self.submitted_at + interval
+
+
+class ExecutionPoller:
+    """Track outstanding executions and poll them from a single background thread.
+
+    Each execution is polled with adaptive backoff: quickly at first, then
+    less often the longer it runs. Callers get a future that resolves with
+    the final execution once it reaches a terminal status. Every API call
+    goes through the shared Julep rate limiter; a rate-limited poll is simply
+    retried later instead of failing the execution. Poll outcomes are also
+    reported to the Julep circuit breaker.
+    """
+
+    def __init__(self, client, initial_interval: float = 0.25, max_interval: float = 2.0,
+                 backoff: float = 1.5, poll_workers: int = 4, rate_limiter: AdaptiveRateLimiter = None,
+                 breaker: CircuitBreaker = None):
+        self.client = client
+        self.rate_limiter = rate_limiter or get_limiter('julep')
+        self.breaker = breaker or get_breaker('julep')
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.poll_workers = poll_workers
+
+        self._pending: Dict[str, _PendingExecution] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def submit(self, execution_id: str, task: str = '') -> Future:
+        """Start tracking an execution and return a future for its final state"""
+        with self._lock:
+            pending = self._pending.get(execution_id)
+            if pending is None:
+                pending = _PendingExecution(self.initial_interval, task)
+                self._pending[execution_id] = pending
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="execution-poller", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return pending.future
+
+    def wait(self, execution_id: str, timeout: float = None, task: str = ''):
+        """Block until the execution finishes; raises TimeoutError after timeout seconds"""
+        future = self.submit(execution_id, task)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.discard(execution_id)
+            raise TimeoutError(f"Execution {execution_id} did not finish within {timeout}s")
+
+    def discard(self, execution_id: str):
+        """Stop tracking an execution without resolving its future"""
+        with self._lock:
+            self._pending.pop(execution_id, None)
+
+    def cancel(self, execution_id: str, reason: str = "Result no longer needed"):
+        """Stop tracking an execution and ask Julep to cancel it, without blocking"""
+        self.discard(execution_id)
+        self._get_executor().submit(self._cancel, execution_id, reason)
+
+    def outstanding(self) -> int:
+        """Number of executions currently being tracked"""
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        # Cleared together with the check, so a submit() from now on starts a new thread
+                        self._thread = None
+                        return
+                    now = time.monotonic()
+                    due = [(execution_id, pending) for execution_id, pending in self._pending.items()
+                           if pending.next_poll <= now]
+
+                if due:
+                    try:
+                        self._poll(due)
+                    except _PollerStopped as e:
+                        self._fail_pending(e.__cause__)
+                        return
+                    except Exception as e:
+                        # One bad poll must not stop the thread every waiter depends on
+                        metrics.inc('julep_poll_errors_total')
+                        progress(f"Polling executions failed: {e}")
+                        self._postpone(due)
+
+                with self._lock:
+                    if not self._pending:
+                        continue
+                    next_poll = min(pending.next_poll for pending in self._pending.values())
+                self._wakeup.wait(max(0.0, next_poll - time.monotonic()))
+                self._wakeup.clear()
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _postpone(self, due: List[Tuple[str, _PendingExecution]]):
+        next_poll = time.monotonic() + self.max_interval
+        for _, pending in due:
+            pending.interval = self.max_interval
+            pending.next_poll = next_poll
+
+    def _fail_pending(self, error: BaseException):
+        """Fail every tracked execution's future, so its waiters return instead of hanging"""
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for execution in pending:
+            execution.future.set_exception(error)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.poll_workers,
+                                                    thread_name_prefix="execution-poll")
+            return self._executor
+
+    def _poll(self, due: List[Tuple[str, _PendingExecution]]):
+        try:
+            polls = [self._get_executor().submit(self._get, execution_id) for execution_id, _ in due]
+        except RuntimeError as e:
+            raise _PollerStopped(str(e)) from e
+        outcomes = [poll.result() for poll in polls]
+
+        for (execution_id, pending), (result, error) in zip(due, outcomes):
+            if error is None and pending.started_at is None and result.status not in QUEUED_STATUSES:
+                # Queue time is only as precise as the polling interval
+                pending.started_at = time.monotonic()
+                metrics.observe('julep_queue_seconds', pending.started_at - pending.submitted_at,
+                                task=pending.task)
+
+            if error is not None and is_throttle_error(error):
+                pending.interval = self.max_interval
+                pending.next_poll = time.monotonic() + pending.interval
+                continue
+
+            if error is None and result.status not in TERMINAL_STATUSES:
+                pending.interval = min(pending.interval * self.backoff, self.max_interval)
+                pending.next_poll = time.monotonic() + pending.interval
+                continue
+
+            with self._lock:
+                self._pending.pop(execution_id, None)
+            if error is not None:
+                pending.future.set_exception(error)
+            else:
+                pending.future.set_result(result)
+
+    def _get(self, execution_id: str):
+        self.rate_limiter.acquire()
+        try:
+            result = self.client.executions.get(execution_id)
+        except Exception as e:
+            if is_throttle_error(e):
+                self.rate_limiter.on_throttle()
+            self.breaker.record(e)
+            return None, e
+        self.rate_limiter.on_success()
+        self.breaker.on_success()
+        return result, None
+
+    def _cancel(self, execution_id: str, reason: str):
+        self.rate_limiter.acquire()
+        try:
+            self.client.executions.change_status(execution_id, status='cancelled', reason=reason)
+        except Exception as e:
+            if is_throttle_error(e):
+                self.rate_limiter.on_throttle()
+            progress(f"Could not cancel execution {execution_id}: {e}")
+
+
+def is_throttled_execution(result) -> bool:
+    """Whether a failed execution failed because its model call was rate limited"""
+    error = str(getattr(result, 'error', None) or '').lower()
+    return result.status == 'failed' and any(marker in error for marker in THROTTLE_MARKERS)
+
+
+def _create_execution(poller: ExecutionPoller, task_id: str, execution_input: Dict[str, Any],
+                      task: str, max_throttle_retries: int):
+    limiter = poller.rate_limiter
+    for attempt in range(max_throttle_retries + 1):
+        limiter.acquire()
+        try:
+            with poller.breaker.guard(), metrics.span('julep_create', task=task):
+                execution = poller.client.executions.create(task_id=task_id, input=execution_input)
+        except Exception as e:
+            if not is_throttle_error(e) or attempt == max_throttle_retries:
+                raise
+            limiter.on_throttle()
+            continue
+        limiter.on_success()
+        return execution
+
+
+def _abandon(poller: ExecutionPoller, execution_id: str, future: Future, task: str,
+             on_late: Callable[[Any], None] = None):
+    """Hand a timed-out execution to on_late when it finishes, or cancel it"""
+    if on_late is None:
+        metrics.inc('julep_abandoned_total', task=task, action='cancelled')
+        poller.cancel(execution_id)
+        return
+
+    def finish(done: Future):
+        if done.exception() is None:
+            on_late(done.result())
+
+    metrics.inc('julep_abandoned_total', task=task, action='background')
+    future.add_done_callback(finish)
+
+
+def run_execution(poller: ExecutionPoller, task_id: str, execution_input: Dict[str, Any],
+                  task: str, timeout: float = None, max_throttle_retries: int = 3,
+                  on_late: Callable[[Any], None] = None):
+    """Create an execution and wait for it to finish
+
+    Records the create call and the wait as separate spans, plus a counter of
+    final statuses. Raises CircuitOpen without creating anything while the
+    Julep circuit breaker is open. Rate-limited creates, and executions that failed on a
+    rate-limited model call, are retried up to max_throttle_retries times at
+    the limiter's reduced rate.
+
+    Raises TimeoutError if the execution outlives timeout. The execution then
+    keeps running and is passed to on_late when it finishes, so its result
+    can still be cached; without on_late nobody needs it and it is cancelled.
+    """
+    expires_at = None if timeout is None else time.monotonic() + timeout
+    for attempt in range(max_throttle_retries + 1):
+        execution = _create_execution(poller, task_id, execution_input, task, max_throttle_retries)
+        future = poller.submit(execution.id, task)
+
+        try:
+            with metrics.span('julep_poll', task=task):
+                remaining = None if expires_at is None else max(0.0, expires_at - time.monotonic())
+                result = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            metrics.inc('julep_executions_total', task=task, status='timeout')
+            _abandon(poller, execution.id, future, task, on_late)
+            raise TimeoutError(f"Execution {execution.id} did not finish within {timeout}s")
+
+        if not is_throttled_execution(result) or attempt == max_throttle_retries:
+            break
+        metrics.inc('julep_executions_total', task=task, status='throttled')
+        poller.rate_limiter.on_throttle()
+
+    metrics.inc('julep_executions_total', task=task, status=result.status)
+    return result
+
+
+# Background tasks started by the async API; referenced here so they are not
+# garbage collected before they finish
+_background_tasks = set()
+
+
+def run_in_background(coroutine) -> asyncio.Future:
+    task = asyncio.ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _create_execution_async(client, limiter: AdaptiveRateLimiter, breaker: CircuitBreaker, task_id: str,
+                                  execution_input: Dict[str, Any], task: str, max_throttle_retries: int):
+    for attempt in range(max_throttle_retries + 1):
+        await limiter.acquire_async()
+        try:
+            with breaker.guard(), metrics.span('julep_create', task=task):
+                execution = await client.executions.create(task_id=task_id, input=execution_input)
+        except Exception as e:
+            if not is_throttle_error(e) or attempt == max_throttle_retries:
+                raise
+            limiter.on_throttle()
+            continue
+        limiter.on_success()
+        return execution
+
+
+async def _poll_async(client, limiter: AdaptiveRateLimiter, breaker: CircuitBreaker, execution_id: str, task: str,
+                      initial_interval: float = 0.25, max_interval: float = 2.0, backoff: float = 1.5):
+    """Poll one execution with the same adaptive backoff as ExecutionPoller"""
+    interval = initial_interval
+    submitted_at = time.monotonic()
+    started = False
+    while True:
+        await asyncio.sleep(interval)
+        await limiter.acquire_async()
+        try:
+            result = await client.executions.get(execution_id)
+        except Exception as e:
+            breaker.record(e)
+            if not is_throttle_error(e):
+                raise
+            limiter.on_throttle()
+            interval = max_interval
+            continue
+        limiter.on_success()
+        breaker.on_success()
+
+        if not started and result.status not in QUEUED_STATUSES:
+            started = True
+            metrics.observe('julep_queue_seconds', time.monotonic() - submitted_at, task=task)
+        if result.status in TERMINAL_STATUSES:
+            return result
+        interval = min(interval * backoff, max_interval)
+
+
+async def _cancel_async(client, limiter: AdaptiveRateLimiter, execution_id: str,
+                        reason: str = "Result no longer needed"):
+    await limiter.acquire_async()
+    try:
+        await client.executions.change_status(execution_id, status='cancelled', reason=reason)
+    except Exception as e:
+        if is_throttle_error(e):
+            limiter.on_throttle()
+        progress(f"Could not cancel execution {execution_id}: {e}")
+
+
+def _abandon_async(client, limiter: AdaptiveRateLimiter, execution_id: str, poll: asyncio.Future,
+                   task: str, on_late: Callable[[Any], None] = None):
+    """_abandon for the async API: keep polling for on_late, or cancel"""
+    if on_late is None:
+        metrics.inc('julep_abandoned_total', task=task, action='cancelled')
+        poll.cancel()
+        run_in_background(_cancel_async(client, limiter, execution_id))
+        return
+
+    def finish(done: asyncio.Future):
+        _background_tasks.discard(done)
+        if not done.cancelled() and done.exception() is None:
+            on_late(done.result())
+
+    metrics.inc('julep_abandoned_total', task=task, action='background')
+    _background_tasks.add(poll)
+    poll.add_done_callback(finish)
+
+
+async def run_execution_async(client, task_id: str, execution_input: Dict[str, Any], task: str,
+                              timeout: float = None, max_throttle_retries: int = 3,
+                              on_late: Callable[[Any], None] = None, limiter: AdaptiveRateLimiter = None,
+                              breaker: CircuitBreaker = None):
+    """run_execution for an AsyncJulep client, polling on the event loop
+
+    Same spans, counters, throttle retries and timeout handling as
+    run_execution: a timed-out execution keeps being polled in the
+    background and is passed to on_late, or is cancelled without on_late.
+    """
+    limiter = limiter or get_limiter('julep')
+    breaker = breaker or get_breaker('julep')
+    expires_at = None if timeout is None else time.monotonic() + timeout
+    for attempt in range(max_throttle_retries + 1):
+        execution = await _create_execution_async(client, limiter, breaker, task_id, execution_input, task,
+                                                  max_throttle_retries)
+        poll = asyncio.ensure_future(_poll_async(client, limiter, breaker, execution.id, task))
+
+        try:
+            with metrics.span('julep_poll', task=task):
+                remaining = None if expires_at is None else max(0.0, expires_at - time.monotonic())
+                result = await asyncio.wait_for(asyncio.shield(poll), remaining)
+        except asyncio.TimeoutError:
+            metrics.inc('julep_executions_total', task=task, status='timeout')
+            _abandon_async(client, limiter, execution.id, poll, task, on_late)
+            raise TimeoutError(f"Execution {execution.id} did not finish within {timeout}s")
+        except asyncio.CancelledError:
+            poll.cancel()
+            raise
+
+        if not is_throttled_execution(result) or attempt == max_throttle_retries:
+            break
+        metrics.inc('julep_executions_total', task=task, status='throttled')
+        limiter.on_throttle()
+
+    metrics.inc('julep_executions_total', task=task, status=result.status)
+    return result
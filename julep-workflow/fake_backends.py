@@ -0,0 +1,339 @@
+# fake_backends.py - Offline stand-ins for Julep and Open-Meteo
+
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict
+from urllib.parse import parse_qs, urlparse
+
+
+class LatencyModel:
+    """Latency distribution in seconds
+
+    kind is 'fixed' (always median), 'uniform' (0 to 2 x median) or
+    'lognormal' (median with multiplicative spread sigma).
+    """
+
+    def __init__(self, median: float = 0.0, kind: str = 'lognormal', sigma: float = 0.5, seed: int = None):
+        if kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.median = median
+        self.kind = kind
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        with self._lock:
+            if self.kind == 'fixed':
+                return self.median
+            if self.kind == 'uniform':
+                return self._random.uniform(0, 2 * self.median)
+            return self._random.lognormvariate(0, self.sigma) * self.median
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+
+def _fake_dishes(city: str):
+    return [f"{city} Dumplings", f"{city} Stew", f"{city} Pastry"]
+
+
+class _FakeAgents:
+    def __init__(self, backend: 'FakeJulep'):
+        self._backend = backend
+
+    def create(self, **definition):
+        self._backend.api_latency.sleep()
+        return SimpleNamespace(id=self._backend.new_id('agent'), **definition)
+
+
+class FakeNotFound(Exception):
+    """Raised like the Julep SDK's NotFoundError for IDs the backend does not have"""
+    status_code = 404
+
+
+class _FakeTasks:
+    def __init__(self, backend: 'FakeJulep'):
+        self._backend = backend
+
+    def create(self, agent_id: str, **definition):
+        self._backend.api_latency.sleep()
+        task_id = self._backend.new_id('task')
+        with self._backend.lock:
+            self._backend.task_definitions[task_id] = definition
+        return SimpleNamespace(id=task_id, agent_id=agent_id, **definition)
+
+
+class _FakeExecutions:
+    def __init__(self, backend: 'FakeJulep'):
+        self._backend = backend
+
+    def create(self, task_id: str, input: Dict[str, Any]):
+        self._backend.api_latency.sleep()
+        return self._create(task_id, input)
+
+    def get(self, execution_id: str):
+        self._backend.api_latency.sleep()
+        return self._get(execution_id)
+
+    def change_status(self, execution_id: str, status: str, reason: str = None):
+        self._backend.api_latency.sleep()
+        return self._change_status(execution_id, status)
+
+    def _create(self, task_id: str, input: Dict[str, Any]):
+        backend = self._backend
+        with backend.lock:
+            task = backend.task_definitions.get(task_id)
+            backend.calls['executions.create'] += 1
+        if task is None:
+            raise FakeNotFound(f"Unknown task: {task_id}")
+
+        execution_id = backend.new_id('execution')
+        failed = backend.random() < backend.failure_rate
+        with backend.lock:
+            backend.execution_state[execution_id] = {
+                'task': task,
+                'input': input,
+                'ready_at': time.monotonic() + backend.execution_latency.sample(),
+                'failed': failed,
+                'cancelled': False
+            }
+        return SimpleNamespace(id=execution_id, status='queued')
+
+    def _get(self, execution_id: str):
+        backend = self._backend
+        with backend.lock:
+            execution = backend.execution_state[execution_id]
+            backend.calls['executions.get'] += 1
+
+        if execution['cancelled']:
+            return SimpleNamespace(id=execution_id, status='cancelled', output=None)
+        if time.monotonic() < execution['ready_at']:
+            return SimpleNamespace(id=execution_id, status='running', output=None)
+        if execution['failed']:
+            return SimpleNamespace(id=execution_id, status='failed', output=None)
+
+        content = backend.respond(execution['task'].get('name', ''), execution['input'])
+        return SimpleNamespace(
+            id=execution_id,
+            status='succeeded',
+            output={'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+        )
+
+    def _change_status(self, execution_id: str, status: str):
+        backend = self._backend
+        with backend.lock:
+            backend.calls['executions.change_status'] += 1
+            if status == 'cancelled':
+                backend.execution_state[execution_id]['cancelled'] = True
+        return SimpleNamespace(id=execution_id, status=status)
+
+
+class _AsyncFakeExecutions:
+    def __init__(self, executions: _FakeExecutions, api_latency: LatencyModel):
+        self._executions = executions
+        self._api_latency = api_latency
+
+    async def _sleep(self):
+        delay = self._api_latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def create(self, task_id: str, input: Dict[str, Any]):
+        await self._sleep()
+        return self._executions._create(task_id, input)
+
+    async def get(self, execution_id: str):
+        await self._sleep()
+        return self._executions._get(execution_id)
+
+    async def change_status(self, execution_id: str, status: str, reason: str = None):
+        await self._sleep()
+        return self._executions._change_status(execution_id, status)
+
+
+class AsyncFakeJulep:
+    """AsyncJulep view of a FakeJulep
+
+    Executions are shared with the FakeJulep they were created from, so
+    tasks registered through the blocking client can be executed here.
+    """
+
+    def __init__(self, backend: 'FakeJulep'):
+        self.backend = backend
+        self.executions = _AsyncFakeExecutions(backend.executions, backend.api_latency)
+
+    async def close(self):
+        pass
+
+
+class FakeJulep:
+    """In-memory stand-in for the Julep client used by the workflow
+
+    Implements agents.create, tasks.create, executions.create,
+    executions.get and executions.change_status. Executions finish after a delay drawn from
+    execution_latency and fail with probability failure_rate. Every API call
+    itself takes a delay drawn from api_latency.
+    as_async() returns an AsyncJulep-style view of the same backend.
+    """
+
+    def __init__(self, execution_latency: LatencyModel = None, api_latency: LatencyModel = None,
+                 failure_rate: float = 0.0, seed: int = None):
+        self.execution_latency = execution_latency or LatencyModel(0.5, seed=seed)
+        self.api_latency = api_latency or LatencyModel(0.0)
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.task_definitions: Dict[str, Dict[str, Any]] = {}
+        self.execution_state: Dict[str, Dict[str, Any]] = {}
+        self.calls = {'executions.create': 0, 'executions.get': 0, 'executions.change_status': 0}
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+
+        self.agents = _FakeAgents(self)
+        self.tasks = _FakeTasks(self)
+        self.executions = _FakeExecutions(self)
+
+    def as_async(self) -> AsyncFakeJulep:
+        return AsyncFakeJulep(self)
+
+    def new_id(self, prefix: str) -> str:
+        with self.lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def random(self) -> float:
+        with self.lock:
+            return self._random.random()
+
+    def respond(self, task_name: str, execution_input: Dict[str, Any]) -> str:
+        """Plausible model output for one of the workflow's tasks"""
+        if task_name == 'Get Local Dishes':
+            return "\n".join(_fake_dishes(execution_input['city']))
+
+        if task_name == 'Find Restaurants':
+            city = execution_input['city']
+            dishes = [dish.strip() for dish in execution_input['dishes'].split(',') if dish.strip()]
+            return "\n".join(f"{dish} - {city} Kitchen No. {i + 1}" for i, dish in enumerate(dishes))
+
+        if task_name == 'Get Dishes And Restaurants':
+            city = execution_input['city']
+            return json.dumps({'dishes': [
+                {'dish': dish, 'restaurant': f"{city} Kitchen No. {i + 1}"}
+                for i, dish in enumerate(_fake_dishes(city))
+            ]})
+
+        message = execution_input.get('user_message', '')
+        match = re.search(r'^CITY: (.+)$', message, re.MULTILINE)
+        city = match.group(1).strip() if match else 'the city'
+        return (f"## Breakfast\nStart the day in {city} with pastries.\n\n"
+                f"## Lunch\nA long lunch in {city}.\n\n"
+                f"## Dinner\nEnd the day in {city} with the local speciality.")
+
+
+class OpenMeteoStub:
+    """Local HTTP server answering Open-Meteo geocoding and forecast requests
+
+    Coordinates and weather are derived from the city name, so runs are
+    reproducible. Each request is delayed by latency and fails with a 503
+    with probability failure_rate.
+    """
+
+    def __init__(self, latency: LatencyModel = None, failure_rate: float = 0.0, seed: int = None):
+        self.latency = latency or LatencyModel(0.0)
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def geocoding_url(self) -> str:
+        return f"{self._base_url()}/v1/search"
+
+    @property
+    def weather_url(self) -> str:
+        return f"{self._base_url()}/v1/forecast"
+
+    def start(self) -> 'OpenMeteoStub':
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, body = stub._handle(self.path)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="open-meteo-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'OpenMeteoStub':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _base_url(self) -> str:
+        if self._server is None:
+            raise RuntimeError("OpenMeteoStub is not running")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handle(self, path: str):
+        self.latency.sleep()
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.failure_rate
+        if failed:
+            return 503, {'error': True, 'reason': 'stub failure'}
+
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        if url.path == '/v1/search':
+            seed = int(hashlib.sha256(query['name'][0].encode('utf-8')).hexdigest()[:8], 16)
+            return 200, {'results': [{
+                'latitude': round((seed % 12000) / 100 - 60, 4),
+                'longitude': round((seed // 12000 % 36000) / 100 - 180, 4)
+            }]}
+
+        if url.path == '/v1/forecast':
+            locations = zip(query['latitude'][0].split(','), query['longitude'][0].split(','))
+            forecasts = [{
+                'latitude': float(lat),
+                'longitude': float(lon),
+                'current': {
+                    'temperature_2m': round(25 - abs(float(lat)) / 3, 1),
+                    'relative_humidity_2m': 40 + int(abs(float(lon))) % 50,
+                    'weather_code': (0, 1, 2, 3, 61)[int(abs(float(lat) + float(lon))) % 5]
+                }
+            } for lat, lon in locations]
+            return 200, forecasts[0] if len(forecasts) == 1 else forecasts
+
+        return 404, {'error': True, 'reason': 'not found'}
@@ -0,0 +1,126 @@
+# geocode_cache.py - Persistent city -> coordinates store
+
+import argparse
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+from cache import LRUCache, normalize_city
+from storage import cache_path
+
+Coordinates = Tuple[float, float]
+
+
+class GeocodeCache:
+    """SQLite-backed city coordinates with an in-memory LRU in front.
+
+    City names are normalised before lookup, so case, extra whitespace and
+    diacritics all map to the same entry.
+    """
+
+    def __init__(self, path: str = None, memory_size: int = 1024):
+        self.path = path or cache_path('geocode.sqlite3')
+        self._memory = LRUCache(memory_size)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS coordinates ("
+                "city TEXT PRIMARY KEY, latitude REAL NOT NULL, "
+                "longitude REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, city: str) -> Optional[Coordinates]:
+        """Cached coordinates for a city, or None"""
+        key = normalize_city(city)
+        coordinates = self._memory.get(key)
+        if coordinates is not None:
+            self._count('memory_hits')
+            return coordinates
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude FROM coordinates WHERE city = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+
+        self._count('disk_hits')
+        coordinates = (row[0], row[1])
+        self._memory.set(key, coordinates)
+        return coordinates
+
+    def set(self, city: str, latitude: float, longitude: float):
+        """Store coordinates for a city"""
+        key = normalize_city(city)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO coordinates (city, latitude, longitude, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, latitude, longitude, time.time())
+            )
+        self._memory.set(key, (latitude, longitude))
+
+    def preload(self, cities: Iterable[str],
+                resolve: Callable[[str], Tuple[Optional[float], Optional[float]]]) -> int:
+        """Resolve and store every city that is not cached yet; returns how many were added"""
+        added = 0
+        for city in cities:
+            if not city.strip() or self.get(city) is not None:
+                continue
+            lat, lon = resolve(city)
+            if lat is not None and lon is not None:
+                self.set(city, lat, lon)
+                added += 1
+        return added
+
+    def stats(self) -> dict:
+        """Entry count, plus this process's hit/miss counters for the memory and disk tiers"""
+        with self._stats_lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        lookups = memory_hits + disk_hits + misses
+        return {
+            'entries': len(self),
+            'memory_hits': memory_hits,
+            'disk_hits': disk_hits,
+            'misses': misses,
+            'hit_ratio': (memory_hits + disk_hits) / lookups if lookups else 0.0
+        }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM coordinates").fetchone()[0]
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local geocoding cache")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    preload_parser = subcommands.add_parser('preload', help="Geocode and store a list of cities")
+    preload_parser.add_argument('cities', nargs='*', help="City names")
+    preload_parser.add_argument('--file', help="Text file with one city per line")
+    subcommands.add_parser('stats', help="Show how many cities are cached")
+    args = parser.parse_args()
+
+    geocode_cache = GeocodeCache()
+    if args.command == 'preload':
+        from weather_service import WeatherService
+
+        weather_service = WeatherService(geocode_cache=geocode_cache)
+        cities = list(args.cities)
+        if args.file:
+            with open(args.file, encoding='utf-8') as f:
+                cities.extend(line.strip() for line in f if line.strip())
+        added = weather_service.preload_coordinates(cities)
+        print(f"Preloaded {added} new cities ({len(cities)} requested)")
+    # Hit/miss counters only cover this process, so only persistent data is shown
+    print(f"{len(geocode_cache)} cities cached in {geocode_cache.path}")
@@ -0,0 +1,218 @@
+# knowledge_pack.py - Read-only pack of precomputed city coordinates, dishes and restaurants
+
+import argparse
+import json
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from cache import normalize_city
+from metrics import metrics, progress
+from storage import cache_path
+
+if TYPE_CHECKING:
+    from cuisine_agent import CuisineAgent
+    from weather_service import WeatherService
+
+# Bumped whenever the schema changes; packs in another format are ignored
+PACK_FORMAT = 1
+
+
+def default_pack_path() -> str:
+    """FOODIE_KNOWLEDGE_PACK, or knowledge_pack.sqlite3 in the cache directory"""
+    return os.getenv('FOODIE_KNOWLEDGE_PACK') or cache_path('knowledge_pack.sqlite3')
+
+
+class KnowledgePack:
+    """Precomputed coordinates, dishes and restaurants for well-known cities
+
+    The pack is a SQLite file written by build_pack and only ever opened
+    read-only, on the first lookup. A missing or incompatible file behaves
+    like an empty pack, so every city falls through to the live lookups.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or default_pack_path()
+        self._conn = None
+        self._opened = False
+        self._meta: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def coordinates(self, city: str) -> Optional[Tuple[float, float]]:
+        row = self._lookup('coordinates', "SELECT latitude, longitude FROM cities WHERE city = ?", city)
+        return (row[0], row[1]) if row is not None else None
+
+    def cuisine(self, city: str) -> Optional[Tuple[List[str], List[str]]]:
+        """(dishes, restaurants) for a city, or None"""
+        row = self._lookup('cuisine', "SELECT dishes, restaurants FROM cities "
+                                      "WHERE city = ? AND dishes IS NOT NULL", city)
+        return (json.loads(row[0]), json.loads(row[1])) if row is not None else None
+
+    def info(self) -> Dict[str, Any]:
+        """Format, version and size of the pack, or {} when there is none"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            cities = conn.execute("SELECT COUNT(*) FROM cities").fetchone()[0]
+        return dict(self._meta, path=self.path, cities=cities)
+
+    def _lookup(self, kind: str, query: str, city: str):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(query, (normalize_city(city),)).fetchone() if conn is not None else None
+        metrics.inc('knowledge_pack_lookups_total', kind=kind, result='miss' if row is None else 'hit')
+        return row
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._opened:
+            return self._conn
+        self._opened = True
+        if not os.path.exists(self.path):
+            return None
+
+        uri = f"{pathlib.Path(self.path).absolute().as_uri()}?mode=ro"
+        try:
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        except sqlite3.Error as e:
+            progress(f"Ignoring knowledge pack {self.path}: {e}")
+            return None
+        if meta.get('format') != str(PACK_FORMAT):
+            progress(f"Ignoring knowledge pack {self.path}: format {meta.get('format')}, expected {PACK_FORMAT}")
+            conn.close()
+            return None
+
+        self._conn, self._meta = conn, meta
+        return conn
+
+
+_default_pack = None
+_default_lock = threading.Lock()
+
+
+def default_pack() -> KnowledgePack:
+    """Process-wide pack at default_pack_path()"""
+    global _default_pack
+    with _default_lock:
+        if _default_pack is None:
+            _default_pack = KnowledgePack()
+        return _default_pack
+
+
+def build_pack(path: str, cities: Iterable[str], weather_service: 'WeatherService',
+               cuisine_agent: 'CuisineAgent', version: str = None, fused: bool = False,
+               concurrency: int = 8) -> Dict[str, Any]:
+    """Look up every city live and write the results to a new pack at path
+
+    Cities that cannot be geocoded are left out, and cities whose cuisine
+    lookup only produced placeholders get coordinates only. The pack is
+    written to a temporary file and moved into place, so processes that
+    already have the old pack open keep reading a consistent file.
+    """
+    from cuisine_agent import placeholder_dishes, placeholder_restaurants
+
+    cities = list(dict.fromkeys(city.strip() for city in cities if city.strip()))
+
+    def resolve(city: str):
+        lat, lon = weather_service._get_coordinates(city)
+        if lat is None or lon is None:
+            return None
+        if fused:
+            dishes, restaurants = cuisine_agent.get_dishes_and_restaurants(city)
+        else:
+            dishes = cuisine_agent.get_local_dishes(city)
+            restaurants = cuisine_agent.find_restaurants(city, dishes)
+        if (dishes == placeholder_dishes(city) or not restaurants
+                or restaurants == placeholder_restaurants(dishes)):
+            dishes = restaurants = None
+        return city, lat, lon, dishes, restaurants
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        rows = [row for row in executor.map(resolve, cities) if row is not None]
+
+    meta = {
+        'format': str(PACK_FORMAT),
+        'version': version or time.strftime('%Y%m%d%H%M%S', time.gmtime()),
+        'built_at': str(time.time())
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE cities (city TEXT PRIMARY KEY, name TEXT NOT NULL, latitude REAL NOT NULL, "
+                "longitude REAL NOT NULL, dishes TEXT, restaurants TEXT) WITHOUT ROWID"
+            )
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+            conn.executemany(
+                "INSERT OR REPLACE INTO cities (city, name, latitude, longitude, dishes, restaurants) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(normalize_city(city), city, lat, lon,
+                  json.dumps(dishes, ensure_ascii=False) if dishes is not None else None,
+                  json.dumps(restaurants, ensure_ascii=False) if restaurants is not None else None)
+                 for city, lat, lon, dishes, restaurants in rows]
+            )
+        conn.execute("VACUUM")
+        conn.close()
+        # mkstemp files are private to the owner; the pack is meant to be shared
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return dict(meta, path=path, requested=len(cities), cities=len(rows),
+                with_cuisine=sum(1 for row in rows if row[3] is not None))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect the city knowledge pack")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build_parser = subcommands.add_parser('build', help="Look up a list of cities and write a new pack")
+    build_parser.add_argument('cities', nargs='*', help="City names")
+    build_parser.add_argument('--file', help="Text file with one city per line")
+    build_parser.add_argument('--version', help="Version label stored in the pack (default: build time)")
+    build_parser.add_argument('--concurrency', type=int, default=8, help="Cities looked up at once")
+    build_parser.add_argument('--fused', action='store_true', help="Use the fused dishes+restaurants task")
+    info_parser = subcommands.add_parser('info', help="Show the pack's version and size")
+    lookup_parser = subcommands.add_parser('lookup', help="Show what the pack holds for cities")
+    lookup_parser.add_argument('cities', nargs='+', help="City names")
+    for subparser in (build_parser, info_parser, lookup_parser):
+        subparser.add_argument('--pack', help="Pack file (default: FOODIE_KNOWLEDGE_PACK or the cache directory)")
+    args = parser.parse_args()
+
+    pack_path = args.pack or default_pack_path()
+    if args.command == 'build':
+        import cuisine_agent
+        import weather_service
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        cities = list(args.cities)
+        if args.file:
+            with open(args.file, encoding='utf-8') as f:
+                cities.extend(line.strip() for line in f if line.strip())
+        # Always the live path, so a rebuild never copies the pack it replaces
+        summary = build_pack(pack_path, cities,
+                             weather_service.WeatherService(pool_size=args.concurrency, use_knowledge_pack=False),
+                             cuisine_agent.CuisineAgent(use_knowledge_pack=False),
+                             args.version, args.fused, args.concurrency)
+        print(f"Wrote {summary['cities']} cities ({summary['with_cuisine']} with dishes and restaurants, "
+              f"{summary['requested']} requested) to {pack_path}, version {summary['version']}")
+    elif args.command == 'info':
+        print(KnowledgePack(pack_path).info() or f"No usable knowledge pack at {pack_path}")
+    else:
+        pack = KnowledgePack(pack_path)
+        for city in args.cities:
+            print(f"{city}: coordinates={pack.coordinates(city)} cuisine={pack.cuisine(city)}")
@@ -0,0 +1,40 @@
+# lazy.py - Deferred imports and construction of expensive objects
+
+import os
+import threading
+
+
+class lazy_property:
+    """Attribute computed on first access, once per instance even across threads
+
+    The value is stored in the instance dict, so later reads bypass the
+    descriptor entirely, and assigning the attribute (for example from a
+    constructor argument) skips the computation.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        # Re-entrant, because one lazy attribute may depend on another
+        lock = instance.__dict__.setdefault('_lazy_lock', threading.RLock())
+        with lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.func(instance)
+            return instance.__dict__[self.name]
+
+
+def create_julep_client():
+    """Julep client for JULEP_API_KEY; the SDK is imported on first use"""
+    from julep import Julep
+    return Julep(api_key=os.getenv('JULEP_API_KEY'))
+
+
+def create_async_julep_client():
+    """AsyncJulep client for JULEP_API_KEY"""
+    from julep import AsyncJulep
+    return AsyncJulep(api_key=os.getenv('JULEP_API_KEY'))
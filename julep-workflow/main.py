@@ -1,98 +1,420 @@
-# main.py - Fixed version
-
-import os
-from dotenv import load_dotenv
-from weather_service import WeatherService
-from cuisine_agent import CuisineAgent
-from tour_planner import TourPlanner
-from typing import Dict, List, Any
-
-
-class FoodieTourWorkflow:
-    def __init__(self):
-        load_dotenv()
-        self.weather_service = WeatherService()
-        self.cuisine_agent = CuisineAgent()
-        self.tour_planner = TourPlanner()
-
-    def create_foodie_tour(self, city: str, dining_preference: str = "Weather-based (Auto)",
-                           dietary_restrictions: List[str] = None) -> Dict[str, Any]:
-        """Create a complete foodie tour for a city"""
-        print(f"\n🍽️  Creating foodie tour for {city}...")
-
-        if dietary_restrictions is None:
-            dietary_restrictions = ["None"]
-
-        # 1. Get weather and dining suggestion
-        print("☀️  Checking weather...")
-        weather_data = self.weather_service.get_weather(city)
-
-        # Determine dining type based on preference
-        if dining_preference == "Weather-based (Auto)":
-            dining_type = self.weather_service.suggest_dining_type(weather_data)
-        else:
-            dining_type = dining_preference.lower()
-
-        print(f"Weather: {weather_data['description']} ({weather_data['temperature']}°C)")
-        print(f"Dining preference: {dining_type}")
-
-        # 2. Get local dishes
-        print("🥘  Finding iconic local dishes...")
-        dishes = self.cuisine_agent.get_local_dishes(city)
-        print(f"Local dishes: {', '.join(dishes)}")
-
-        # 3. Find restaurants
-        print("🏪  Finding top-rated restaurants...")
-        restaurants = self.cuisine_agent.find_restaurants(city, dishes)
-        print(f"Restaurants found: {len(restaurants)}")
-
-        # 4. Create tour narrative
-        print("📝  Creating tour narrative...")
-        tour_narrative = self.tour_planner.create_tour(
-            city, weather_data, dining_type, restaurants, dietary_restrictions
-        )
-
-        return {
-            'city': city,
-            'weather': weather_data,
-            'dining_type': dining_type,
-            'dishes': dishes,
-            'restaurants': restaurants,
-            'tour_narrative': tour_narrative,
-            'dietary_restrictions': dietary_restrictions
-        }
-
-    def run_workflow(self, cities: List[str], dining_preference: str = "Weather-based (Auto)",
-                     dietary_restrictions: List[str] = None):
-        """Run the complete workflow for multiple cities"""
-        print("🚀 Starting Foodie Tour Workflow")
-        print("=" * 50)
-
-        results = []
-        for city in cities:
-            try:
-                result = self.create_foodie_tour(city, dining_preference, dietary_restrictions)
-                results.append(result)
-
-                # Display results
-                print(f"\n📍 FOODIE TOUR FOR {city.upper()}")
-                print("-" * 30)
-                print(result['tour_narrative'])
-                print("\n" + "=" * 50)
-
-            except Exception as e:
-                print(f"❌ Error processing {city}: {e}")
-
-        return results
-
-
-# Example usage and main execution
-if __name__ == "__main__":
-    # List of cities to create foodie tours for
-    cities = ["Paris", "Tokyo", "New York"]
-
-    # Create and run workflow
-    workflow = FoodieTourWorkflow()
-    results = workflow.run_workflow(cities)
-
+# main.py - Fixed version
+
+import inspect
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from deadline import Deadline
+from executions import ExecutionPoller
+from lazy import create_julep_client, lazy_property
+from metrics import ProgressSink, metrics, progress
+from stage_scheduler import Stage, StageScheduler
+from weather_service import WeatherService
+from cuisine_agent import CuisineAgent
+from tour_planner import TourPlanner
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Any, Tuple, Union
+
+if TYPE_CHECKING:
+    from julep import Julep
+
+
+def _then(value, func: Callable[[Any], Any]):
+    """func(value), or a coroutine applying it once value is awaited when value is awaitable
+
+    Lets one stage graph drive both the blocking services and the async ones.
+    """
+    if inspect.isawaitable(value):
+        async def chain():
+            return func(await value)
+        return chain()
+    return func(value)
+
+
+class TourError:
+    """Result for a city whose tour could not be created"""
+
+    def __init__(self, city: str, error: Exception):
+        self.city = city
+        self.error = error
+        self.error_type = type(error).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'city': self.city, 'error': str(self.error), 'error_type': self.error_type}
+
+    def __repr__(self) -> str:
+        return f"TourError(city={self.city!r}, error={self.error_type}: {self.error})"
+
+
+# (key, city, dining_preference, dietary_restrictions)
+TourJob = Tuple[Any, str, str, List[str]]
+
+# (dining_preference, dietary_restrictions)
+TourVariant = Tuple[str, List[str]]
+
+
+class FoodieTourWorkflow:
+    def __init__(self, max_concurrency: int = 4, fused_cuisine: bool = False,
+                 client: 'Julep' = None, weather_service: WeatherService = None,
+                 use_cache: bool = True, latency_budget: float = None, use_knowledge_pack: bool = True):
+        load_dotenv()
+        # Upper bound on cities processed at once by run_workflow
+        self.max_concurrency = max(1, max_concurrency)
+        # Fetch dishes and restaurants with a single Julep execution
+        self.fused_cuisine = fused_cuisine
+        # Default seconds allowed per tour before stages fall back (None: no limit)
+        self.latency_budget = latency_budget
+        self.weather_service = weather_service or WeatherService(pool_size=self.max_concurrency,
+                                                                 use_knowledge_pack=use_knowledge_pack)
+
+        self.use_cache = use_cache
+        self.use_knowledge_pack = use_knowledge_pack
+        # The Julep client and the agents are created on first use, so
+        # constructing a workflow costs no imports or remote calls
+        if client is not None:
+            self.client = client
+
+    @lazy_property
+    def client(self) -> 'Julep':
+        return create_julep_client()
+
+    @lazy_property
+    def poller(self) -> ExecutionPoller:
+        # One client and one poller shared by every agent, so all in-flight
+        # executions are tracked by a single poll loop
+        return ExecutionPoller(self.client)
+
+    @lazy_property
+    def cuisine_agent(self) -> CuisineAgent:
+        return CuisineAgent(client=self.client, poller=self.poller, use_cache=self.use_cache,
+                            use_knowledge_pack=self.use_knowledge_pack)
+
+    @lazy_property
+    def tour_planner(self) -> TourPlanner:
+        return TourPlanner(client=self.client, poller=self.poller, use_cache=self.use_cache)
+
+    def create_foodie_tour(self, city: str, dining_preference: str = "Weather-based (Auto)",
+                           dietary_restrictions: List[str] = None, latency_budget: float = None) -> Dict[str, Any]:
+        """Create a complete foodie tour for a city
+
+        With a latency budget (seconds, defaulting to the workflow's), a stage
+        that overruns its share returns its fallback immediately; the real
+        lookup finishes in the background and fills the cache.
+        """
+        return self._run_tour_stages(city, dining_preference, dietary_restrictions, include_narrative=True,
+                                     latency_budget=latency_budget)
+
+    def prepare_foodie_tour(self, city: str, dining_preference: str = "Weather-based (Auto)",
+                            dietary_restrictions: List[str] = None, latency_budget: float = None) -> Dict[str, Any]:
+        """Gather weather, dishes and restaurants for a city, without the narrative"""
+        return self._run_tour_stages(city, dining_preference, dietary_restrictions, include_narrative=False,
+                                     latency_budget=latency_budget)
+
+    def create_foodie_tour_variants(self, city: str, variants: List[TourVariant],
+                                    latency_budget: float = None) -> List[Dict[str, Any]]:
+        """Create one tour per (dining_preference, dietary_restrictions) variant of a city
+
+        Weather, dishes and restaurants do not depend on the variant, so they
+        are looked up once; only the narratives run per variant, in parallel.
+        Variants that resolve to the same dining type and restrictions share
+        one narrative. Tours are returned in the order of variants.
+        """
+        if not variants:
+            return []
+
+        deadline, started = self._deadline(latency_budget), time.perf_counter()
+        shared = self._run_tour_stages(city, variants[0][0], None, include_narrative=False,
+                                       latency_budget=latency_budget)
+        resolved, unique = self._resolve_variants(city, shared, variants)
+
+        with ThreadPoolExecutor(max_workers=len(unique), thread_name_prefix="variant") as executor:
+            futures = {variant: executor.submit(self._timed_narrative, self.tour_planner, city, shared, variant,
+                                                deadline, started)
+                       for variant in unique}
+            narratives = {variant: future.result() for variant, future in futures.items()}
+
+        return self._variant_tours(city, shared, resolved, narratives)
+
+    def _resolve_variants(self, city: str, shared: Dict[str, Any], variants: List[TourVariant]):
+        """Each variant's (dining_type, restrictions), and the distinct ones needing a narrative"""
+        resolved = []
+        for dining_preference, dietary_restrictions in variants:
+            dining_type = self._choose_dining_type(shared['weather'], dining_preference)
+            resolved.append((dining_type, tuple(dietary_restrictions or ["None"])))
+        progress(f"📝  Creating {len(variants)} tour narratives for {city}...")
+        return resolved, list(dict.fromkeys(resolved))
+
+    @staticmethod
+    def _timed_narrative(tour_planner: TourPlanner, city: str, shared: Dict[str, Any],
+                         variant: Tuple[str, Tuple[str, ...]], deadline: Deadline, started: float):
+        """(narrative, timing) for one variant, or an awaitable of it from an async planner"""
+        dining_type, dietary_restrictions = variant
+        start = time.perf_counter() - started
+
+        def timed(narrative: str):
+            end = time.perf_counter() - started
+            metrics.observe('stage_seconds', end - start, stage='tour_narrative')
+            return narrative, {'start': start, 'end': end}
+
+        return _then(tour_planner.create_tour(
+            city, shared['weather'], dining_type, shared['restaurants'], list(dietary_restrictions),
+            timeout=deadline.timeout_for('tour_narrative') if deadline else None
+        ), timed)
+
+    def _variant_tours(self, city: str, shared: Dict[str, Any], resolved, narratives) -> List[Dict[str, Any]]:
+        tours = []
+        for variant in resolved:
+            narrative, timing = narratives[variant]
+            results = dict(shared, dining_type=variant[0], tour_narrative=narrative)
+            timings = dict(shared['stage_timings'], tour_narrative=timing)
+            tours.append(self._build_tour(city, results, list(variant[1]), timings))
+        return tours
+
+    def _run_tour_stages(self, city: str, dining_preference: str, dietary_restrictions: List[str],
+                         include_narrative: bool, latency_budget: float = None) -> Dict[str, Any]:
+        """Run the tour stages for a city as a dependency graph
+
+        Weather and cuisine lookups do not depend on each other, so they run
+        concurrently; the narrative starts once both are available.
+        """
+        if dietary_restrictions is None:
+            dietary_restrictions = ["None"]
+        scheduler = StageScheduler(self._tour_stages(city, dining_preference, dietary_restrictions,
+                                                     include_narrative, self._deadline(latency_budget)))
+        return self._tour_from_stages(city, scheduler.run(), dietary_restrictions, scheduler)
+
+    def _deadline(self, latency_budget: float = None):
+        if latency_budget is None:
+            latency_budget = self.latency_budget
+        return Deadline(latency_budget) if latency_budget else None
+
+    def _tour_stages(self, city: str, dining_preference: str, dietary_restrictions: List[str],
+                     include_narrative: bool, deadline: Deadline = None, weather_service=None,
+                     cuisine_agent=None, tour_planner=None) -> List[Stage]:
+        """The stage graph of one tour
+
+        The services default to the workflow's own; AsyncFoodieTourWorkflow
+        passes its async ones, whose stages then return coroutines.
+        """
+        weather_service = weather_service or self.weather_service
+        cuisine_agent = cuisine_agent or self.cuisine_agent
+        tour_planner = tour_planner or self.tour_planner
+        progress(f"\n🍽️  Creating foodie tour for {city}...")
+
+        def timeout_for(stage: str):
+            return deadline.timeout_for(stage) if deadline else None
+
+        # 1. Get weather and dining suggestion
+        def check_weather():
+            progress("☀️  Checking weather...")
+            return _then(weather_service.get_weather(city, timeout=timeout_for('weather')), report_weather)
+
+        def report_weather(weather_data):
+            progress(f"Weather: {weather_data['description']} ({weather_data['temperature']}°C)")
+            return weather_data
+
+        def choose_dining_type(weather_data):
+            return self._choose_dining_type(weather_data, dining_preference)
+
+        # 2. Get local dishes
+        def find_dishes():
+            progress("🥘  Finding iconic local dishes...")
+            return _then(cuisine_agent.get_local_dishes(city, timeout=timeout_for('dishes')), report_dishes)
+
+        def report_dishes(dishes):
+            progress(f"Local dishes: {', '.join(dishes)}")
+            return dishes
+
+        # 3. Find restaurants
+        def find_restaurants(dishes):
+            progress("🏪  Finding top-rated restaurants...")
+            return _then(cuisine_agent.find_restaurants(city, dishes, timeout=timeout_for('restaurants')),
+                         report_restaurants)
+
+        def report_restaurants(restaurants):
+            progress(f"Restaurants found: {len(restaurants)}")
+            return restaurants
+
+        # 2-3. Get local dishes and their restaurants in one execution
+        def find_dishes_and_restaurants():
+            progress("🥘  Finding iconic local dishes and top-rated restaurants...")
+            return _then(cuisine_agent.get_dishes_and_restaurants(city, timeout=timeout_for('cuisine')),
+                         lambda cuisine: (report_dishes(cuisine[0]), report_restaurants(cuisine[1])))
+
+        # 4. Create tour narrative
+        def create_narrative(weather_data, dining_type, restaurants):
+            progress("📝  Creating tour narrative...")
+            return tour_planner.create_tour(
+                city, weather_data, dining_type, restaurants, dietary_restrictions,
+                timeout=timeout_for('tour_narrative')
+            )
+
+        stages = [
+            Stage('weather', check_weather),
+            Stage('dining_type', choose_dining_type, depends_on=['weather']),
+        ]
+        if self.fused_cuisine:
+            stages += [
+                Stage('cuisine', find_dishes_and_restaurants),
+                Stage('dishes', lambda cuisine: cuisine[0], depends_on=['cuisine']),
+                Stage('restaurants', lambda cuisine: cuisine[1], depends_on=['cuisine']),
+            ]
+        else:
+            stages += [
+                Stage('dishes', find_dishes),
+                Stage('restaurants', find_restaurants, depends_on=['dishes']),
+            ]
+        if include_narrative:
+            stages.append(Stage('tour_narrative', create_narrative,
+                                depends_on=['weather', 'dining_type', 'restaurants']))
+        return stages
+
+    def _tour_from_stages(self, city: str, results: Dict[str, Any], dietary_restrictions: List[str],
+                          scheduler: StageScheduler) -> Dict[str, Any]:
+        for stage, timing in scheduler.timings.items():
+            metrics.observe('stage_seconds', timing['end'] - timing['start'], stage=stage)
+        return self._build_tour(city, results, dietary_restrictions, scheduler.timings)
+
+    def _choose_dining_type(self, weather_data: Dict[str, Any], dining_preference: str) -> str:
+        # Determine dining type based on preference
+        if dining_preference == "Weather-based (Auto)":
+            dining_type = self.weather_service.suggest_dining_type(weather_data)
+        else:
+            dining_type = dining_preference.lower()
+        progress(f"Dining preference: {dining_type}")
+        return dining_type
+
+    @staticmethod
+    def _build_tour(city: str, results: Dict[str, Any], dietary_restrictions: List[str],
+                    stage_timings: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+        tour = {
+            'city': city,
+            'weather': results['weather'],
+            'dining_type': results['dining_type'],
+            'dishes': results['dishes'],
+            'restaurants': results['restaurants'],
+            'dietary_restrictions': dietary_restrictions,
+            'stage_timings': stage_timings
+        }
+        if 'tour_narrative' in results:
+            tour['tour_narrative'] = results['tour_narrative']
+        return tour
+
+    def stream_tour_narrative(self, tour: Dict[str, Any]) -> Iterator[str]:
+        """Stream the narrative for a tour returned by prepare_foodie_tour"""
+        progress("📝  Creating tour narrative...")
+        return self.tour_planner.create_tour_stream(
+            tour['city'], tour['weather'], tour['dining_type'], tour['restaurants'], tour['dietary_restrictions']
+        )
+
+    def run_workflow(self, cities: List[str], dining_preference: str = "Weather-based (Auto)",
+                     dietary_restrictions: List[str] = None, max_concurrency: int = None,
+                     latency_budget: float = None):
+        """Run the complete workflow for multiple cities
+
+        Cities are processed by a bounded worker pool; results are returned
+        in input order and a failing city does not affect the others.
+        """
+        progress("🚀 Starting Foodie Tour Workflow")
+        progress("=" * 50)
+
+        completed = {}
+        for index, outcome in self._iter_indexed(cities, dining_preference, dietary_restrictions, max_concurrency,
+                                                 latency_budget):
+            self._report_outcome(outcome)
+            if not isinstance(outcome, TourError):
+                completed[index] = outcome
+
+        return [completed[index] for index in sorted(completed)]
+
+    @staticmethod
+    def _report_outcome(outcome: Union[Dict[str, Any], TourError]):
+        if isinstance(outcome, TourError):
+            progress(f"❌ Error processing {outcome.city}: {outcome.error}")
+            return
+
+        # Display results
+        progress(f"\n📍 FOODIE TOUR FOR {outcome['city'].upper()}")
+        progress("-" * 30)
+        progress(outcome['tour_narrative'])
+        progress("\n" + "=" * 50)
+
+    def iter_workflow(self, cities: List[str], dining_preference: str = "Weather-based (Auto)",
+                      dietary_restrictions: List[str] = None, max_concurrency: int = None,
+                      latency_budget: float = None) -> Iterator[Union[Dict[str, Any], TourError]]:
+        """Yield each city's tour as soon as it is ready
+
+        Results arrive in completion order, not input order. A city that
+        fails yields a TourError instead of a result dict.
+        """
+        for _, outcome in self._iter_indexed(cities, dining_preference, dietary_restrictions, max_concurrency,
+                                             latency_budget):
+            yield outcome
+
+    def _iter_indexed(self, cities: List[str], dining_preference: str, dietary_restrictions: List[str],
+                      max_concurrency: int = None, latency_budget: float = None):
+        if not cities:
+            return
+
+        # Batched weather requests for the cities already geocoded; each
+        # city's get_weather call shares them instead of sending its own
+        self.weather_service.prefetch_weather(cities)
+
+        jobs = ((index, city, dining_preference, dietary_restrictions) for index, city in enumerate(cities))
+        yield from self.iter_tours(jobs, max_concurrency, latency_budget)
+
+    def iter_tours(self, jobs: Iterable[TourJob], max_concurrency: int = None,
+                   latency_budget: float = None) -> Iterator[Tuple[Any, Union[Dict[str, Any], TourError]]]:
+        """Run tour jobs on a bounded worker pool, yielding (key, result) as each completes
+
+        Jobs are pulled from the iterable lazily, with at most twice the
+        worker count in flight, so arbitrarily long job streams use bounded
+        memory.
+        """
+        workers = max(1, max_concurrency or self.max_concurrency)
+        jobs = iter(jobs)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                job = next(jobs, None)
+                if job is None:
+                    return False
+                key, city, dining_preference, dietary_restrictions = job
+                future = executor.submit(self.create_foodie_tour, city, dining_preference, dietary_restrictions,
+                                         latency_budget)
+                in_flight[future] = (key, city)
+                return True
+
+            while len(in_flight) < workers * 2 and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, city = in_flight.pop(future)
+                    submit_next()
+                    yield key, self._outcome(city, future)
+
+    @staticmethod
+    def _outcome(city: str, future) -> Union[Dict[str, Any], TourError]:
+        """Result of a finished tour future (or asyncio task), or a TourError if it raised"""
+        try:
+            return future.result()
+        except Exception as e:
+            return TourError(city, e)
+
+
+# Example usage and main execution
+if __name__ == "__main__":
+    # List of cities to create foodie tours for
+    cities = ["Paris", "Tokyo", "New York"]
+
+    # Print human-readable progress to the console
+    metrics.add_sink(ProgressSink())
+
+    # Create and run workflow
+    workflow = FoodieTourWorkflow()
+    results = workflow.run_workflow(cities)
+
     print(f"\n✅ Completed foodie tours for {len(results)} cities!")
\ No newline at end of file
@@ -0,0 +1,206 @@
+# metrics.py - Lightweight spans, counters and histograms for the workflow
+
+import bisect
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+Event = Dict[str, Any]
+
+
+def _labels(labels: Dict[str, Any]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(upper bound, cumulative count) pairs, ending with +Inf"""
+        pairs, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((f"{bound:g}", total))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and latency histograms
+
+    span() times a block of code into a '<name>_seconds' histogram.
+    Spans and progress messages are also sent as events to any registered
+    sinks, for example ProgressSink for human-readable console output.
+    """
+
+    def __init__(self, namespace: str = 'foodie'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._gauges: Dict[Tuple[str, LabelSet], float] = {}
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._sinks: List[Callable[[Event], None]] = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Time a block into the '<name>_seconds' histogram and emit a span event"""
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.observe(f"{name}_seconds", duration, **labels)
+            if error is not None:
+                self.inc(f"{name}_errors_total", **labels)
+            self._emit({'type': 'span', 'name': name, 'labels': labels,
+                        'duration': duration, 'error': error})
+
+    def progress(self, message: str):
+        """Human-readable progress, delivered only to registered sinks"""
+        self._emit({'type': 'progress', 'message': message})
+
+    def add_sink(self, sink: Callable[[Event], None]):
+        with self._lock:
+            self._sinks.append(sink)
+
+    def remove_sink(self, sink: Callable[[Event], None]):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Every series as a plain dict"""
+        with self._lock:
+            series = [{'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value}
+                      for (name, labels), value in self._counters.items()]
+            series += [{'type': 'gauge', 'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in self._gauges.items()]
+            series += [{'type': 'histogram', 'name': name, 'labels': dict(labels),
+                        'count': histogram.count, 'sum': histogram.sum,
+                        'buckets': dict(histogram.cumulative())}
+                       for (name, labels), histogram in self._histograms.items()]
+        return sorted(series, key=lambda item: (item['name'], sorted(item['labels'].items())))
+
+    def to_jsonl(self) -> str:
+        """Export every series as one JSON object per line"""
+        timestamp = time.time()
+        return "".join(json.dumps({'timestamp': timestamp, **item}) + "\n" for item in self.snapshot())
+
+    def to_prometheus(self) -> str:
+        """Export every series in the Prometheus text exposition format"""
+        lines, typed = [], set()
+        for item in self.snapshot():
+            name = f"{self.namespace}_{item['name']}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} {item['type']}")
+                typed.add(name)
+            if item['type'] == 'histogram':
+                for bound, count in item['buckets'].items():
+                    lines.append(f"{name}_bucket{self._format_labels({**item['labels'], 'le': bound})} {count}")
+                lines.append(f"{name}_sum{self._format_labels(item['labels'])} {item['sum']}")
+                lines.append(f"{name}_count{self._format_labels(item['labels'])} {item['count']}")
+            else:
+                lines.append(f"{name}{self._format_labels(item['labels'])} {item['value']}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_labels(labels: Dict[str, str]) -> str:
+        if not labels:
+            return ""
+        pairs = []
+        for key, value in sorted(labels.items()):
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(f'{key}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+    def _emit(self, event: Event):
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink(event)
+
+
+class ProgressSink:
+    """Print progress messages (and optionally span timings) to a stream"""
+
+    def __init__(self, stream=None, show_spans: bool = False):
+        self.stream = stream
+        self.show_spans = show_spans
+
+    def __call__(self, event: Event):
+        stream = self.stream or sys.stdout
+        if event['type'] == 'progress':
+            print(event['message'], file=stream)
+        elif self.show_spans and event['type'] == 'span':
+            labels = " ".join(f"{key}={value}" for key, value in event['labels'].items())
+            status = f" ({event['error']})" if event['error'] else ""
+            print(f"⏱️  {event['name']} {labels} {event['duration'] * 1000:.1f}ms{status}", file=stream)
+
+
+class JsonLinesSink:
+    """Append every event to a file as a JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        line = json.dumps({'timestamp': time.time(), **event}, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+# Process-wide registry used by the workflow modules
+metrics = Metrics()
+
+
+def progress(message: str):
+    """Report human-readable progress through the default registry"""
+    metrics.progress(message)
@@ -0,0 +1,152 @@
+# rate_limiter.py - Adaptive token-bucket rate limiting per backend
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict
+
+from metrics import metrics
+
+# Starting points per backend; the limiter adapts between min_rate and max_rate
+DEFAULT_LIMITS = {
+    'julep': {'rate': 10.0, 'burst': 20, 'min_rate': 0.5, 'max_rate': 50.0},
+    'open-meteo': {'rate': 8.0, 'burst': 16, 'min_rate': 0.5, 'max_rate': 10.0},
+}
+
+# Status codes meaning "slow down": rate limited or overloaded
+THROTTLE_STATUSES = (429, 503)
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Whether an exception is a rate-limit or overload response"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status in THROTTLE_STATUSES
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate adapts AIMD-style to backend pushback
+
+    Each success raises the rate additively, by about `increase` requests per
+    second for every second of successful traffic. Each throttle response
+    multiplies the rate by `decrease` and empties the bucket, so callers back
+    off together. A burst of throttles from requests that were already in
+    flight counts once per `cooldown` seconds, like one loss per round trip.
+    """
+
+    def __init__(self, name: str, rate: float = 10.0, burst: int = 20, min_rate: float = 0.5,
+                 max_rate: float = 50.0, increase: float = 1.0, decrease: float = 0.5,
+                 cooldown: float = 1.0):
+        self.name = name
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self._rate = min(max(rate, min_rate), max_rate)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiting = 0
+        self._throttled = 0
+        self._last_decrease = None
+        self._cond = threading.Condition()
+
+    @property
+    def rate(self) -> float:
+        with self._cond:
+            return self._rate
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        with self._cond:
+            self._waiting += 1
+            self._publish()
+            try:
+                while True:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    self._cond.wait((1 - self._tokens) / self._rate)
+            finally:
+                self._waiting -= 1
+                self._publish()
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return seconds until one is"""
+        with self._cond:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self._rate
+
+    async def acquire_async(self):
+        """acquire() for coroutines: waits on the event loop instead of blocking it"""
+        delay = self.try_acquire()
+        if not delay:
+            return
+        with self._cond:
+            self._waiting += 1
+            self._publish()
+        try:
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self.try_acquire()
+        finally:
+            with self._cond:
+                self._waiting -= 1
+                self._publish()
+
+    def on_success(self):
+        with self._cond:
+            self._rate = min(self.max_rate, self._rate + self.increase / self._rate)
+            self._publish()
+
+    def on_throttle(self):
+        with self._cond:
+            now = time.monotonic()
+            if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                self._rate = max(self.min_rate, self._rate * self.decrease)
+                self._last_decrease = now
+            self._refill()
+            self._tokens = 0.0
+            self._throttled += 1
+            self._publish()
+        metrics.inc('rate_limit_throttled_total', backend=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill()
+            return {
+                'backend': self.name,
+                'rate': self._rate,
+                'tokens': self._tokens,
+                'queue_depth': self._waiting,
+                'throttled': self._throttled
+            }
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def _publish(self):
+        metrics.set_gauge('rate_limit_rate', self._rate, backend=self.name)
+        metrics.set_gauge('rate_limit_queue_depth', self._waiting, backend=self.name)
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(backend: str) -> AdaptiveRateLimiter:
+    """Process-wide limiter shared by every client of a backend"""
+    with _limiters_lock:
+        limiter = _limiters.get(backend)
+        if limiter is None:
+            limiter = _limiters[backend] = AdaptiveRateLimiter(backend, **DEFAULT_LIMITS.get(backend, {}))
+        return limiter
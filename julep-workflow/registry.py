@@ -0,0 +1,103 @@
+# registry.py - Persistent registry of Julep agent and task IDs
+
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict
+
+from storage import cache_path, definition_hash, read_json, write_json
+
+
+def is_not_found(error: BaseException) -> bool:
+    """Whether an API error means the resource does not exist (HTTP 404)"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 404
+
+
+def _account_scope(client) -> str:
+    # The same definition gets a different ID on every Julep account and
+    # deployment; the API key is only ever stored hashed
+    return definition_hash({'base_url': str(getattr(client, 'base_url', '') or ''),
+                            'api_key': str(getattr(client, 'api_key', '') or '')})[:16]
+
+
+class AgentRegistry:
+    """Reuse Julep agents and tasks across processes and Streamlit reruns.
+
+    IDs are stored on disk keyed by the client's account and base URL plus a
+    hash of the agent or task definition, so a resource is only re-created
+    when its definition changes, or when the server no longer has it.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or cache_path('julep_registry.json')
+        self._lock = threading.Lock()
+        self._entries: Dict[str, str] = read_json(self.path, {})
+        # Held across lookup, create and save, so concurrent callers wait for
+        # one creation instead of each creating a duplicate
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def get_or_create_agent(self, client, **definition):
+        """Return the registered agent for this definition, creating it if needed"""
+        key = f"agent:{_account_scope(client)}:{definition_hash(definition)}"
+        return self._get_or_create(key, lambda: client.agents.create(**definition))
+
+    def get_or_create_task(self, client, agent_id: str, definition: Dict[str, Any]):
+        """Return the registered task for this agent and definition, creating it if needed"""
+        key = f"task:{_account_scope(client)}:{definition_hash({'agent_id': agent_id, 'definition': definition})}"
+        return self._get_or_create(key, lambda: client.tasks.create(agent_id=agent_id, **definition))
+
+    def _get_or_create(self, key: str, create: Callable[[], Any]):
+        with self._key_lock(key):
+            with self._lock:
+                # Another process may have created it since we loaded
+                resource_id = self._entries.get(key) or read_json(self.path, {}).get(key)
+                if resource_id:
+                    self._entries[key] = resource_id
+            if resource_id:
+                return SimpleNamespace(id=resource_id)
+
+            resource = create()
+            with self._lock:
+                # Merge with entries written by other processes since we loaded
+                self._entries = {**read_json(self.path, {}), **self._entries, key: str(resource.id)}
+                write_json(self.path, self._entries)
+            return resource
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def forget(self, resource_id: str):
+        """Drop every entry for a resource the server no longer has, so it is created again"""
+        with self._lock:
+            self._entries = {key: value for key, value in {**read_json(self.path, {}), **self._entries}.items()
+                             if value != resource_id}
+            write_json(self.path, self._entries)
+
+    def forget_resources(self, owner, stale_id: str, *names: str):
+        """Forget the agent and tasks in owner's lazy attributes after the server reported stale_id missing
+
+        The next use creates them again. Callers that saw the same error
+        after another caller already did this keep the new resources.
+        """
+        if stale_id not in {str(owner.__dict__[name].id) for name in names if name in owner.__dict__}:
+            return
+        for name in names:
+            resource = owner.__dict__.pop(name, None)
+            if resource is not None:
+                self.forget(str(resource.id))
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry() -> AgentRegistry:
+    """Process-wide registry backed by the default cache directory"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = AgentRegistry()
+        return _default_registry
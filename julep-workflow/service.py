@@ -0,0 +1,316 @@
+# service.py - Headless HTTP service: tour jobs on a bounded queue served by a worker pool
+
+import argparse
+import json
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from batch import parse_restrictions
+from main import FoodieTourWorkflow, TourError
+from metrics import ProgressSink, metrics
+
+
+class QueueFull(Exception):
+    """Raised by JobService.submit when no more jobs can be queued"""
+
+
+class Job:
+    """One request for tours of one or more cities, and its results so far"""
+
+    def __init__(self, cities: List[str], dining_preference: str, dietary_restrictions: List[str],
+                 latency_budget: float = None):
+        self.id = uuid.uuid4().hex
+        self.cities = cities
+        self.dining_preference = dining_preference
+        self.dietary_restrictions = dietary_restrictions
+        self.latency_budget = latency_budget
+        self.status = 'queued'
+        self.tours: List[Dict[str, Any]] = []
+        self.errors: List[Dict[str, Any]] = []
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'cities': self.cities,
+            'completed': len(self.tours) + len(self.errors),
+            'tours': list(self.tours),
+            'errors': list(self.errors),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobService:
+    """Run tour jobs from a bounded queue on a fixed pool of worker threads
+
+    submit() never blocks: when queue_size jobs are already waiting, or the
+    service is stopping, it raises QueueFull, so callers get backpressure
+    instead of an ever growing backlog. Each job's finished cities are
+    visible through get() while the rest are still running. The most recent
+    max_jobs jobs are remembered.
+    """
+
+    def __init__(self, workflow: FoodieTourWorkflow, workers: int = 4, queue_size: int = 64,
+                 city_concurrency: int = None, max_jobs: int = 1000):
+        self.workflow = workflow
+        self.workers = max(1, workers)
+        self.city_concurrency = city_concurrency
+        self.max_jobs = max_jobs
+        self.queue_size = queue_size
+        # Bounded by submit() rather than by the queue itself, so stop() can
+        # always enqueue the workers' exit markers
+        self._queue: 'queue.Queue[Optional[Job]]' = queue.Queue()
+        self._stopping = threading.Event()
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> 'JobService':
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"tour-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._publish()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Cancel the queued jobs, let the workers finish their current job, then exit"""
+        with self._lock:
+            self._stopping.set()
+            cancelled = self._drain()
+        for _ in cancelled:
+            metrics.inc('service_jobs_total', status='cancelled')
+        self._publish()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, cities: List[str], dining_preference: str = "Weather-based (Auto)",
+               dietary_restrictions: List[str] = None, latency_budget: float = None) -> Job:
+        job = Job(cities, dining_preference, dietary_restrictions or ["None"], latency_budget)
+        with self._lock:
+            if self._stopping.is_set() or self._queue.qsize() >= self.queue_size:
+                metrics.inc('service_jobs_total', status='rejected')
+                raise QueueFull("Service is stopping" if self._stopping.is_set()
+                                else f"{self.queue_size} jobs already queued")
+            self._queue.put_nowait(job)
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+        metrics.inc('service_jobs_total', status='accepted')
+        self._publish()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            busy = self._busy
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self.queue_size,
+            'workers': self.workers,
+            'busy_workers': busy,
+            'utilization': busy / self.workers
+        }
+
+    def _drain(self) -> List[Job]:
+        # Mark every job still waiting in the queue as cancelled
+        cancelled = []
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return cancelled
+            if job is not None:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                cancelled.append(job)
+
+    def _forget_old_jobs(self):
+        # Drop the oldest finished jobs; queued and running ones are always kept
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at is not None][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    def _publish(self):
+        stats = self.stats()
+        metrics.set_gauge('service_queue_depth', stats['queue_depth'])
+        metrics.set_gauge('service_busy_workers', stats['busy_workers'])
+        metrics.set_gauge('service_worker_utilization', stats['utilization'])
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self._busy += 1
+                job.status = 'running'
+                job.started_at = time.time()
+            self._publish()
+            metrics.observe('service_queue_wait_seconds', job.started_at - job.submitted_at)
+
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                self._publish()
+                # rate() of the busy seconds over the worker count is the utilization over any window
+                metrics.observe('service_job_seconds', job.finished_at - job.started_at)
+                metrics.inc('service_worker_busy_seconds_total', job.finished_at - job.started_at)
+
+    def _run(self, job: Job):
+        status = 'done'
+        try:
+            for outcome in self.workflow.iter_workflow(job.cities, job.dining_preference, job.dietary_restrictions,
+                                                       self.city_concurrency, job.latency_budget):
+                with self._lock:
+                    if isinstance(outcome, TourError):
+                        job.errors.append(outcome.to_dict())
+                    else:
+                        job.tours.append(outcome)
+        except Exception as e:
+            status = 'failed'
+            with self._lock:
+                job.errors.append(TourError(None, e).to_dict())
+        finally:
+            with self._lock:
+                job.status = status
+                job.finished_at = time.time()
+            metrics.inc('service_jobs_total', status=status)
+
+
+def parse_job_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    """submit() arguments from a POST /jobs body, raising ValueError if it is unusable"""
+    cities = body.get('cities', body.get('city'))
+    if isinstance(cities, str):
+        cities = [city.strip() for city in cities.split(',')]
+    if not isinstance(cities, list):
+        raise ValueError("'cities' must be a list of city names")
+    cities = [str(city).strip() for city in cities if str(city).strip()]
+    if not cities:
+        raise ValueError("At least one city is required")
+
+    latency_budget = body.get('latency_budget')
+    # bool is an int, and NaN and infinity are valid JSON to Python's parser
+    if latency_budget is not None and (isinstance(latency_budget, bool) or
+                                       not isinstance(latency_budget, (int, float)) or
+                                       not 0 < latency_budget < math.inf):
+        raise ValueError("'latency_budget' must be a positive number of seconds")
+
+    return {
+        'cities': cities,
+        'dining_preference': str(body.get('dining_preference') or "Weather-based (Auto)"),
+        'dietary_restrictions': parse_restrictions(body.get('dietary_restrictions'), ["None"]),
+        'latency_budget': latency_budget
+    }
+
+
+def create_server(service: JobService, host: str = '127.0.0.1', port: int = 8000) -> ThreadingHTTPServer:
+    """HTTP front end for a JobService
+
+    POST /jobs         queue a job, 202 with its id (503 when the queue is full)
+    GET  /jobs/<id>    status and the tours finished so far
+    GET  /metrics      Prometheus metrics, including queue depth and worker utilization
+    GET  /healthz      queue and worker stats as JSON
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._send_json(404, {'error': 'Not found'})
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(body, dict):
+                    raise ValueError("Request body must be a JSON object")
+                job = service.submit(**parse_job_request(body))
+            except ValueError as e:
+                return self._send_json(400, {'error': str(e)})
+            except QueueFull as e:
+                return self._send_json(503, {'error': str(e)}, {'Retry-After': '5'})
+            self._send_json(202, {'id': job.id, 'status': job.status}, {'Location': f"/jobs/{job.id}"})
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0].rstrip('/')
+            if path.startswith('/jobs/'):
+                job = service.get(path[len('/jobs/'):])
+                if job is None:
+                    return self._send_json(404, {'error': 'Unknown job'})
+                return self._send_json(200, job)
+            if path == '/metrics':
+                service._publish()
+                return self._send(200, metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+            if path == '/healthz':
+                return self._send_json(200, service.stats())
+            self._send_json(404, {'error': 'Not found'})
+
+        def _send_json(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None):
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+            self._send(status, payload, 'application/json', headers)
+
+        def _send(self, status: int, payload: bytes, content_type: str, headers: Dict[str, str] = None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve foodie tour jobs over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help="Jobs processed at once")
+    parser.add_argument('--queue-size', type=int, default=64, help="Jobs that may wait before POST /jobs returns 503")
+    parser.add_argument('--city-concurrency', type=int, default=4, help="Cities processed at once within a job")
+    parser.add_argument('--latency-budget', type=float, help="Default seconds allowed per tour")
+    parser.add_argument('--fused', action='store_true', help="Use the fused dishes+restaurants task")
+    parser.add_argument('--verbose', action='store_true', help="Print per-city progress")
+    args = parser.parse_args()
+
+    if args.verbose:
+        metrics.add_sink(ProgressSink())
+
+    workflow = FoodieTourWorkflow(max_concurrency=args.workers * args.city_concurrency, fused_cuisine=args.fused,
+                                  latency_budget=args.latency_budget)
+    service = JobService(workflow, args.workers, args.queue_size, args.city_concurrency).start()
+    server = create_server(service, args.host, args.port)
+    print(f"Serving foodie tour jobs on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, queue of {args.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
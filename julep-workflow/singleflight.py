@@ -0,0 +1,163 @@
+# singleflight.py - Coalesce identical concurrent calls into one
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from metrics import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Share one in-flight call among concurrent callers with the same key
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and receive the same result, or the same
+    exception. Nothing is remembered once the call returns, so this only
+    removes duplicate concurrent work; caching is left to the caller.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[str, Hashable], _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, kind: str, key: Hashable, func: Callable[..., Any], *args) -> Any:
+        """Run func(*args) unless a call of this kind for key is already in flight"""
+        with self._lock:
+            call = self._calls.get((kind, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(kind, key)] = _Call()
+
+        if not leader:
+            metrics.inc('singleflight_calls_total', kind=kind, role='shared')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.inc('singleflight_calls_total', kind=kind, role='leader')
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(kind, key)]
+            call.done.set()
+
+    def start_many(self, kind: str, keys: Iterable[Hashable]) -> List[Hashable]:
+        """Claim every key of this kind not already in flight, for one batched call
+
+        Callers of do() for a claimed key wait for finish_many instead of
+        running their own call. Returns the claimed keys.
+        """
+        with self._lock:
+            claimed = [key for key in dict.fromkeys(keys) if (kind, key) not in self._calls]
+            for key in claimed:
+                self._calls[(kind, key)] = _Call()
+        metrics.inc('singleflight_calls_total', len(claimed), kind=kind, role='leader')
+        return claimed
+
+    def finish_many(self, kind: str, keys: List[Hashable], func: Callable[..., List[Any]], *args) -> List[Any]:
+        """Run func(*args), which returns one result per claimed key, and hand each to its waiters"""
+        with self._lock:
+            calls = [self._calls[(kind, key)] for key in keys]
+        try:
+            results = func(*args)
+            for call, result in zip(calls, results):
+                call.result = result
+            return results
+        except BaseException as e:
+            for call in calls:
+                call.error = e
+            raise
+        finally:
+            with self._lock:
+                for key in keys:
+                    del self._calls[(kind, key)]
+            for call in calls:
+                call.done.set()
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines sharing one event loop
+
+    The shared call runs as its own task, so a caller that is cancelled
+    does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+
+    async def do(self, kind: str, key: Hashable, func: Callable[..., Any], *args) -> Any:
+        """Await func(*args) unless a call of this kind for key is already in flight"""
+        call = self._calls.get((kind, key))
+        if call is None:
+            metrics.inc('singleflight_calls_total', kind=kind, role='leader')
+            call = self._calls[(kind, key)] = asyncio.ensure_future(func(*args))
+            call.add_done_callback(lambda _: self._calls.pop((kind, key), None))
+        else:
+            metrics.inc('singleflight_calls_total', kind=kind, role='shared')
+        return await asyncio.shield(call)
+
+    def start_many(self, kind: str, keys: Iterable[Hashable]) -> List[Hashable]:
+        """SingleFlight.start_many on the running event loop"""
+        loop = asyncio.get_running_loop()
+        claimed = [key for key in dict.fromkeys(keys) if (kind, key) not in self._calls]
+        for key in claimed:
+            self._calls[(kind, key)] = loop.create_future()
+        metrics.inc('singleflight_calls_total', len(claimed), kind=kind, role='leader')
+        return claimed
+
+    async def finish_many(self, kind: str, keys: List[Hashable], func: Callable[..., Any], *args) -> List[Any]:
+        """Await func(*args), which returns one result per claimed key, and hand each to its waiters"""
+        calls = [self._calls[(kind, key)] for key in keys]
+        try:
+            results = await func(*args)
+        except Exception as e:
+            for call in calls:
+                call.set_exception(e)
+                # Retrieved here, so a key nobody waited for is not reported as unhandled
+                call.exception()
+            raise
+        except BaseException:
+            for call in calls:
+                call.cancel()
+            raise
+        else:
+            for call, result in zip(calls, results):
+                call.set_result(result)
+            return results
+        finally:
+            for key in keys:
+                self._calls.pop((kind, key), None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+_default_group = None
+_default_lock = threading.Lock()
+
+
+def default_group() -> SingleFlight:
+    """Process-wide group, so separate workflow instances share their calls"""
+    global _default_group
+    with _default_lock:
+        if _default_group is None:
+            _default_group = SingleFlight()
+        return _default_group
@@ -0,0 +1,131 @@
+# stage_scheduler.py - Run dependent workflow stages concurrently
+
+import asyncio
+import inspect
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+
+class Stage:
+    """A named unit of work; func receives the results of depends_on, in order
+
+    Under StageScheduler.run_async, func may also return an awaitable.
+    """
+
+    def __init__(self, name: str, func: Callable[..., Any], depends_on: Sequence[str] = ()):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+
+
+class StageScheduler:
+    """Run a small dependency graph of stages, starting each one as soon as
+    its dependencies have finished.
+
+    Per-stage start and end times (seconds since run() started) are kept in
+    timings. If a stage raises, stages that have not started are skipped
+    and the exception is re-raised. run_async() runs the same graph as
+    tasks on the running event loop, awaiting stages that return awaitables.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            missing = [name for name in stage.depends_on if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+        self._check_acyclic()
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def run(self) -> Dict[str, Any]:
+        """Run every stage and return their results keyed by stage name"""
+        results: Dict[str, Any] = {}
+        started = time.perf_counter()
+        remaining = dict(self.stages)
+
+        with ThreadPoolExecutor(max_workers=len(self.stages) or 1,
+                                thread_name_prefix="stage") as executor:
+            running = {}
+            while remaining or running:
+                for stage, args in self._ready(remaining, results):
+                    running[executor.submit(self._run_stage, stage, args, started)] = stage.name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        for pending in running:
+                            pending.cancel()
+                        raise error
+                    results[name] = future.result()
+
+        return results
+
+    async def run_async(self) -> Dict[str, Any]:
+        """run() on the running event loop"""
+        results: Dict[str, Any] = {}
+        started = time.perf_counter()
+        remaining = dict(self.stages)
+
+        running = {}
+        try:
+            while remaining or running:
+                for stage, args in self._ready(remaining, results):
+                    running[asyncio.ensure_future(self._run_stage_async(stage, args, started))] = stage.name
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[running.pop(task)] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+        return results
+
+    @staticmethod
+    def _ready(remaining: Dict[str, Stage], results: Dict[str, Any]) -> List[Tuple[Stage, List[Any]]]:
+        """Take the stages whose dependencies have all finished out of remaining, with their arguments"""
+        ready = []
+        for name, stage in list(remaining.items()):
+            if all(dependency in results for dependency in stage.depends_on):
+                ready.append((stage, [results[dependency] for dependency in stage.depends_on]))
+                del remaining[name]
+        return ready
+
+    def _run_stage(self, stage: Stage, args: List[Any], started: float) -> Any:
+        start = time.perf_counter() - started
+        try:
+            return stage.func(*args)
+        finally:
+            self.timings[stage.name] = {'start': start, 'end': time.perf_counter() - started}
+
+    async def _run_stage_async(self, stage: Stage, args: List[Any], started: float) -> Any:
+        start = time.perf_counter() - started
+        try:
+            result = stage.func(*args)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            self.timings[stage.name] = {'start': start, 'end': time.perf_counter() - started}
+
+    def _check_acyclic(self):
+        visiting, visited = set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle involving '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
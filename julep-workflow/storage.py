@@ -0,0 +1,49 @@
+# storage.py - Local on-disk storage helpers
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any
+
+
+def cache_dir() -> str:
+    """Directory holding registries and caches (override with FOODIE_CACHE_DIR)"""
+    path = os.getenv('FOODIE_CACHE_DIR', '.foodie_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_path(filename: str) -> str:
+    """Path of a file inside the cache directory"""
+    return os.path.join(cache_dir(), filename)
+
+
+def definition_hash(definition: Any) -> str:
+    """Stable hash of a JSON-serialisable definition"""
+    canonical = json.dumps(definition, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """Read a JSON file, returning default when it is missing or corrupt"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: str, data: Any):
+    """Atomically write a JSON file so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
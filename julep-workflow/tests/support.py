@@ -0,0 +1,73 @@
+# tests/support.py - The workflow's components wired to the offline backends
+
+import os
+
+from async_workflow import AsyncFoodieTourWorkflow, AsyncWeatherService
+from circuit_breaker import CircuitBreaker
+from cuisine_agent import CuisineAgent
+from fake_backends import FakeJulep, LatencyModel, OpenMeteoStub
+from geocode_cache import GeocodeCache
+from main import FoodieTourWorkflow
+from rate_limiter import AdaptiveRateLimiter
+from registry import AgentRegistry
+from singleflight import SingleFlight
+from tour_planner import TourPlanner
+from weather_service import WeatherService
+
+
+def fake_julep(execution_latency: float = 0.05, failure_rate: float = 0.0) -> FakeJulep:
+    return FakeJulep(execution_latency=LatencyModel(execution_latency, kind='fixed'), failure_rate=failure_rate,
+                     seed=1)
+
+
+def fake_cuisine_agent(julep: FakeJulep, directory: str, **options) -> CuisineAgent:
+    """CuisineAgent with its own registry and single-flight group, and no cache or knowledge pack unless given"""
+    options.setdefault('use_cache', False)
+    options.setdefault('use_knowledge_pack', False)
+    return CuisineAgent(registry=AgentRegistry(os.path.join(directory, 'registry.json')), client=julep,
+                        flights=SingleFlight(), **options)
+
+
+def fake_tour_planner(julep: FakeJulep, directory: str, **options) -> TourPlanner:
+    """TourPlanner with its own registry, and no cache unless one is given"""
+    options.setdefault('use_cache', False)
+    return TourPlanner(registry=AgentRegistry(os.path.join(directory, 'registry.json')), client=julep, **options)
+
+
+def fake_weather_service(stub: OpenMeteoStub, directory: str, **options) -> WeatherService:
+    """WeatherService sending its requests to stub, with its geocode cache in directory
+
+    It gets its own circuit breaker and rate limiter, so failures injected by
+    one test do not reach the process-wide ones.
+    """
+    options.setdefault('breaker', CircuitBreaker('open-meteo'))
+    options.setdefault('rate_limiter', AdaptiveRateLimiter('open-meteo', rate=1000, burst=1000, max_rate=1000))
+    options.setdefault('use_knowledge_pack', False)
+    return WeatherService(geocode_cache=GeocodeCache(os.path.join(directory, 'geocode.sqlite3')),
+                          geocoding_url=stub.geocoding_url, weather_url=stub.weather_url,
+                          flights=SingleFlight(), **options)
+
+
+def fake_workflow(julep: FakeJulep, stub: OpenMeteoStub, directory: str, **options) -> FoodieTourWorkflow:
+    """FoodieTourWorkflow whose state all lives in directory"""
+    workflow = FoodieTourWorkflow(client=julep, weather_service=fake_weather_service(stub, directory),
+                                  use_cache=False, use_knowledge_pack=False, **options)
+    return _with_fake_agents(workflow, julep, directory)
+
+
+def fake_async_workflow(julep: FakeJulep, stub: OpenMeteoStub, directory: str,
+                        **options) -> AsyncFoodieTourWorkflow:
+    """AsyncFoodieTourWorkflow on julep's async view, with the same services as fake_workflow"""
+    workflow = AsyncFoodieTourWorkflow(client=julep, async_client=julep.as_async(),
+                                       weather_service=AsyncWeatherService(fake_weather_service(stub, directory)),
+                                       use_cache=False, use_knowledge_pack=False, **options)
+    _with_fake_agents(workflow.workflow, julep, directory)
+    return workflow
+
+
+def _with_fake_agents(workflow: FoodieTourWorkflow, julep: FakeJulep, directory: str) -> FoodieTourWorkflow:
+    registry = AgentRegistry(os.path.join(directory, 'registry.json'))
+    workflow.cuisine_agent = CuisineAgent(registry=registry, client=julep, poller=workflow.poller,
+                                          flights=SingleFlight(), use_cache=False, use_knowledge_pack=False)
+    workflow.tour_planner = TourPlanner(registry=registry, client=julep, poller=workflow.poller, use_cache=False)
+    return workflow
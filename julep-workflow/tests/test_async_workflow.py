@@ -0,0 +1,94 @@
+import asyncio
+import tempfile
+import time
+import unittest
+
+from cuisine_agent import placeholder_dishes
+from fake_backends import OpenMeteoStub
+from main import TourError
+from tests.support import fake_async_workflow, fake_julep
+
+OSLO_DISHES = ['Oslo Dumplings', 'Oslo Stew', 'Oslo Pastry']
+
+
+class AsyncWorkflowTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.stub = OpenMeteoStub().start()
+        self.addCleanup(self.stub.stop)
+
+    def run_with_workflow(self, use, execution_latency: float = 0.05):
+        """Run use(workflow) on a fresh event loop, closing the workflow afterwards"""
+        self.julep = fake_julep(execution_latency)
+        workflow = fake_async_workflow(self.julep, self.stub, self.directory)
+
+        async def main():
+            try:
+                return await use(workflow)
+            finally:
+                await workflow.aclose()
+
+        return asyncio.run(main())
+
+    def test_creates_a_tour(self):
+        tour = self.run_with_workflow(lambda workflow: workflow.create_foodie_tour('Oslo'))
+        self.assertEqual(tour['dishes'], OSLO_DISHES)
+        self.assertEqual(tour['restaurants'][0], 'Oslo Dumplings - Oslo Kitchen No. 1')
+        self.assertTrue(tour['tour_narrative'].startswith('## Breakfast\nStart the day in Oslo'))
+        self.assertIn('temperature', tour['weather'])
+        self.assertEqual(self.julep.calls['executions.create'], 3)
+
+    def test_run_workflow_returns_tours_in_input_order(self):
+        cities = ['Oslo', 'Rome', 'Lima']
+        tours = self.run_with_workflow(lambda workflow: workflow.run_workflow(cities))
+        self.assertEqual([tour['city'] for tour in tours], cities)
+
+    def test_iter_workflow_yields_every_city(self):
+        async def collect(workflow):
+            return [outcome async for outcome in workflow.iter_workflow(['Oslo', 'Rome'])]
+
+        outcomes = self.run_with_workflow(collect)
+        self.assertFalse(any(isinstance(outcome, TourError) for outcome in outcomes))
+        self.assertEqual({outcome['city'] for outcome in outcomes}, {'Oslo', 'Rome'})
+
+    def test_variants_share_lookups(self):
+        variants = [('Indoor', ['Vegan']), ('Outdoor', None), ('Indoor', ['Vegan'])]
+        tours = self.run_with_workflow(lambda workflow: workflow.create_foodie_tour_variants('Oslo', variants))
+        self.assertEqual([tour['dining_type'] for tour in tours], ['indoor', 'outdoor', 'indoor'])
+        self.assertEqual(tours[2]['tour_narrative'], tours[0]['tour_narrative'])
+        self.assertEqual(self.julep.calls['executions.create'], 4)
+
+    def test_concurrent_lookups_share_one_execution(self):
+        async def lookups(workflow):
+            return await asyncio.gather(*(workflow.get_local_dishes('Oslo') for _ in range(5)))
+
+        self.assertEqual(self.run_with_workflow(lookups, execution_latency=0.3), [OSLO_DISHES] * 5)
+        self.assertEqual(self.julep.calls['executions.create'], 1)
+
+    def test_run_workflow_returns_fallbacks_within_the_budget(self):
+        async def budgeted(workflow):
+            started = time.perf_counter()
+            tours = await workflow.run_workflow(['Oslo'], latency_budget=0.5)
+            return tours, time.perf_counter() - started
+
+        tours, elapsed = self.run_with_workflow(budgeted, execution_latency=3.0)
+        self.assertLess(elapsed, 2.0)
+        self.assertEqual(tours[0]['dishes'], placeholder_dishes('Oslo'))
+
+    def test_aclose_releases_the_http_client(self):
+        async def use(workflow):
+            await workflow.get_weather('Oslo')
+            opened = workflow.weather_service._http
+            await workflow.aclose()
+            return opened, workflow.weather_service._http
+
+        opened, after = self.run_with_workflow(use)
+        self.assertIsNotNone(opened)
+        self.assertTrue(opened.is_closed)
+        self.assertIsNone(after)
+
+
+if __name__ == '__main__':
+    unittest.main()
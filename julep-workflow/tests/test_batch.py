@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+import unittest
+
+from batch import Checkpoint, parse_restrictions, read_jobs, run_batch
+from fake_backends import OpenMeteoStub
+from tests.support import fake_julep, fake_workflow
+
+
+class ReadJobsTest(unittest.TestCase):
+    def test_parses_restrictions(self):
+        self.assertEqual(parse_restrictions('Vegan; Gluten-free|Halal', ['None']), ['Vegan', 'Gluten-free', 'Halal'])
+        self.assertEqual(parse_restrictions([' Vegan ', ''], ['None']), ['Vegan'])
+        self.assertEqual(parse_restrictions(' ', ['None']), ['None'])
+        self.assertEqual(parse_restrictions(None, ['Vegan']), ['Vegan'])
+
+    def test_reads_jsonl_rows_with_overrides(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cities.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'city': ' Oslo '}) + "\n\n")
+                f.write(json.dumps({'city': 'Rome', 'dining_preference': 'Outdoor',
+                                    'dietary_restrictions': ['Vegan']}) + "\n")
+            jobs = list(read_jobs(path, 'Indoor', ['None']))
+        self.assertEqual(jobs, [(0, 'Oslo', 'Indoor', ['None']), (1, '', 'Indoor', ['None']),
+                                (2, 'Rome', 'Outdoor', ['Vegan'])])
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'tours.jsonl.checkpoint')
+
+    def test_watermark_advances_over_contiguous_rows(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.mark_done(2)
+        checkpoint.mark_done(1)
+        self.assertEqual((checkpoint.watermark, checkpoint.completed), (0, {1, 2}))
+        self.assertFalse(checkpoint.is_done(0))
+        self.assertTrue(checkpoint.is_done(2))
+
+        checkpoint.mark_done(0)
+        self.assertEqual((checkpoint.watermark, checkpoint.completed), (3, set()))
+
+    def test_state_survives_a_restart(self):
+        checkpoint = Checkpoint(self.path)
+        for index in (0, 1, 3):
+            checkpoint.mark_done(index)
+
+        reloaded = Checkpoint(self.path)
+        self.assertEqual((reloaded.watermark, reloaded.completed), (2, {3}))
+        self.assertEqual([reloaded.is_done(index) for index in range(5)], [True, True, False, True, False])
+
+
+class RunBatchTest(unittest.TestCase):
+    cities = ['Oslo', '', 'Rome', 'Lima']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.stub = OpenMeteoStub().start()
+        self.addCleanup(self.stub.stop)
+        self.julep = fake_julep()
+
+        self.input_path = os.path.join(self.directory, 'cities.csv')
+        self.output_path = os.path.join(self.directory, 'tours.jsonl')
+        with open(self.input_path, 'w', encoding='utf-8') as f:
+            f.write("city,dining_preference\n" + "".join(f"{city},Outdoor\n" for city in self.cities))
+
+    def run_batch(self):
+        workflow = fake_workflow(self.julep, self.stub, self.directory)
+        return run_batch(workflow, self.input_path, self.output_path, max_concurrency=2)
+
+    def records(self):
+        with open(self.output_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_rerun_skips_completed_rows(self):
+        summary = self.run_batch()
+        self.assertEqual((summary['ok'], summary['error'], summary['invalid']), (3, 0, 1))
+        self.assertEqual(sorted(record['index'] for record in self.records()), [0, 2, 3])
+
+        executions = self.julep.calls['executions.create']
+        summary = self.run_batch()
+        self.assertEqual((summary['processed'], summary['skipped']), (0, 4))
+        self.assertEqual(len(self.records()), 3)
+        self.assertEqual(self.julep.calls['executions.create'], executions)
+
+    def test_resumes_after_an_interruption(self):
+        # As left behind by a run stopped after Oslo and the blank row
+        checkpoint = Checkpoint(f"{self.output_path}.checkpoint")
+        checkpoint.mark_done(0)
+        checkpoint.mark_done(1)
+
+        summary = self.run_batch()
+        self.assertEqual((summary['processed'], summary['skipped']), (2, 2))
+        self.assertEqual({record['city'] for record in self.records()}, {'Rome', 'Lima'})
+        self.assertEqual(Checkpoint(checkpoint.path).watermark, len(self.cities))
+
+
+if __name__ == '__main__':
+    unittest.main()
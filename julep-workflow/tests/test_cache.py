@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cache import DiskCache, LRUCache, TieredCache, TTLCache, normalize_city
+
+
+class NormalizeCityTest(unittest.TestCase):
+    def test_folds_case_whitespace_and_diacritics(self):
+        self.assertEqual(normalize_city('  São   Paulo '), 'sao paulo')
+        self.assertEqual(normalize_city('ZÜRICH'), normalize_city('zurich'))
+        self.assertNotEqual(normalize_city('Paris'), normalize_city('Parish'))
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evicts_the_least_recently_used_entry(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c'), len(cache)), (1, 3, 2))
+
+    def test_pop_and_clear(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertEqual(cache.get('a', 'missing'), 'missing')
+        cache.set('b', 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_entries_expire_at_the_end_of_their_window(self):
+        with mock.patch('cache.time.time', return_value=1000.0) as now:
+            cache = TTLCache(ttl=900)
+            cache.set('oslo', 'sunny')
+            now.return_value = 1799.0
+            self.assertEqual(cache.get('oslo'), 'sunny')
+            # The window ends at the next multiple of ttl, not ttl seconds after set()
+            now.return_value = 1800.0
+            self.assertIsNone(cache.get('oslo'))
+            self.assertEqual(len(cache), 0)
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def test_values_persist_across_instances(self):
+        DiskCache(self.path).set('oslo', ['Lutefisk', 'Brunost'])
+        self.assertEqual(DiskCache(self.path).get('oslo'), ['Lutefisk', 'Brunost'])
+        self.assertIsNone(DiskCache(self.path).get('rome'))
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch('cache.time.time', return_value=1000.0) as now:
+            cache = DiskCache(self.path, ttl=60)
+            cache.set('oslo', 'value')
+            now.return_value = 1060.0
+            self.assertEqual(cache.get_entry('oslo'), ('value', 1000.0))
+            now.return_value = 1061.0
+            self.assertIsNone(cache.get('oslo'))
+            self.assertEqual(len(cache), 0)
+
+    def test_evicts_least_recently_used_entries_over_max_bytes(self):
+        with mock.patch('cache.time.time', return_value=1000.0) as now:
+            # Each value takes 10 bytes as JSON, so only two fit
+            cache = DiskCache(self.path, max_bytes=25)
+            cache.set('a', 'x' * 8)
+            now.return_value += 1
+            cache.set('b', 'y' * 8)
+            now.return_value += 1
+            cache.get('a')
+            now.return_value += 1
+            cache.set('c', 'z' * 8)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), ('x' * 8, None, 'z' * 8))
+
+
+class TieredCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def test_promotes_disk_hits_to_memory(self):
+        TieredCache(DiskCache(self.path)).set('oslo', 'value')
+        cache = TieredCache(DiskCache(self.path))
+        self.assertEqual((cache.get('oslo'), cache.get('oslo'), cache.get('rome')), ('value', 'value', None))
+        stats = cache.stats()
+        self.assertEqual((stats['disk_hits'], stats['memory_hits'], stats['misses']), (1, 1, 1))
+        self.assertAlmostEqual(cache.hit_ratio(), 2 / 3)
+
+    def test_promoted_entries_expire_with_their_disk_entry(self):
+        with mock.patch('cache.time.time', return_value=1000.0) as now:
+            TieredCache(DiskCache(self.path, ttl=60)).set('oslo', 'value')
+            now.return_value = 1050.0
+            cache = TieredCache(DiskCache(self.path, ttl=60))
+            self.assertEqual(cache.get('oslo'), 'value')
+            # 61s after the value was stored, although only 11s after it was promoted
+            now.return_value = 1061.0
+            self.assertIsNone(cache.get('oslo'))
+
+    def test_delete_removes_both_tiers(self):
+        cache = TieredCache(DiskCache(self.path))
+        cache.set('oslo', 'value')
+        cache.delete('oslo')
+        self.assertIsNone(cache.get('oslo'))
+        self.assertIsNone(DiskCache(self.path).get('oslo'))
+
+
+if __name__ == '__main__':
+    unittest.main()
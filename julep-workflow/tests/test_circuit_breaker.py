@@ -0,0 +1,83 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, is_backend_failure
+
+
+def http_error(status: int) -> Exception:
+    error = Exception(f"HTTP {status}")
+    error.response = SimpleNamespace(status_code=status)
+    return error
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('circuit_breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=10)
+
+    def fail(self, times: int = 1):
+        for _ in range(times):
+            with self.assertRaises(ConnectionError):
+                with self.breaker.guard():
+                    raise ConnectionError("backend down")
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpen):
+            with self.breaker.guard():
+                pass
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_success_resets_the_failure_count(self):
+        self.fail(2)
+        with self.breaker.guard():
+            pass
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_probe_success_closes(self):
+        self.fail(3)
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # Only the probe goes through while half-open
+        self.assertFalse(self.breaker.allow())
+        self.breaker.on_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_probe_failure_reopens(self):
+        self.fail(3)
+        self.now += 10
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 5
+        self.assertFalse(self.breaker.allow())
+
+    def test_lost_probe_is_replaced_after_reset_timeout(self):
+        self.fail(3)
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.now += 10
+        self.assertTrue(self.breaker.allow())
+
+    def test_client_errors_and_throttling_do_not_count(self):
+        self.assertFalse(is_backend_failure(http_error(404)))
+        self.assertFalse(is_backend_failure(http_error(429)))
+        self.assertFalse(is_backend_failure(ValueError("bad JSON")))
+        self.assertTrue(is_backend_failure(http_error(503)))
+        self.assertTrue(is_backend_failure(TimeoutError()))
+
+        for _ in range(5):
+            self.breaker.record(http_error(429))
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from cache import DiskCache, TieredCache
+from cuisine_agent import CuisineAgent, placeholder_dishes, placeholder_restaurants
+from tests.support import fake_cuisine_agent, fake_julep
+
+OSLO_DISHES = ['Oslo Dumplings', 'Oslo Stew', 'Oslo Pastry']
+
+
+class ParseCuisineJsonTest(unittest.TestCase):
+    parse = staticmethod(CuisineAgent._parse_cuisine_json)
+
+    def test_parses_dishes_and_restaurants(self):
+        text = "Here you go:\n" + json.dumps({'dishes': [
+            {'dish': ' Lutefisk ', 'restaurant': 'Fiskeriet'},
+            {'dish': 'Brunost', 'restaurant': 'Mathallen'},
+        ]}) + "\nEnjoy!"
+        self.assertEqual(self.parse(text), (['Lutefisk', 'Brunost'], ['Lutefisk - Fiskeriet', 'Brunost - Mathallen']))
+
+    def test_keeps_at_most_three_dishes(self):
+        entries = [{'dish': f"Dish {i}", 'restaurant': f"Place {i}"} for i in range(5)]
+        dishes, restaurants = self.parse(json.dumps({'dishes': entries}))
+        self.assertEqual(dishes, ['Dish 0', 'Dish 1', 'Dish 2'])
+        self.assertEqual(len(restaurants), 3)
+
+    def test_rejects_unusable_responses(self):
+        for text in [
+            "No JSON here",
+            "{not json}",
+            json.dumps(['Lutefisk']),
+            json.dumps({'dishes': []}),
+            json.dumps({'dishes': 'Lutefisk'}),
+            json.dumps({'dishes': ['Lutefisk']}),
+            json.dumps({'dishes': [{'dish': 'Lutefisk'}]}),
+            json.dumps({'dishes': [{'dish': 'Lutefisk', 'restaurant': '  '}]}),
+            json.dumps({'dishes': [{'dish': 'Lutefisk', 'restaurant': 42}]}),
+        ]:
+            with self.subTest(text=text):
+                self.assertIsNone(self.parse(text))
+
+
+class CuisineAgentTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def agent(self, execution_latency: float = 0.05, **options) -> CuisineAgent:
+        self.julep = fake_julep(execution_latency)
+        return fake_cuisine_agent(self.julep, self.directory, **options)
+
+    def test_two_step_lookup(self):
+        agent = self.agent()
+        dishes = agent.get_local_dishes('Oslo')
+        self.assertEqual(dishes, OSLO_DISHES)
+        self.assertEqual(agent.find_restaurants('Oslo', dishes)[0], 'Oslo Dumplings - Oslo Kitchen No. 1')
+        self.assertEqual(self.julep.calls['executions.create'], 2)
+
+    def test_fused_lookup_takes_one_execution(self):
+        agent = self.agent()
+        dishes, restaurants = agent.get_dishes_and_restaurants('Oslo')
+        self.assertEqual(dishes, OSLO_DISHES)
+        self.assertEqual(restaurants, [f"{dish} - Oslo Kitchen No. {i + 1}" for i, dish in enumerate(dishes)])
+        self.assertEqual(self.julep.calls['executions.create'], 1)
+
+    def test_unusable_fused_answer_falls_back_to_two_steps(self):
+        agent = self.agent()
+        respond = self.julep.respond
+
+        def garbled(task_name, execution_input):
+            if task_name == 'Get Dishes And Restaurants':
+                return "Sorry, I can't answer in JSON today."
+            return respond(task_name, execution_input)
+
+        with mock.patch.object(self.julep, 'respond', side_effect=garbled):
+            dishes, restaurants = agent.get_dishes_and_restaurants('Oslo')
+        self.assertEqual(dishes, OSLO_DISHES)
+        self.assertEqual(restaurants[0], 'Oslo Dumplings - Oslo Kitchen No. 1')
+        self.assertEqual(self.julep.calls['executions.create'], 3)
+
+    def test_concurrent_callers_share_one_execution(self):
+        agent = self.agent(execution_latency=0.3)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(agent.get_local_dishes, ['Oslo', 'oslo', ' OSLO', 'Oslo', 'Oslo']))
+        self.assertEqual(results, [OSLO_DISHES] * 5)
+        self.assertEqual(self.julep.calls['executions.create'], 1)
+
+    def test_each_caller_waits_only_for_its_own_timeout(self):
+        agent = self.agent(execution_latency=1.0)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            patient = executor.submit(agent.get_local_dishes, 'Oslo')
+            hurried = executor.submit(agent.get_local_dishes, 'Oslo', timeout=0.1)
+            self.assertEqual(hurried.result(), placeholder_dishes('Oslo'))
+            self.assertEqual(patient.result(), OSLO_DISHES)
+        self.assertEqual(self.julep.calls['executions.create'], 1)
+
+    def test_falls_back_after_completion_timeout(self):
+        agent = self.agent(execution_latency=5.0)
+        agent.completion_timeout = 0.2
+        self.assertEqual(agent.get_local_dishes('Oslo'), placeholder_dishes('Oslo'))
+
+
+class CuisineCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.julep = fake_julep()
+
+    def agent(self, **options) -> CuisineAgent:
+        cache = TieredCache(DiskCache(os.path.join(self.directory, 'cuisine.sqlite3')))
+        return fake_cuisine_agent(self.julep, self.directory, use_cache=True, cache=cache, **options)
+
+    def test_cached_answers_need_no_execution(self):
+        dishes = self.agent().get_local_dishes('Oslo')
+        self.agent().find_restaurants('Oslo', dishes)
+        executions = self.julep.calls['executions.create']
+
+        # A new process, and a differently written city name
+        agent = self.agent()
+        self.assertEqual(agent.get_local_dishes(' OSLO '), dishes)
+        self.assertEqual(len(agent.find_restaurants('oslo', dishes)), 3)
+        self.assertEqual(self.julep.calls['executions.create'], executions)
+
+    def test_refresh_bypasses_the_cache(self):
+        agent = self.agent()
+        agent.get_local_dishes('Oslo')
+        agent.get_local_dishes('Oslo', refresh=True)
+        self.assertEqual(self.julep.calls['executions.create'], 2)
+
+    def test_fallbacks_are_not_cached(self):
+        self.julep.failure_rate = 1.0
+        agent = self.agent()
+        self.assertEqual(agent.get_local_dishes('Oslo'), placeholder_dishes('Oslo'))
+        self.julep.failure_rate = 0.0
+        self.assertEqual(agent.get_local_dishes('Oslo'), OSLO_DISHES)
+
+    def test_placeholder_dishes_get_placeholder_restaurants_without_an_execution(self):
+        agent = self.agent()
+        dishes = placeholder_dishes('Oslo')
+        self.assertEqual(agent.find_restaurants('Oslo', dishes), placeholder_restaurants(dishes))
+        self.assertEqual(self.julep.calls['executions.create'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+
+from deadline import Deadline
+
+
+class DeadlineTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('deadline.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_each_stage_gets_its_share_of_the_budget(self):
+        deadline = Deadline(10)
+        self.assertEqual(deadline.timeout_for('weather'), 2.0)
+        self.assertEqual(deadline.timeout_for('dishes'), 2.5)
+        self.assertEqual(deadline.timeout_for('tour_narrative'), 5.0)
+        # Stages without a share may use whatever is left
+        self.assertEqual(deadline.timeout_for('other'), 10.0)
+
+    def test_stages_never_wait_past_the_overall_deadline(self):
+        deadline = Deadline(10)
+        self.now += 8.5
+        self.assertEqual(deadline.remaining(), 1.5)
+        self.assertEqual(deadline.timeout_for('tour_narrative'), 1.5)
+        self.assertFalse(deadline.expired())
+
+        self.now += 5
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertEqual(deadline.timeout_for('weather'), 0.0)
+        self.assertTrue(deadline.expired())
+
+    def test_custom_shares(self):
+        deadline = Deadline(4, shares={'weather': 0.5})
+        self.assertEqual(deadline.timeout_for('weather'), 2.0)
+        self.assertEqual(deadline.timeout_for('dishes'), 4.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
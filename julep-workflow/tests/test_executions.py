@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import CircuitBreaker
+from executions import ExecutionPoller, run_execution
+from rate_limiter import AdaptiveRateLimiter
+from tests.support import fake_julep
+
+
+class FlakyLimiter(AdaptiveRateLimiter):
+    """Rate limiter whose first few acquire() calls raise"""
+
+    def __init__(self, failures: int):
+        super().__init__('test', rate=1000, burst=1000)
+        self.failures = failures
+
+    def acquire(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("limiter broke")
+        return super().acquire(*args, **kwargs)
+
+
+class ExecutionPollerTest(unittest.TestCase):
+    def setUp(self):
+        self.julep = fake_julep(execution_latency=0.3)
+        self.task_id = self.julep.tasks.create(agent_id='agent', name='Get Local Dishes').id
+
+    def poller(self, rate_limiter: AdaptiveRateLimiter = None) -> ExecutionPoller:
+        return ExecutionPoller(self.julep, initial_interval=0.05, max_interval=0.2,
+                               rate_limiter=rate_limiter or AdaptiveRateLimiter('test', rate=1000, burst=1000),
+                               breaker=CircuitBreaker('test'))
+
+    def start(self, city: str = 'Oslo') -> str:
+        return self.julep.executions.create(task_id=self.task_id, input={'city': city}).id
+
+    def poller_threads(self) -> int:
+        return sum(thread.name == 'execution-poller' for thread in threading.enumerate())
+
+    def test_resolves_executions_with_backoff(self):
+        poller = self.poller()
+        result = poller.wait(self.start(), timeout=5)
+        self.assertEqual(result.status, 'succeeded')
+        self.assertEqual(result.output['choices'][0]['message']['content'].splitlines()[0], 'Oslo Dumplings')
+        # Polling every 50ms for 300ms would take 6 calls; backing off takes fewer
+        self.assertLessEqual(self.julep.calls['executions.get'], 5)
+
+    def test_one_thread_polls_every_execution(self):
+        poller = self.poller()
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            futures = [executor.submit(poller.wait, self.start(f"City {i}"), 5) for i in range(10)]
+            time.sleep(0.1)
+            self.assertEqual(self.poller_threads(), 1)
+            self.assertTrue(all(future.result().status == 'succeeded' for future in futures))
+
+    def test_thread_restarts_after_going_idle(self):
+        poller = self.poller()
+        poller.wait(self.start(), timeout=5)
+        for _ in range(50):
+            if poller._thread is None:
+                break
+            time.sleep(0.01)
+        self.assertIsNone(poller._thread)
+        self.assertEqual(poller.wait(self.start('Rome'), timeout=5).status, 'succeeded')
+
+    def test_survives_a_failing_poll(self):
+        poller = self.poller(FlakyLimiter(failures=2))
+        self.assertEqual(poller.wait(self.start(), timeout=5).status, 'succeeded')
+
+    def test_fails_waiters_and_recovers_once_the_executor_is_shut_down(self):
+        poller = self.poller()
+        poller._get_executor().shutdown()
+        with self.assertRaisesRegex(RuntimeError, "shutdown"):
+            poller.wait(self.start(), timeout=5)
+        self.assertEqual(poller.outstanding(), 0)
+
+        poller._executor = None
+        for _ in range(50):
+            if poller._thread is None:
+                break
+            time.sleep(0.01)
+        self.assertEqual(poller.wait(self.start('Rome'), timeout=5).status, 'succeeded')
+
+    def test_wait_times_out_and_stops_tracking(self):
+        poller = self.poller()
+        with self.assertRaises(TimeoutError):
+            poller.wait(self.start(), timeout=0.05)
+        self.assertEqual(poller.outstanding(), 0)
+
+
+class RunExecutionTest(unittest.TestCase):
+    def setUp(self):
+        self.julep = fake_julep(execution_latency=0.5)
+        self.task_id = self.julep.tasks.create(agent_id='agent', name='Get Local Dishes').id
+        self.poller = ExecutionPoller(self.julep, initial_interval=0.05,
+                                      rate_limiter=AdaptiveRateLimiter('test', rate=1000, burst=1000),
+                                      breaker=CircuitBreaker('test'))
+
+    def test_timed_out_execution_is_cancelled_without_on_late(self):
+        with self.assertRaises(TimeoutError):
+            run_execution(self.poller, self.task_id, {'city': 'Oslo'}, task='dishes', timeout=0.1)
+        time.sleep(0.1)
+        self.assertEqual(self.julep.calls['executions.change_status'], 1)
+
+    def test_timed_out_execution_is_handed_to_on_late(self):
+        finished = threading.Event()
+        late = []
+
+        def on_late(result):
+            late.append(result.status)
+            finished.set()
+
+        with self.assertRaises(TimeoutError):
+            run_execution(self.poller, self.task_id, {'city': 'Oslo'}, task='dishes', timeout=0.1,
+                          on_late=on_late)
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(late, ['succeeded'])
+        self.assertEqual(self.julep.calls['executions.change_status'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_backends import OpenMeteoStub
+from geocode_cache import GeocodeCache
+from tests.support import fake_weather_service
+
+
+class GeocodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(directory.name, 'geocode.sqlite3')
+
+    def test_normalised_names_share_an_entry(self):
+        cache = GeocodeCache(self.path)
+        cache.set('São Paulo', -23.55, -46.63)
+        self.assertEqual(cache.get('  sao PAULO '), (-23.55, -46.63))
+        self.assertIsNone(cache.get('Rio de Janeiro'))
+        self.assertEqual(len(cache), 1)
+
+    def test_entries_persist_across_instances(self):
+        GeocodeCache(self.path).set('Oslo', 59.91, 10.75)
+        reloaded = GeocodeCache(self.path)
+        self.assertEqual(reloaded.get('Oslo'), (59.91, 10.75))
+        self.assertEqual(reloaded.get('Oslo'), (59.91, 10.75))
+        stats = reloaded.stats()
+        self.assertEqual((stats['entries'], stats['disk_hits'], stats['memory_hits'], stats['misses']), (1, 1, 1, 0))
+
+    def test_counts_concurrent_lookups_exactly(self):
+        cache = GeocodeCache(self.path)
+        cache.set('Oslo', 59.91, 10.75)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: cache.get('Oslo' if i % 2 else f"Nowhere {i}"), range(400)))
+        stats = cache.stats()
+        self.assertEqual(stats['memory_hits'] + stats['disk_hits'], 200)
+        self.assertEqual(stats['misses'], 200)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_preload_skips_cached_and_unresolvable_cities(self):
+        cache = GeocodeCache(self.path)
+        cache.set('Oslo', 59.91, 10.75)
+        resolved = []
+
+        def resolve(city):
+            resolved.append(city)
+            return (None, None) if city == 'Atlantis' else (1.0, 2.0)
+
+        self.assertEqual(cache.preload(['Oslo', 'Rome', ' ', 'Atlantis'], resolve), 1)
+        self.assertEqual(resolved, ['Rome', 'Atlantis'])
+        self.assertEqual(cache.get('Rome'), (1.0, 2.0))
+
+    def test_weather_service_geocodes_each_city_once_across_runs(self):
+        stub = OpenMeteoStub().start()
+        self.addCleanup(stub.stop)
+        fake_weather_service(stub, self.directory).get_weather('Oslo')
+        requests = stub.requests
+        # Stored in the (initially empty) cache the service was given
+        self.assertEqual(len(GeocodeCache(self.path)), 1)
+
+        # A new process with an empty weather cache only needs the forecast
+        fake_weather_service(stub, self.directory).get_weather('oslo')
+        self.assertEqual(stub.requests, requests + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from cuisine_agent import placeholder_restaurants
+from fake_backends import OpenMeteoStub
+from knowledge_pack import KnowledgePack, build_pack
+from tests.support import fake_cuisine_agent, fake_julep, fake_weather_service
+
+OSLO_DISHES = ['Oslo Dumplings', 'Oslo Stew', 'Oslo Pastry']
+
+
+class KnowledgePackTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'pack.sqlite3')
+        self.stub = OpenMeteoStub().start()
+        self.addCleanup(self.stub.stop)
+        self.julep = fake_julep()
+
+    def build(self, cities, **options):
+        return build_pack(self.path, cities, fake_weather_service(self.stub, self.directory),
+                          fake_cuisine_agent(self.julep, self.directory), **options)
+
+    def fail_restaurant_executions(self):
+        create = self.julep.executions.create
+
+        def create_failing(task_id, input):
+            execution = create(task_id=task_id, input=input)
+            if self.julep.task_definitions[task_id]['name'] == 'Find Restaurants':
+                self.julep.execution_state[execution.id]['failed'] = True
+            return execution
+
+        patcher = mock.patch.object(self.julep.executions, 'create', side_effect=create_failing)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_serves_what_build_pack_looked_up(self):
+        summary = self.build(['Oslo', 'Rome', ' Oslo ', ''], version='test')
+        self.assertEqual((summary['requested'], summary['cities'], summary['with_cuisine']), (2, 2, 2))
+
+        pack = KnowledgePack(self.path)
+        self.assertEqual(pack.info()['version'], 'test')
+        dishes, restaurants = pack.cuisine(' OSLO ')
+        self.assertEqual(dishes, OSLO_DISHES)
+        self.assertEqual(restaurants[0], 'Oslo Dumplings - Oslo Kitchen No. 1')
+        self.assertEqual(len(pack.coordinates('Rome')), 2)
+        self.assertIsNone(pack.coordinates('Lima'))
+        self.assertIsNone(pack.cuisine('Lima'))
+
+    def test_cities_without_real_restaurants_get_coordinates_only(self):
+        self.fail_restaurant_executions()
+        summary = self.build(['Oslo'])
+        self.assertEqual((summary['cities'], summary['with_cuisine']), (1, 0))
+
+        pack = KnowledgePack(self.path)
+        self.assertIsNotNone(pack.coordinates('Oslo'))
+        self.assertIsNone(pack.cuisine('Oslo'))
+        # The live lookup really did fall back to placeholder restaurants
+        agent = fake_cuisine_agent(self.julep, self.directory)
+        self.assertEqual(agent.find_restaurants('Oslo', OSLO_DISHES), placeholder_restaurants(OSLO_DISHES))
+
+    def test_answers_before_the_live_lookups(self):
+        self.build(['Oslo'])
+        pack = KnowledgePack(self.path)
+        requests, executions = self.stub.requests, self.julep.calls['executions.create']
+
+        agent = fake_cuisine_agent(self.julep, self.directory, knowledge_pack=pack, use_knowledge_pack=True)
+        self.assertEqual(agent.get_local_dishes('oslo'), OSLO_DISHES)
+        self.assertEqual(agent.find_restaurants('oslo', OSLO_DISHES)[0], 'Oslo Dumplings - Oslo Kitchen No. 1')
+        self.assertEqual(self.julep.calls['executions.create'], executions)
+
+        empty_cache_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(empty_cache_directory.cleanup)
+        weather = fake_weather_service(self.stub, empty_cache_directory.name, knowledge_pack=pack,
+                                       use_knowledge_pack=True)
+        self.assertEqual(weather._get_coordinates('Oslo'), pack.coordinates('Oslo'))
+        self.assertEqual(self.stub.requests, requests)
+
+    def test_missing_or_incompatible_packs_are_empty(self):
+        self.assertIsNone(KnowledgePack(self.path).coordinates('Oslo'))
+        self.assertEqual(KnowledgePack(self.path).info(), {})
+
+        self.build(['Oslo'])
+        conn = sqlite3.connect(self.path)
+        with conn:
+            conn.execute("UPDATE meta SET value = '0' WHERE key = 'format'")
+        conn.close()
+        self.assertIsNone(KnowledgePack(self.path).coordinates('Oslo'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from rate_limiter import AdaptiveRateLimiter, get_limiter, is_throttle_error
+
+
+class AdaptiveRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('rate_limiter.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def limiter(self, **options) -> AdaptiveRateLimiter:
+        options = {'rate': 10.0, 'burst': 5, 'min_rate': 1.0, 'max_rate': 20.0, **options}
+        return AdaptiveRateLimiter('test', **options)
+
+    def test_allows_a_burst_then_the_refill_rate(self):
+        limiter = self.limiter()
+        self.assertEqual([limiter.try_acquire() for _ in range(5)], [0.0] * 5)
+        self.assertAlmostEqual(limiter.try_acquire(), 0.1)
+        self.now += 0.1
+        self.assertEqual(limiter.try_acquire(), 0.0)
+        self.assertGreater(limiter.try_acquire(), 0.0)
+
+    def test_throttling_halves_the_rate_once_per_cooldown(self):
+        limiter = self.limiter()
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 5.0)
+        self.assertAlmostEqual(limiter.try_acquire(), 0.2)
+        # Responses that were already in flight count as one throttle
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 5.0)
+
+        self.now += 1.0
+        limiter.on_throttle()
+        self.assertEqual(limiter.rate, 2.5)
+        for _ in range(3):
+            self.now += 1.0
+            limiter.on_throttle()
+        self.assertEqual(limiter.rate, 1.0)
+        self.assertEqual(limiter.stats()['throttled'], 6)
+
+    def test_successes_raise_the_rate_up_to_max_rate(self):
+        limiter = self.limiter(rate=4.0)
+        limiter.on_success()
+        self.assertAlmostEqual(limiter.rate, 4.25)
+        for _ in range(1000):
+            limiter.on_success()
+        self.assertEqual(limiter.rate, 20.0)
+
+    def test_recognises_throttle_errors(self):
+        self.assertTrue(is_throttle_error(SimpleNamespace(status_code=429)))
+        self.assertTrue(is_throttle_error(SimpleNamespace(response=SimpleNamespace(status_code=503))))
+        self.assertFalse(is_throttle_error(SimpleNamespace(status_code=500)))
+        self.assertFalse(is_throttle_error(ValueError()))
+
+
+class BlockingAcquireTest(unittest.TestCase):
+    def test_acquire_waits_for_a_token(self):
+        limiter = AdaptiveRateLimiter('test', rate=20.0, burst=1)
+        started = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertEqual(limiter.stats()['queue_depth'], 0)
+
+    def test_acquire_async_waits_on_the_event_loop(self):
+        limiter = AdaptiveRateLimiter('test', rate=20.0, burst=1)
+
+        async def main():
+            started = time.monotonic()
+            await asyncio.gather(*(limiter.acquire_async() for _ in range(3)))
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(main()), 0.09)
+
+    def test_backends_share_one_limiter_per_process(self):
+        self.assertIs(get_limiter('julep'), get_limiter('julep'))
+        self.assertIsNot(get_limiter('julep'), get_limiter('open-meteo'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import itertools
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from fake_backends import FakeNotFound
+from registry import AgentRegistry, is_not_found
+from tests.support import fake_cuisine_agent, fake_julep, fake_tour_planner
+
+_ids = itertools.count(1)
+
+AGENT = {'name': 'Foodie Agent', 'model': 'gpt-4o'}
+TASK = {'name': 'Get Local Dishes', 'main': [{'prompt': 'Dishes of {{city}}'}]}
+
+
+class CountingClient:
+    """Creates agents and tasks with fresh IDs, slowly, and counts the calls"""
+
+    def __init__(self, api_key: str = 'key', base_url: str = 'https://api.julep.ai'):
+        self.api_key, self.base_url = api_key, base_url
+        self.created = []
+        self._lock = threading.Lock()
+        self.agents = SimpleNamespace(create=lambda **definition: self._create('agent'))
+        self.tasks = SimpleNamespace(create=lambda agent_id, **definition: self._create('task'))
+
+    def _create(self, kind: str):
+        time.sleep(0.05)
+        with self._lock:
+            self.created.append(kind)
+            return SimpleNamespace(id=f"{kind}-{next(_ids)}")
+
+
+class AgentRegistryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'registry.json')
+
+    def test_reuses_ids_across_instances(self):
+        client = CountingClient()
+        agent = AgentRegistry(self.path).get_or_create_agent(client, **AGENT)
+        task = AgentRegistry(self.path).get_or_create_task(client, agent.id, TASK)
+
+        reloaded = AgentRegistry(self.path)
+        self.assertEqual(reloaded.get_or_create_agent(client, **AGENT).id, agent.id)
+        self.assertEqual(reloaded.get_or_create_task(client, agent.id, TASK).id, task.id)
+        self.assertEqual(client.created, ['agent', 'task'])
+
+    def test_a_changed_definition_gets_a_new_id(self):
+        registry, client = AgentRegistry(self.path), CountingClient()
+        first = registry.get_or_create_agent(client, **AGENT)
+        second = registry.get_or_create_agent(client, **dict(AGENT, model='gpt-4o-mini'))
+        self.assertNotEqual(first.id, second.id)
+        self.assertEqual(registry.get_or_create_agent(client, **AGENT).id, first.id)
+
+    def test_ids_are_scoped_by_account_and_deployment(self):
+        registry = AgentRegistry(self.path)
+        clients = [CountingClient('key-a'), CountingClient('key-b'), CountingClient('key-a', 'http://localhost')]
+        ids = {registry.get_or_create_agent(client, **AGENT).id for client in clients}
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(registry.get_or_create_agent(CountingClient('key-a'), **AGENT).id,
+                         registry.get_or_create_agent(clients[0], **AGENT).id)
+        # API keys are only stored hashed
+        with open(self.path, encoding='utf-8') as f:
+            self.assertNotIn('key-a', f.read())
+
+    def test_concurrent_callers_create_one_resource(self):
+        registry, client = AgentRegistry(self.path), CountingClient()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            ids = list(executor.map(lambda _: registry.get_or_create_agent(client, **AGENT).id, range(8)))
+        self.assertEqual(len(set(ids)), 1)
+        self.assertEqual(client.created, ['agent'])
+        self.assertEqual(AgentRegistry(self.path).get_or_create_agent(client, **AGENT).id, ids[0])
+
+    def test_picks_up_resources_created_by_another_process(self):
+        first, second, client = AgentRegistry(self.path), AgentRegistry(self.path), CountingClient()
+        agent = first.get_or_create_agent(client, **AGENT)
+        self.assertEqual(second.get_or_create_agent(client, **AGENT).id, agent.id)
+        self.assertEqual(client.created, ['agent'])
+
+    def test_forget_recreates_on_next_use(self):
+        registry, client = AgentRegistry(self.path), CountingClient()
+        agent = registry.get_or_create_agent(client, **AGENT)
+        registry.forget(agent.id)
+        self.assertNotEqual(AgentRegistry(self.path).get_or_create_agent(client, **AGENT).id, agent.id)
+
+    def test_recognises_not_found_errors(self):
+        self.assertTrue(is_not_found(FakeNotFound("gone")))
+        response_error = Exception("gone")
+        response_error.response = SimpleNamespace(status_code=404)
+        self.assertTrue(is_not_found(response_error))
+        self.assertFalse(is_not_found(RuntimeError("boom")))
+
+
+class LostResourceTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.julep = fake_julep()
+
+    def test_cuisine_agent_recreates_a_task_the_server_lost(self):
+        agent = fake_cuisine_agent(self.julep, self.directory)
+        agent.get_local_dishes('Oslo')
+        stale_id = agent.dishes_task.id
+        self.julep.task_definitions.pop(stale_id)
+
+        self.assertEqual(agent.get_local_dishes('Rome'), ['Rome Dumplings', 'Rome Stew', 'Rome Pastry'])
+        self.assertNotEqual(agent.dishes_task.id, stale_id)
+        # A fresh agent reading the same registry gets the new task too
+        self.assertEqual(fake_cuisine_agent(self.julep, self.directory).dishes_task.id, agent.dishes_task.id)
+
+    def test_tour_planner_recreates_a_task_the_server_lost(self):
+        planner = fake_tour_planner(self.julep, self.directory)
+        weather = {'temperature': 20, 'description': 'clear sky'}
+        planner.create_tour('Oslo', weather, 'outdoor', ['Oslo Kitchen'])
+        stale_id = planner.tour_task.id
+        self.julep.task_definitions.pop(stale_id)
+
+        narrative = planner.create_tour('Rome', weather, 'outdoor', ['Rome Kitchen'])
+        self.assertTrue(narrative.startswith('## Breakfast\nStart the day in Rome'))
+        self.assertNotEqual(planner.tour_task.id, stale_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
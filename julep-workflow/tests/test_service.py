@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from main import TourError
+from service import JobService, QueueFull, create_server, parse_job_request
+
+
+class FakeWorkflow:
+    """iter_workflow stand-in that waits for release before each city, and fails for Atlantis"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def iter_workflow(self, cities, dining_preference, dietary_restrictions, max_concurrency=None,
+                      latency_budget=None):
+        self.calls.append((cities, dining_preference, dietary_restrictions, latency_budget))
+        for city in cities:
+            self.release.wait(5)
+            if city == 'Atlantis':
+                yield TourError(city, LookupError("No such city"))
+            else:
+                yield {'city': city, 'tour_narrative': f"A day in {city}"}
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+
+class ParseJobRequestTest(unittest.TestCase):
+    def test_accepts_a_list_or_a_comma_separated_string(self):
+        self.assertEqual(parse_job_request({'cities': ['Oslo', ' Rome ', '']})['cities'], ['Oslo', 'Rome'])
+        self.assertEqual(parse_job_request({'city': 'Oslo, Rome'})['cities'], ['Oslo', 'Rome'])
+
+    def test_fills_in_defaults(self):
+        self.assertEqual(parse_job_request({'cities': 'Oslo'}), {
+            'cities': ['Oslo'],
+            'dining_preference': "Weather-based (Auto)",
+            'dietary_restrictions': ["None"],
+            'latency_budget': None
+        })
+        request = parse_job_request({'cities': 'Oslo', 'dietary_restrictions': 'Vegan; Halal', 'latency_budget': 5})
+        self.assertEqual(request['dietary_restrictions'], ['Vegan', 'Halal'])
+        self.assertEqual(request['latency_budget'], 5)
+
+    def test_rejects_unusable_requests(self):
+        for body in [
+            {},
+            {'cities': ' , '},
+            {'cities': {'name': 'Oslo'}},
+            {'cities': 'Oslo', 'latency_budget': True},
+            {'cities': 'Oslo', 'latency_budget': 0},
+            {'cities': 'Oslo', 'latency_budget': -2.5},
+            {'cities': 'Oslo', 'latency_budget': '5'},
+            {'cities': 'Oslo', 'latency_budget': float('nan')},
+            {'cities': 'Oslo', 'latency_budget': float('inf')},
+        ]:
+            with self.subTest(body=body), self.assertRaises(ValueError):
+                parse_job_request(body)
+
+
+class JobServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.workflow = FakeWorkflow()
+        self.service = JobService(self.workflow, workers=1, queue_size=1).start()
+        self.addCleanup(self.service.stop, 5)
+        self.addCleanup(self.workflow.release.set)
+
+    def test_runs_a_job_and_records_tours_and_errors(self):
+        job = self.service.submit(['Oslo', 'Atlantis'], 'Indoor', ['Vegan'], latency_budget=3)
+        self.workflow.release.set()
+        wait_for(lambda: self.service.get(job.id)['status'] == 'done')
+
+        result = self.service.get(job.id)
+        self.assertEqual([tour['city'] for tour in result['tours']], ['Oslo'])
+        self.assertEqual(result['errors'], [{'city': 'Atlantis', 'error': 'No such city', 'error_type': 'LookupError'}])
+        self.assertEqual(result['completed'], 2)
+        self.assertEqual(self.workflow.calls, [(['Oslo', 'Atlantis'], 'Indoor', ['Vegan'], 3)])
+
+    def test_rejects_jobs_once_the_queue_is_full(self):
+        running = self.service.submit(['Oslo'])
+        wait_for(lambda: self.service.get(running.id)['status'] == 'running')
+        self.service.submit(['Rome'])
+        with self.assertRaises(QueueFull):
+            self.service.submit(['Lima'])
+        self.assertEqual(self.service.stats()['busy_workers'], 1)
+        self.assertEqual(self.service.stats()['queue_depth'], 1)
+
+    def test_stop_cancels_queued_jobs(self):
+        running = self.service.submit(['Oslo'])
+        wait_for(lambda: self.service.get(running.id)['status'] == 'running')
+        queued = self.service.submit(['Rome'])
+
+        stopper = threading.Thread(target=self.service.stop, args=(5,))
+        stopper.start()
+        wait_for(lambda: self.service.get(queued.id)['status'] == 'cancelled')
+        with self.assertRaises(QueueFull):
+            self.service.submit(['Lima'])
+        self.workflow.release.set()
+        stopper.join(5)
+        self.assertEqual(self.service.get(running.id)['status'], 'done')
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.workflow = FakeWorkflow()
+        self.workflow.release.set()
+        service = JobService(self.workflow, workers=1).start()
+        self.addCleanup(service.stop, 5)
+        self.server = create_server(service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def request(self, path: str, body=None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url + path, data=data), timeout=5) as response:
+                return response.status, response.read().decode('utf-8'), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8'), e.headers
+
+    def test_queues_a_job_and_serves_its_results(self):
+        status, body, headers = self.request('/jobs', {'cities': 'Oslo, Rome'})
+        self.assertEqual(status, 202)
+        job_id = json.loads(body)['id']
+        self.assertEqual(headers['Location'], f"/jobs/{job_id}")
+
+        wait_for(lambda: json.loads(self.request(f"/jobs/{job_id}")[1])['status'] == 'done')
+        job = json.loads(self.request(f"/jobs/{job_id}")[1])
+        self.assertEqual([tour['city'] for tour in job['tours']], ['Oslo', 'Rome'])
+
+    def test_reports_bad_requests_and_unknown_jobs(self):
+        status, body, _ = self.request('/jobs', {'cities': 'Oslo', 'latency_budget': False})
+        self.assertEqual(status, 400)
+        self.assertIn('latency_budget', json.loads(body)['error'])
+        self.assertEqual(self.request('/jobs', ['Oslo'])[0], 400)
+        self.assertEqual(self.request('/jobs/missing')[0], 404)
+
+    def test_serves_health_and_metrics(self):
+        status, body, _ = self.request('/healthz')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['workers'], 1)
+        status, body, _ = self.request('/metrics')
+        self.assertEqual(status, 200)
+        self.assertIn('service_queue_depth', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flights, calls = SingleFlight(), []
+
+        def lookup(city):
+            calls.append(city)
+            time.sleep(0.2)
+            return city.upper()
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(flights.do, 'weather', 'oslo', lookup, 'oslo') for _ in range(5)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, ['OSLO'] * 5)
+        self.assertEqual(calls, ['oslo'])
+        self.assertEqual(flights.in_flight(), 0)
+
+    def test_kinds_and_keys_are_separate(self):
+        flights = SingleFlight()
+        self.assertEqual(flights.do('dishes', 'oslo', lambda: 1), 1)
+        self.assertEqual(flights.do('restaurants', 'oslo', lambda: 2), 2)
+        self.assertEqual(flights.do('dishes', 'rome', lambda: 3), 3)
+
+    def test_error_reaches_every_waiter_and_is_not_remembered(self):
+        flights, started = SingleFlight(), threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.2)
+            raise RuntimeError("lookup failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flights.do, 'weather', 'oslo', fail)
+            started.wait()
+            follower = executor.submit(flights.do, 'weather', 'oslo', lambda: 'not called')
+            for future in (leader, follower):
+                with self.assertRaisesRegex(RuntimeError, "lookup failed"):
+                    future.result()
+
+        self.assertEqual(flights.do('weather', 'oslo', lambda: 'retried'), 'retried')
+
+    def test_batch_claims_serve_waiting_callers(self):
+        flights = SingleFlight()
+        self.assertEqual(flights.start_many('weather', ['oslo', 'rome', 'oslo']), ['oslo', 'rome'])
+        self.assertEqual(flights.start_many('weather', ['oslo', 'lima']), ['lima'])
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiter = executor.submit(flights.do, 'weather', 'rome', lambda: 'not called')
+            time.sleep(0.1)
+            flights.finish_many('weather', ['oslo', 'rome'], lambda: ['sunny', 'rainy'])
+            self.assertEqual(waiter.result(timeout=5), 'rainy')
+        flights.finish_many('weather', ['lima'], lambda: ['cloudy'])
+        self.assertEqual(flights.in_flight(), 0)
+
+
+class AsyncSingleFlightTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flights, calls = AsyncSingleFlight(), []
+
+        async def lookup(city):
+            calls.append(city)
+            await asyncio.sleep(0.05)
+            return city.upper()
+
+        async def main():
+            return await asyncio.gather(*(flights.do('weather', 'oslo', lookup, 'oslo') for _ in range(5)))
+
+        self.assertEqual(asyncio.run(main()), ['OSLO'] * 5)
+        self.assertEqual(calls, ['oslo'])
+
+    def test_cancelled_caller_does_not_cancel_the_shared_call(self):
+        flights = AsyncSingleFlight()
+
+        async def lookup():
+            await asyncio.sleep(0.1)
+            return 'done'
+
+        async def main():
+            impatient = asyncio.ensure_future(flights.do('weather', 'oslo', lookup))
+            patient = asyncio.ensure_future(flights.do('weather', 'oslo', lookup))
+            await asyncio.sleep(0.01)
+            impatient.cancel()
+            return await patient
+
+        self.assertEqual(asyncio.run(main()), 'done')
+
+    def test_batch_claims_serve_waiting_callers(self):
+        flights = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return ['sunny', 'rainy']
+
+        async def main():
+            claimed = flights.start_many('weather', ['oslo', 'rome'])
+            waiter = asyncio.ensure_future(flights.do('weather', 'rome', fetch))
+            await flights.finish_many('weather', claimed, fetch)
+            return await waiter
+
+        self.assertEqual(asyncio.run(main()), 'rainy')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import unittest
+
+from stage_scheduler import Stage, StageScheduler
+
+
+class StageSchedulerTest(unittest.TestCase):
+    def test_passes_dependency_results_in_order(self):
+        scheduler = StageScheduler([
+            Stage('a', lambda: 1),
+            Stage('b', lambda: 2),
+            Stage('sum', lambda b, a: (b, a), depends_on=['b', 'a']),
+        ])
+        self.assertEqual(scheduler.run(), {'a': 1, 'b': 2, 'sum': (2, 1)})
+        self.assertEqual(set(scheduler.timings), {'a', 'b', 'sum'})
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        scheduler = StageScheduler([Stage('a', barrier.wait), Stage('b', barrier.wait)])
+        # Deadlocks (and the barrier times out) if the stages ran one after the other
+        self.assertEqual(set(scheduler.run()), {'a', 'b'})
+
+    def test_error_is_raised_and_dependents_skipped(self):
+        ran = []
+
+        def fail():
+            raise RuntimeError("stage failed")
+
+        scheduler = StageScheduler([
+            Stage('fail', fail),
+            Stage('after', lambda _: ran.append('after'), depends_on=['fail']),
+        ])
+        with self.assertRaisesRegex(RuntimeError, "stage failed"):
+            scheduler.run()
+        self.assertEqual(ran, [])
+
+    def test_rejects_cycles(self):
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            StageScheduler([
+                Stage('a', lambda c: c, depends_on=['c']),
+                Stage('b', lambda a: a, depends_on=['a']),
+                Stage('c', lambda b: b, depends_on=['b']),
+            ])
+
+    def test_rejects_unknown_dependencies_and_duplicate_names(self):
+        with self.assertRaisesRegex(ValueError, "unknown"):
+            StageScheduler([Stage('a', lambda x: x, depends_on=['missing'])])
+        with self.assertRaisesRegex(ValueError, "unique"):
+            StageScheduler([Stage('a', lambda: 1), Stage('a', lambda: 2)])
+
+    def test_run_async_awaits_coroutine_stages(self):
+        async def double(value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        scheduler = StageScheduler([
+            Stage('a', lambda: 21),
+            Stage('b', double, depends_on=['a']),
+        ])
+        self.assertEqual(asyncio.run(scheduler.run_async()), {'a': 21, 'b': 42})
+
+    def test_run_async_raises_stage_errors(self):
+        async def fail():
+            raise RuntimeError("stage failed")
+
+        scheduler = StageScheduler([Stage('fail', fail), Stage('after', lambda _: None, depends_on=['fail'])])
+        with self.assertRaisesRegex(RuntimeError, "stage failed"):
+            asyncio.run(scheduler.run_async())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from async_workflow import AsyncTourPlanner
+from cache import DiskCache, TieredCache
+from fake_backends import OpenMeteoStub
+from tests.support import fake_julep, fake_tour_planner, fake_workflow
+from tour_planner import TourPlanner
+
+WEATHER = {'temperature': 21.0, 'description': 'clear sky', 'feels_like': 20.0, 'humidity': 40}
+RESTAURANTS = ['Oslo Dumplings - Oslo Kitchen No. 1', 'Oslo Stew - Oslo Kitchen No. 2']
+
+
+class ChunkTextTest(unittest.TestCase):
+    def test_chunks_join_back_to_the_text(self):
+        text = "## Breakfast\nStart  the day with\tpastries.\n\n## Lunch\nA long lunch by the water.\n\n"
+        chunks = list(TourPlanner.chunk_text(text, words_per_chunk=3))
+        self.assertEqual(''.join(chunks), text)
+        self.assertGreater(len(chunks), 3)
+        self.assertTrue(all(len(chunk.split()) <= 3 for chunk in chunks))
+
+    def test_empty_text_has_no_chunks(self):
+        self.assertEqual(list(TourPlanner.chunk_text("")), [])
+
+
+class TourStreamTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_streams_the_narrative(self):
+        planner = fake_tour_planner(fake_julep(), self.directory)
+        chunks = list(planner.create_tour_stream('Oslo', WEATHER, 'outdoor', RESTAURANTS))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), planner.create_tour('Oslo', WEATHER, 'outdoor', RESTAURANTS))
+        self.assertIn('Oslo', ''.join(chunks))
+
+    def test_streams_the_fallback_tour_when_the_execution_fails(self):
+        planner = fake_tour_planner(fake_julep(failure_rate=1.0), self.directory)
+        narrative = ''.join(planner.create_tour_stream('Oslo', WEATHER, 'outdoor', RESTAURANTS))
+        self.assertEqual(narrative, planner._create_fallback_tour('Oslo', WEATHER, 'outdoor', RESTAURANTS))
+
+    def test_async_planner_streams_the_narrative(self):
+        julep = fake_julep()
+        planner = AsyncTourPlanner(fake_tour_planner(julep, self.directory), julep.as_async())
+
+        async def stream():
+            return [chunk async for chunk in planner.create_tour_stream('Oslo', WEATHER, 'outdoor', RESTAURANTS)]
+
+        chunks = asyncio.run(stream())
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(''.join(chunks).startswith('## Breakfast\nStart the day in Oslo'))
+
+    def test_workflow_prepares_the_tour_then_streams_its_narrative(self):
+        stub = OpenMeteoStub().start()
+        self.addCleanup(stub.stop)
+        workflow = fake_workflow(fake_julep(), stub, self.directory)
+
+        tour = workflow.prepare_foodie_tour('Oslo')
+        self.assertNotIn('tour_narrative', tour)
+        self.assertEqual(tour['dishes'], ['Oslo Dumplings', 'Oslo Stew', 'Oslo Pastry'])
+        narrative = ''.join(workflow.stream_tour_narrative(tour))
+        self.assertIn('## Dinner', narrative)
+
+
+class NarrativeCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def planner(self, julep=None) -> TourPlanner:
+        self.julep = julep or fake_julep()
+        cache = TieredCache(DiskCache(os.path.join(self.directory, 'narrative.sqlite3')))
+        return fake_tour_planner(self.julep, self.directory, cache=cache, use_cache=True)
+
+    def key(self, city='Oslo', weather=WEATHER, dining_type='outdoor', restaurants=RESTAURANTS,
+            dietary_restrictions=None) -> str:
+        return fake_tour_planner(fake_julep(), self.directory)._cache_key(city, weather, dining_type, restaurants,
+                                                                         dietary_restrictions)
+
+    def test_near_identical_requests_share_a_key(self):
+        key = self.key(dietary_restrictions=['Vegan', 'Halal'])
+        for variant in [
+            dict(weather=dict(WEATHER, temperature=22.9, humidity=90)),
+            dict(weather=dict(WEATHER, description='mainly clear')),
+            dict(city=' oslo ', dining_type='Outdoor'),
+            dict(restaurants=[' Oslo Dumplings -  Oslo Kitchen No. 1', RESTAURANTS[1]]),
+        ]:
+            with self.subTest(variant=variant):
+                self.assertEqual(self.key(**dict({'dietary_restrictions': ['Vegan', 'Halal']}, **variant)), key)
+        self.assertEqual(self.key(dietary_restrictions=[' halal', 'vegan', 'None']), key)
+        self.assertEqual(self.key(dietary_restrictions=['None']), self.key())
+
+    def test_different_requests_get_different_keys(self):
+        key = self.key()
+        for variant in [
+            dict(city='Rome'),
+            dict(weather=dict(WEATHER, temperature=24.0)),
+            dict(weather=dict(WEATHER, description='light rain')),
+            dict(dining_type='indoor'),
+            dict(restaurants=RESTAURANTS[:1]),
+            dict(dietary_restrictions=['Vegan']),
+        ]:
+            with self.subTest(variant=variant):
+                self.assertNotEqual(self.key(**variant), key)
+
+    def test_cached_narrative_needs_no_execution(self):
+        narrative = self.planner().create_tour('Oslo', WEATHER, 'outdoor', RESTAURANTS)
+        julep = fake_julep()
+        warmer = dict(WEATHER, temperature=22.0)
+        self.assertEqual(self.planner(julep).create_tour('oslo', warmer, 'Outdoor', RESTAURANTS), narrative)
+        self.assertEqual(julep.calls['executions.create'], 0)
+
+    def test_fallback_tours_are_not_cached(self):
+        planner = self.planner(fake_julep(failure_rate=1.0))
+        fallback = planner.create_tour('Oslo', WEATHER, 'outdoor', RESTAURANTS)
+        self.julep.failure_rate = 0.0
+        narrative = planner.create_tour('Oslo', WEATHER, 'outdoor', RESTAURANTS)
+        self.assertNotEqual(narrative, fallback)
+        self.assertTrue(narrative.startswith('## Breakfast\nStart the day in Oslo'))
+        self.assertEqual(self.julep.calls['executions.create'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
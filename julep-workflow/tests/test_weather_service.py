@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from fake_backends import OpenMeteoStub
+from geocode_cache import GeocodeCache
+from tests.support import fake_weather_service
+
+CITIES = ['Oslo', 'Rome', 'Lima', 'Pune', 'Kyiv']
+
+
+class WeatherBatchingTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.stub = OpenMeteoStub().start()
+        self.addCleanup(self.stub.stop)
+
+        # Coordinates are known, so every request counted below is a forecast
+        geocode_cache = GeocodeCache(os.path.join(self.directory, 'geocode.sqlite3'))
+        for i, city in enumerate(CITIES):
+            geocode_cache.set(city, 10.0 + i, 20.0 + i)
+        self.service = self.weather_service()
+
+    def weather_service(self, **options):
+        return fake_weather_service(self.stub, self.directory, **options)
+
+    def test_fetches_many_cities_in_one_request(self):
+        weather = self.service.get_weather_many(CITIES)
+        self.assertEqual([item['city'] for item in weather], CITIES)
+        self.assertEqual(self.stub.requests, 1)
+        self.assertTrue(all({'temperature', 'description', 'humidity'} <= set(item) for item in weather))
+
+    def test_splits_requests_at_batch_size(self):
+        self.service.batch_size = 2
+        self.service.get_weather_many(CITIES)
+        self.assertEqual(self.stub.requests, 3)
+
+    def test_cities_at_one_location_share_an_entry(self):
+        weather = self.service.get_weather_many(['Oslo', 'oslo', 'Rome'])
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(weather[0]['temperature'], weather[1]['temperature'])
+        self.assertEqual(weather[1]['city'], 'oslo')
+
+    def test_serves_repeat_lookups_from_the_weather_cache(self):
+        self.service.get_weather_many(CITIES[:3])
+        self.service.get_weather_many(CITIES)
+        self.service.get_weather('Oslo')
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_missing_locations_in_a_short_response_get_mock_weather(self):
+        forecasts = self.service._fetch_current([(10.0, 20.0), (11.0, 21.0)])
+        with mock.patch.object(self.service, '_fetch_current', return_value=forecasts[:1]):
+            weather = self.service.get_weather_many(['Oslo', 'Rome', 'Lima'])
+        self.assertEqual(weather[0]['temperature'], round(forecasts[0]['temperature_2m']))
+        self.assertEqual(weather[1:], [self.service._get_mock_weather('Rome'),
+                                       self.service._get_mock_weather('Lima')])
+        # Only the location that was answered is cached
+        self.assertEqual(len(self.service.weather_cache), 1)
+
+    def test_unknown_cities_get_mock_weather(self):
+        with mock.patch.object(self.service, '_geocode', return_value=(None, None)):
+            self.assertEqual(self.service.get_weather('Atlantis'), self.service._get_mock_weather('Atlantis'))
+
+    def test_prefetch_batches_cities_for_later_lookups(self):
+        self.service.prefetch_weather(CITIES + ['Atlantis'])
+        for city in CITIES:
+            self.service.get_weather(city)
+        self.assertEqual(self.stub.requests, 1)
+
+
+def response(status: int, body=None, headers=None) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status
+    result._content = json.dumps(body if body is not None else {}).encode('utf-8')
+    result.headers.update(headers or {})
+    result.url = 'http://open-meteo.test'
+    return result
+
+
+FORECAST = {'current': {'temperature_2m': 18.4, 'relative_humidity_2m': 55, 'weather_code': 61}}
+
+
+class WeatherRetryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.stub = OpenMeteoStub().start()
+        self.addCleanup(self.stub.stop)
+        self.service = fake_weather_service(self.stub, directory.name, max_retries=2, max_throttle_retries=3)
+        self.service.geocode_cache.set('Oslo', 59.91, 10.75)
+
+        sleep = mock.patch('weather_service.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def respond(self, *responses):
+        return mock.patch.object(self.service.session, 'get', side_effect=list(responses))
+
+    def test_retries_server_errors_then_succeeds(self):
+        with self.respond(response(502), response(500), response(200, FORECAST)) as get:
+            weather = self.service.get_weather('Oslo')
+        self.assertEqual((weather['temperature'], weather['description']), (18, 'light rain'))
+        self.assertEqual(get.call_count, 3)
+        self.assertEqual(self.service.connection_stats()['retries'], 2)
+
+    def test_retries_connection_errors(self):
+        with self.respond(requests.ConnectionError("reset"), response(200, FORECAST)) as get:
+            self.assertEqual(self.service.get_weather('Oslo')['temperature'], 18)
+        self.assertEqual(get.call_count, 2)
+
+    def test_falls_back_once_retries_are_used_up(self):
+        with self.respond(*[response(500)] * 3) as get:
+            weather = self.service.get_weather('Oslo')
+        self.assertEqual(weather, self.service._get_mock_weather('Oslo'))
+        self.assertEqual(get.call_count, 3)
+
+    def test_throttled_responses_have_their_own_budget_and_honour_retry_after(self):
+        throttled = [response(429, headers={'Retry-After': '2'}), response(503), response(429)]
+        with self.respond(*throttled, response(500), response(200, FORECAST)) as get:
+            self.assertEqual(self.service.get_weather('Oslo')['temperature'], 18)
+        self.assertEqual(get.call_count, 5)
+        self.assertEqual(self.sleep.call_args_list[0], mock.call(2.0))
+
+    def test_client_errors_are_not_retried(self):
+        with self.respond(response(400)) as get:
+            self.assertEqual(self.service.get_weather('Oslo'), self.service._get_mock_weather('Oslo'))
+        self.assertEqual(get.call_count, 1)
+
+    def test_requests_reuse_pooled_connections(self):
+        for i in range(5):
+            self.service.geocode_cache.set(f"City {i}", 10.0 + i, 20.0)
+            self.service.get_weather(f"City {i}")
+        stats = self.service.connection_stats()
+        self.assertEqual((stats['requests'], stats['connections_opened'], stats['connections_reused']), (5, 1, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from cuisine_agent import placeholder_dishes
+from fake_backends import LatencyModel, OpenMeteoStub
+from main import TourError
+from tests.support import fake_julep, fake_workflow
+
+
+class FakeBackendsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.stub = OpenMeteoStub(latency=LatencyModel(0.1, kind='fixed')).start()
+        self.addCleanup(self.stub.stop)
+        self.julep = fake_julep(execution_latency=0.1)
+
+    def workflow(self, **options):
+        return fake_workflow(self.julep, self.stub, self.directory, **options)
+
+
+class StageGraphTest(FakeBackendsTest):
+    def test_weather_and_dishes_run_concurrently(self):
+        tour = self.workflow().create_foodie_tour('Oslo')
+        self.assertEqual(tour['dishes'], ['Oslo Dumplings', 'Oslo Stew', 'Oslo Pastry'])
+        self.assertIn('Oslo', tour['tour_narrative'])
+
+        timings = tour['stage_timings']
+        self.assertLess(timings['weather']['start'], timings['dishes']['end'])
+        self.assertLess(timings['dishes']['start'], timings['weather']['end'])
+        self.assertGreaterEqual(timings['restaurants']['start'], timings['dishes']['end'])
+        self.assertGreaterEqual(timings['tour_narrative']['start'],
+                                max(timings['weather']['end'], timings['restaurants']['end']))
+
+
+class IterWorkflowTest(FakeBackendsTest):
+    def workflow(self, **options):
+        workflow = super().workflow(**options)
+        get_weather = workflow.weather_service.get_weather
+
+        def weather(city, timeout=None):
+            if city == 'Atlantis':
+                raise LookupError("No such city")
+            if city == 'Slowtown':
+                time.sleep(1.0)
+            return get_weather(city, timeout=timeout)
+
+        patcher = mock.patch.object(workflow.weather_service, 'get_weather', side_effect=weather)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return workflow
+
+    def test_yields_tours_in_completion_order(self):
+        results = list(self.workflow().iter_workflow(['Slowtown', 'Oslo', 'Rome']))
+        self.assertEqual(results[-1]['city'], 'Slowtown')
+        self.assertEqual({result['city'] for result in results[:2]}, {'Oslo', 'Rome'})
+
+    def test_failed_city_yields_a_tour_error(self):
+        results = list(self.workflow().iter_workflow(['Atlantis', 'Oslo']))
+        errors = [result for result in results if isinstance(result, TourError)]
+        self.assertEqual(len(results), 2)
+        self.assertEqual([(error.city, error.error_type) for error in errors], [('Atlantis', 'LookupError')])
+        self.assertEqual(errors[0].to_dict()['error'], 'No such city')
+
+    def test_run_workflow_returns_successful_tours_in_input_order(self):
+        tours = self.workflow().run_workflow(['Slowtown', 'Atlantis', 'Oslo', 'Rome'])
+        self.assertEqual([tour['city'] for tour in tours], ['Slowtown', 'Oslo', 'Rome'])
+
+    def test_pulls_jobs_lazily(self):
+        pulled = []
+
+        def jobs():
+            for index in range(50):
+                pulled.append(index)
+                yield index, f"City {index}", "Indoor", None
+
+        tours = self.workflow().iter_tours(jobs(), max_concurrency=2)
+        key, tour = next(tours)
+        self.assertLessEqual(len(pulled), 5)
+        self.assertEqual(tour['city'], f"City {key}")
+        tours.close()
+
+
+class TourVariantsTest(FakeBackendsTest):
+    def test_variants_share_lookups_and_identical_narratives(self):
+        variants = [('Indoor', ['Vegan']), ('Outdoor', None), ('indoor', ['Vegan']), ('Outdoor', ['None'])]
+        tours = self.workflow().create_foodie_tour_variants('Oslo', variants)
+
+        self.assertEqual([(tour['dining_type'], tour['dietary_restrictions']) for tour in tours],
+                         [('indoor', ['Vegan']), ('outdoor', ['None']), ('indoor', ['Vegan']), ('outdoor', ['None'])])
+        self.assertTrue(all(tour['dishes'] == tours[0]['dishes'] for tour in tours))
+        self.assertEqual(tours[2]['tour_narrative'], tours[0]['tour_narrative'])
+        # One dishes, one restaurants and two narrative executions
+        self.assertEqual(self.julep.calls['executions.create'], 4)
+
+    def test_no_variants_make_no_tours(self):
+        self.assertEqual(self.workflow().create_foodie_tour_variants('Oslo', []), [])
+        self.assertEqual(self.julep.calls['executions.create'], 0)
+
+
+class LatencyBudgetTest(FakeBackendsTest):
+    def setUp(self):
+        super().setUp()
+        self.julep = fake_julep(execution_latency=3.0)
+
+    def test_run_workflow_returns_fallbacks_within_the_budget(self):
+        workflow = self.workflow()
+        started = time.perf_counter()
+        tours = workflow.run_workflow(['Oslo', 'Rome'], latency_budget=0.5)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+        self.assertEqual([tour['city'] for tour in tours], ['Oslo', 'Rome'])
+        self.assertEqual(tours[0]['dishes'], placeholder_dishes('Oslo'))
+        self.assertEqual(tours[0]['tour_narrative'],
+                         workflow.tour_planner._create_fallback_tour('Oslo', tours[0]['weather'],
+                                                                     tours[0]['dining_type'],
+                                                                     tours[0]['restaurants']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,212 +1,360 @@
-# tour_planner.py - Fixed version
-
-from julep import Julep
-import yaml
-import time
-import os
-from typing import Dict, Any, List
-
-
-class TourPlanner:
-    def __init__(self):
-        self.client = Julep(api_key=os.getenv('JULEP_API_KEY'))
-        self.agent = self._create_agent()
-        self.tour_task = self._create_tour_task()
-
-    def _create_agent(self):
-        """Create the tour planning agent"""
-        try:
-            agent = self.client.agents.create(
-                name="Foodie Tour Planner",
-                model="gpt-4o",
-                about="A creative tour planner that crafts delightful foodie experiences based on specific city information."
-            )
-            print(f"Agent created successfully with ID: {agent.id}")
-            return agent
-        except Exception as e:
-            print(f"Failed to create agent: {e}")
-            raise
-
-    def _create_tour_task(self):
-        """Create task to plan a foodie tour"""
-        task_definition = {
-            "name": "Create Foodie Tour",
-            "description": "Create a delightful one-day foodie tour narrative for a specific city",
-            "main": [
-                {
-                    "prompt": [
-                        {
-                            "role": "system",
-                            "content": """You are a creative foodie tour planner. Create a one-day foodie tour plan for the EXACT city provided in the user message. 
-
-IMPORTANT: 
-- Use ONLY the city name provided in the user message
-- Reference the specific weather conditions provided
-- Use the exact restaurants listed
-- Consider dietary restrictions if mentioned
-- Format with clear headers: ## Breakfast, ## Lunch, ## Dinner
-- Keep descriptions engaging but concise
-- Ensure all information matches the provided city
-
-Do not use examples from other cities or generic templates."""
-                        },
-                        {
-                            "role": "user",
-                            "content": "{{user_message}}"
-                        }
-                    ]
-                }
-            ]
-        }
-
-        try:
-            task = self.client.tasks.create(
-                agent_id=self.agent.id,
-                **task_definition
-            )
-            print(f"Task created successfully with ID: {task.id}")
-            return task
-        except Exception as e:
-            print(f"Failed to create task: {e}")
-            raise
-
-    def create_tour(self, city: str, weather_data: Dict[str, Any],
-                    dining_type: str, restaurants: List[str],
-                    dietary_restrictions: List[str] = None) -> str:
-        """Create a foodie tour narrative"""
-        try:
-            # Prepare dietary restrictions text
-            dietary_text = ""
-            if dietary_restrictions and dietary_restrictions != ["None"]:
-                dietary_text = f"\n- Dietary restrictions: {', '.join(dietary_restrictions)}"
-
-            user_message = f"""Create a delightful one-day foodie tour for {city}, India.
-
-CITY: {city}
-WEATHER: {weather_data['description']} ({weather_data['temperature']}°C)
-DINING PREFERENCE: {dining_type}
-RESTAURANTS: {', '.join(restaurants)}{dietary_text}
-
-Create a tour narrative with:
-- ## Breakfast
-- ## Lunch  
-- ## Dinner
-
-Important: Use ONLY {city} as the location. Reference the {weather_data['temperature']}°C temperature and {weather_data['description']} weather. Use the provided restaurants in your recommendations."""
-
-            execution = self.client.executions.create(
-                task_id=self.tour_task.id,
-                input={
-                    "user_message": user_message
-                }
-            )
-
-            print(f"Execution created with ID: {execution.id}")
-            result = self._wait_for_completion(execution.id)
-
-            if result.status == "succeeded" and hasattr(result, 'output') and result.output:
-                # Extract the content from the response
-                if isinstance(result.output, dict) and 'choices' in result.output:
-                    content = result.output['choices'][0]['message']['content']
-                    # Verify the response contains our city name
-                    if city.lower() in content.lower():
-                        return content
-                    else:
-                        print(f"Response doesn't contain {city}. Using fallback.")
-                        return self._create_fallback_tour(city, weather_data, dining_type, restaurants,
-                                                          dietary_restrictions)
-                else:
-                    print("Unexpected output structure. Using fallback.")
-                    return self._create_fallback_tour(city, weather_data, dining_type, restaurants,
-                                                      dietary_restrictions)
-            else:
-                print(f"Execution failed. Status: {result.status}")
-                return self._create_fallback_tour(city, weather_data, dining_type, restaurants, dietary_restrictions)
-
-        except Exception as e:
-            print(f"Exception occurred: {e}")
-            return self._create_fallback_tour(city, weather_data, dining_type, restaurants, dietary_restrictions)
-
-    def _create_fallback_tour(self, city: str, weather_data: Dict[str, Any],
-                              dining_type: str, restaurants: List[str],
-                              dietary_restrictions: List[str] = None) -> str:
-        """Create a fallback tour when API fails"""
-        weather_desc = weather_data['description']
-        temp = weather_data['temperature']
-
-        # Handle dietary restrictions
-        dietary_note = ""
-        if dietary_restrictions and dietary_restrictions != ["None"]:
-            dietary_note = f" (accommodating {', '.join(dietary_restrictions)} preferences)"
-
-        # Weather-appropriate dining suggestion
-        weather_note = ""
-        if temp > 30:
-            weather_note = "Stay cool with refreshing beverages and light meals. "
-        elif temp < 15:
-            weather_note = "Warm up with hearty, comforting dishes. "
-
-        # Dining type context
-        dining_context = ""
-        if dining_type == "indoor":
-            dining_context = "enjoying air-conditioned comfort"
-        elif dining_type == "outdoor":
-            dining_context = "taking advantage of the pleasant weather"
-        else:
-            dining_context = f"experiencing {dining_type} cuisine"
-
-        tour = f"""## Your Foodie Tour of {city}
-
-**Weather**: {weather_desc} ({temp}°C)
-**Dining Style**: {dining_type.capitalize()}{dietary_note}
-
-{weather_note}Here's your perfect day exploring {city}'s culinary delights while {dining_context}.
-
-## Breakfast
-Start your morning at **{restaurants[0] if restaurants else 'a popular local breakfast spot'}**. Begin with traditional breakfast favorites that {city} is known for. The {weather_desc} weather at {temp}°C makes it {"perfect for a comfortable indoor breakfast" if temp > 30 or "rain" in weather_desc else "lovely for starting your day"}.
-
-## Lunch  
-Head to **{restaurants[1] if len(restaurants) > 1 else 'a renowned local restaurant'}** for an authentic {city} lunch experience. {"The warm weather calls for lighter fare and cooling drinks" if temp > 25 else "Perfect weather for enjoying hearty local specialties"}. This is your chance to taste the signature dishes that make {city} famous.
-
-## Dinner
-Conclude your culinary journey at **{restaurants[2] if len(restaurants) > 2 else 'a celebrated dinner destination'}**. End your day with the finest local cuisine {city} has to offer. {"The cooler evening temperature makes it ideal for a leisurely dinner" if temp > 20 else "A perfect way to warm up and reflect on your day"}.
-
-*Experience the authentic flavors of {city} - a true culinary adventure!*"""
-
-        return tour
-
-    def _wait_for_completion(self, execution_id: str):
-        """Wait for task execution to complete"""
-        max_attempts = 30
-        attempts = 0
-
-        while attempts < max_attempts:
-            result = self.client.executions.get(execution_id)
-            if result.status in ['succeeded', 'failed']:
-                return result
-            time.sleep(1)
-            attempts += 1
-
-        return type('Result', (), {'status': 'timeout', 'output': None})()
-
-
-# Example usage
-if __name__ == "__main__":
-    tour_planner = TourPlanner()
-
-    city = "Kanpur"
-    weather_data = {
-        'temperature': 37,
-        'description': 'mainly clear',
-        'feels_like': 35,
-        'humidity': 36
-    }
-    dining_type = "indoor"
-    restaurants = [
-        "Thaggu Ke Ladoo - Thaggu Ke Ladoo",
-        "Baba Sweets' Samosa - Baba Sweets",
-        "Kanpur Ki Nihari - Rahil's Nihari House"
-    ]
-
-    tour = tour_planner.create_tour(city, weather_data, dining_type, restaurants)
+# tour_planner.py - Fixed version
+
+import re
+from typing import TYPE_CHECKING, Dict, Any, Iterator, List
+
+from cache import DiskCache, TieredCache, normalize_city
+from executions import ExecutionPoller, run_execution
+from lazy import create_julep_client, lazy_property
+from metrics import metrics, progress
+from registry import AgentRegistry, default_registry, is_not_found
+from storage import cache_path, definition_hash
+
+if TYPE_CHECKING:
+    from julep import Julep
+
+AGENT_DEFINITION = {
+    "name": "Foodie Tour Planner",
+    "model": "gpt-4o",
+    "about": "A creative tour planner that crafts delightful foodie experiences based on specific city information."
+}
+
+TOUR_TASK_DEFINITION = {
+    "name": "Create Foodie Tour",
+    "description": "Create a delightful one-day foodie tour narrative for a specific city",
+    "main": [
+        {
+            "prompt": [
+                {
+                    "role": "system",
+                    "content": """You are a creative foodie tour planner. Create a one-day foodie tour plan for the EXACT city provided in the user message. 
+
+IMPORTANT: 
+- Use ONLY the city name provided in the user message
+- Reference the specific weather conditions provided
+- Use the exact restaurants listed
+- Consider dietary restrictions if mentioned
+- Format with clear headers: ## Breakfast, ## Lunch, ## Dinner
+- Keep descriptions engaging but concise
+- Ensure all information matches the provided city
+
+Do not use examples from other cities or generic templates."""
+                },
+                {
+                    "role": "user",
+                    "content": "{{user_message}}"
+                }
+            ]
+        }
+    ]
+}
+
+# Finished narratives stay valid for a day, within a 20 MB disk budget
+NARRATIVE_CACHE_TTL = 24 * 60 * 60
+NARRATIVE_CACHE_BYTES = 20 * 1024 * 1024
+
+# Weather descriptions grouped into the conditions a narrative actually reacts to
+WEATHER_CONDITIONS = {
+    'clear sky': 'clear', 'mainly clear': 'clear', 'partly cloudy': 'cloudy', 'overcast': 'cloudy',
+    'fog': 'fog', 'light drizzle': 'rain', 'drizzle': 'rain', 'heavy drizzle': 'rain',
+    'light rain': 'rain', 'rain': 'rain', 'heavy rain': 'rain', 'light snow': 'snow',
+    'snow': 'snow', 'heavy snow': 'snow', 'thunderstorm': 'storm'
+}
+
+
+class TourPlanner:
+    # Seconds to wait for the narrative before using the fallback tour
+    completion_timeout = 30
+    # Width (°C) of the temperature bands that share a cached narrative
+    temperature_band = 3
+
+    def __init__(self, registry: AgentRegistry = None, client: 'Julep' = None,
+                 poller: ExecutionPoller = None, cache: TieredCache = None, use_cache: bool = True):
+        # The client, poller, agent and task are created on first use
+        if client is not None:
+            self.client = client
+        if poller is not None:
+            self.poller = poller
+        self.registry = registry or default_registry()
+        # Generated narratives only; fallback tours are never cached
+        if use_cache and cache is None:
+            cache = TieredCache(DiskCache(cache_path('narrative_cache.sqlite3'), ttl=NARRATIVE_CACHE_TTL,
+                                          max_bytes=NARRATIVE_CACHE_BYTES))
+        self.cache = cache if use_cache else None
+
+    @lazy_property
+    def client(self) -> 'Julep':
+        return create_julep_client()
+
+    @lazy_property
+    def poller(self) -> ExecutionPoller:
+        return ExecutionPoller(self.client)
+
+    @lazy_property
+    def agent(self):
+        return self._create_agent()
+
+    @lazy_property
+    def tour_task(self):
+        return self._create_tour_task()
+
+    def _create_agent(self):
+        """Create the tour planning agent"""
+        try:
+            agent = self.registry.get_or_create_agent(self.client, **AGENT_DEFINITION)
+            progress(f"Agent ready with ID: {agent.id}")
+            return agent
+        except Exception as e:
+            progress(f"Failed to create agent: {e}")
+            raise
+
+    def _create_tour_task(self):
+        """Create task to plan a foodie tour"""
+        try:
+            task = self.registry.get_or_create_task(self.client, self.agent.id, TOUR_TASK_DEFINITION)
+            progress(f"Task ready with ID: {task.id}")
+            return task
+        except Exception as e:
+            progress(f"Failed to create task: {e}")
+            raise
+
+    def create_tour(self, city: str, weather_data: Dict[str, Any],
+                    dining_type: str, restaurants: List[str],
+                    dietary_restrictions: List[str] = None, timeout: float = None) -> str:
+        """Create a foodie tour narrative
+
+        Narratives are cached by their inputs, with the weather reduced to a
+        temperature band and a condition, so near-identical requests reuse
+        one generation. timeout, when given, caps the wait below
+        completion_timeout; the fallback tour is returned once it expires.
+        """
+        request = (city, weather_data, dining_type, restaurants, dietary_restrictions)
+        try:
+            key = self._cache_key(*request)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+            result = self._execute_tour_task(self._user_message(*request), timeout,
+                                             self._late_handler(key, city))
+            return self._tour_from_result(key, result, *request)
+
+        except Exception as e:
+            progress(f"Exception occurred: {e}")
+            return self._create_fallback_tour(*request)
+
+    def create_tour_stream(self, city: str, weather_data: Dict[str, Any],
+                           dining_type: str, restaurants: List[str],
+                           dietary_restrictions: List[str] = None, timeout: float = None) -> Iterator[str]:
+        """Yield the foodie tour narrative in chunks
+
+        Julep task executions only publish a step's output once the step has
+        finished, so the finished narrative (or the fallback tour) is split
+        into small chunks for incremental rendering.
+        """
+        tour = self.create_tour(city, weather_data, dining_type, restaurants, dietary_restrictions, timeout)
+        yield from self.chunk_text(tour)
+
+    def _user_message(self, city: str, weather_data: Dict[str, Any], dining_type: str,
+                      restaurants: List[str], dietary_restrictions: List[str] = None) -> str:
+        """Prompt for the tour task"""
+        # Prepare dietary restrictions text
+        dietary_text = ""
+        if dietary_restrictions and dietary_restrictions != ["None"]:
+            dietary_text = f"\n- Dietary restrictions: {', '.join(dietary_restrictions)}"
+
+        return f"""Create a delightful one-day foodie tour for {city}, India.
+
+CITY: {city}
+WEATHER: {weather_data['description']} ({weather_data['temperature']}°C)
+DINING PREFERENCE: {dining_type}
+RESTAURANTS: {', '.join(restaurants)}{dietary_text}
+
+Create a tour narrative with:
+- ## Breakfast
+- ## Lunch  
+- ## Dinner
+
+Important: Use ONLY {city} as the location. Reference the {weather_data['temperature']}°C temperature and {weather_data['description']} weather. Use the provided restaurants in your recommendations."""
+
+    def _narrative_content(self, result, city: str):
+        """The narrative from a finished execution, or None if it is unusable"""
+        if result.status == "succeeded" and hasattr(result, 'output') and result.output:
+            # Extract the content from the response
+            if isinstance(result.output, dict) and 'choices' in result.output:
+                with metrics.span('parse', task='tour'):
+                    content = result.output['choices'][0]['message']['content']
+                # Verify the response contains our city name
+                if city.lower() in content.lower():
+                    return content
+                progress(f"Response doesn't contain {city}. Using fallback.")
+            else:
+                progress("Unexpected output structure. Using fallback.")
+        else:
+            progress(f"Execution failed. Status: {result.status}")
+        return None
+
+    def _cache_key(self, city: str, weather_data: Dict[str, Any], dining_type: str,
+                   restaurants: List[str], dietary_restrictions: List[str] = None) -> str:
+        """Canonical hash of everything the narrative depends on"""
+        description = weather_data['description'].lower()
+        restrictions = sorted({r.strip().casefold() for r in dietary_restrictions or [] if r.strip()} - {'none'})
+        return definition_hash({
+            'definition': [AGENT_DEFINITION, TOUR_TASK_DEFINITION],
+            'city': normalize_city(city),
+            'weather': [int(weather_data['temperature'] // self.temperature_band),
+                        WEATHER_CONDITIONS.get(description, description)],
+            'dining_type': dining_type.casefold(),
+            'restaurants': [' '.join(r.split()) for r in restaurants],
+            'dietary_restrictions': restrictions
+        })
+
+    def _cache_get(self, key: str):
+        if self.cache is None:
+            return None
+        value = self.cache.get(key)
+        metrics.inc('cache_lookups_total', cache='narrative', result='miss' if value is None else 'hit')
+        metrics.set_gauge('cache_hit_ratio', self.cache.hit_ratio(), cache='narrative')
+        return value
+
+    def _cache_set(self, key: str, value):
+        if self.cache is not None and value:
+            self.cache.set(key, value)
+
+    @staticmethod
+    def chunk_text(text: str, words_per_chunk: int = 4) -> Iterator[str]:
+        """Split text into chunks of a few words, keeping whitespace and newlines"""
+        words = re.findall(r'\s*\S+', text)
+        for start in range(0, len(words), words_per_chunk):
+            yield ''.join(words[start:start + words_per_chunk])
+        trailing = text[len(text.rstrip()):]
+        if trailing:
+            yield trailing
+
+    def _create_fallback_tour(self, city: str, weather_data: Dict[str, Any],
+                              dining_type: str, restaurants: List[str],
+                              dietary_restrictions: List[str] = None) -> str:
+        """Create a fallback tour when API fails"""
+        metrics.inc('fallback_total', kind='tour')
+        weather_desc = weather_data['description']
+        temp = weather_data['temperature']
+
+        # Handle dietary restrictions
+        dietary_note = ""
+        if dietary_restrictions and dietary_restrictions != ["None"]:
+            dietary_note = f" (accommodating {', '.join(dietary_restrictions)} preferences)"
+
+        # Weather-appropriate dining suggestion
+        weather_note = ""
+        if temp > 30:
+            weather_note = "Stay cool with refreshing beverages and light meals. "
+        elif temp < 15:
+            weather_note = "Warm up with hearty, comforting dishes. "
+
+        # Dining type context
+        dining_context = ""
+        if dining_type == "indoor":
+            dining_context = "enjoying air-conditioned comfort"
+        elif dining_type == "outdoor":
+            dining_context = "taking advantage of the pleasant weather"
+        else:
+            dining_context = f"experiencing {dining_type} cuisine"
+
+        tour = f"""## Your Foodie Tour of {city}
+
+**Weather**: {weather_desc} ({temp}°C)
+**Dining Style**: {dining_type.capitalize()}{dietary_note}
+
+{weather_note}Here's your perfect day exploring {city}'s culinary delights while {dining_context}.
+
+## Breakfast
+Start your morning at **{restaurants[0] if restaurants else 'a popular local breakfast spot'}**. Begin with traditional breakfast favorites that {city} is known for. The {weather_desc} weather at {temp}°C makes it {"perfect for a comfortable indoor breakfast" if temp > 30 or "rain" in weather_desc else "lovely for starting your day"}.
+
+## Lunch  
+Head to **{restaurants[1] if len(restaurants) > 1 else 'a renowned local restaurant'}** for an authentic {city} lunch experience. {"The warm weather calls for lighter fare and cooling drinks" if temp > 25 else "Perfect weather for enjoying hearty local specialties"}. This is your chance to taste the signature dishes that make {city} famous.
+
+## Dinner
+Conclude your culinary journey at **{restaurants[2] if len(restaurants) > 2 else 'a celebrated dinner destination'}**. End your day with the finest local cuisine {city} has to offer. {"The cooler evening temperature makes it ideal for a leisurely dinner" if temp > 20 else "A perfect way to warm up and reflect on your day"}.
+
+*Experience the authentic flavors of {city} - a true culinary adventure!*"""
+
+        return tour
+
+    def _execute_tour_task(self, user_message: str, timeout: float = None, on_late=None):
+        """Run the tour task and wait for it to complete
+
+        A timed-out execution is handed to on_late when it finishes, so the
+        narrative can still be cached; without on_late it is cancelled.
+        """
+        try:
+            execution_timeout = self._execution_timeout(timeout)
+            for attempt in range(2):
+                task_id = self.tour_task.id
+                try:
+                    return run_execution(self.poller, task_id, {"user_message": user_message},
+                                         task='tour', timeout=execution_timeout, on_late=on_late)
+                except Exception as e:
+                    if attempt or not is_not_found(e):
+                        raise
+                    # The task or agent was deleted on the server: create them again, once
+                    self._forget_resources(task_id)
+        except TimeoutError:
+            return self._timed_out(timeout)
+
+    # The steps below are shared with AsyncTourPlanner, which only replaces
+    # the execution itself
+
+    def _tour_from_result(self, key: str, result, city: str, weather_data: Dict[str, Any], dining_type: str,
+                          restaurants: List[str], dietary_restrictions: List[str] = None) -> str:
+        """The generated narrative, cached, or the fallback tour"""
+        content = self._narrative_content(result, city)
+        if content is not None:
+            self._cache_set(key, content)
+            return content
+        return self._create_fallback_tour(city, weather_data, dining_type, restaurants, dietary_restrictions)
+
+    def _forget_resources(self, stale_id: str):
+        self.registry.forget_resources(self, stale_id, 'agent', 'tour_task')
+
+    def _late_handler(self, key: str, city: str):
+        if self.cache is None:
+            return None
+        return lambda result: self._cache_set(key, self._narrative_content(result, city))
+
+    def _budgeted(self, timeout: float = None) -> bool:
+        return timeout is not None and timeout < self.completion_timeout
+
+    def _execution_timeout(self, timeout: float = None) -> float:
+        """Seconds to wait for the execution: timeout when it is tighter than completion_timeout"""
+        if not self._budgeted(timeout):
+            return self.completion_timeout
+        if timeout <= 0:
+            raise TimeoutError("No time left for the tour narrative")
+        return timeout
+
+    def _timed_out(self, timeout: float = None):
+        if self._budgeted(timeout):
+            metrics.inc('deadline_fallback_total', stage='tour_narrative')
+        return type('Result', (), {'status': 'timeout', 'output': None})()
+
+
+# Example usage
+if __name__ == "__main__":
+    tour_planner = TourPlanner()
+
+    city = "Kanpur"
+    weather_data = {
+        'temperature': 37,
+        'description': 'mainly clear',
+        'feels_like': 35,
+        'humidity': 36
+    }
+    dining_type = "indoor"
+    restaurants = [
+        "Thaggu Ke Ladoo - Thaggu Ke Ladoo",
+        "Baba Sweets' Samosa - Baba Sweets",
+        "Kanpur Ki Nihari - Rahil's Nihari House"
+    ]
+
+    tour = tour_planner.create_tour(city, weather_data, dining_type, restaurants)
     print(f"Foodie Tour for {city}:\n{tour}")
\ No newline at end of file
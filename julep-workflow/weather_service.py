@@ -1,99 +1,426 @@
-import requests
-from typing import Dict, Any
-
-
-class WeatherService:
-    def __init__(self):
-        # Using Open-Meteo API (free, no API key required)
-        self.geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-        self.weather_url = "https://api.open-meteo.com/v1/forecast"  # Corrected URL
-
-    def _get_coordinates(self, city: str) -> tuple:
-        """Get latitude and longitude for a city"""
-        try:
-            response = requests.get(self.geocoding_url, params={'name': city, 'count': 1})
-            response.raise_for_status()
-            data = response.json()
-
-            if data.get('results'):
-                result = data['results'][0]
-                return result['latitude'], result['longitude']
-            return None, None
-        except:
-            return None, None
-
-    def get_weather(self, city: str) -> Dict[str, Any]:
-        """Get current weather for a city using Open-Meteo API"""
-        lat, lon = self._get_coordinates(city)
-
-        if not lat or not lon:
-            return self._get_mock_weather(city)
-
-        try:
-            params = {
-                'latitude': lat,
-                'longitude': lon,
-                'current': 'temperature_2m,relative_humidity_2m,weather_code',
-                'timezone': 'auto'
-            }
-
-            response = requests.get(self.weather_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            current = data['current']
-            weather_desc = self._get_weather_description(current['weather_code'])
-
-            return {
-                'city': city,
-                'temperature': round(current['temperature_2m']),
-                'description': weather_desc,
-                'feels_like': round(current['temperature_2m']),  # Simplified
-                'humidity': current['relative_humidity_2m']
-            }
-        except requests.RequestException as e:
-            print(f"Error fetching weather for {city}: {e}")
-            return self._get_mock_weather(city)
-
-    def _get_weather_description(self, code: int) -> str:
-        """Convert weather code to description"""
-        descriptions = {
-            0: 'clear sky', 1: 'mainly clear', 2: 'partly cloudy', 3: 'overcast',
-            45: 'fog', 48: 'fog', 51: 'light drizzle', 53: 'drizzle', 55: 'heavy drizzle',
-            61: 'light rain', 63: 'rain', 65: 'heavy rain', 71: 'light snow',
-            73: 'snow', 75: 'heavy snow', 95: 'thunderstorm'
-        }
-        return descriptions.get(code, 'partly cloudy')
-
-    def _get_mock_weather(self, city: str) -> Dict[str, Any]:
-        """Fallback mock weather data"""
-        return {
-            'city': city,
-            'temperature': 20,
-            'description': 'partly cloudy',
-            'feels_like': 20,
-            'humidity': 60
-        }
-
-    def suggest_dining_type(self, weather_data: Dict[str, Any]) -> str:
-        """Suggest indoor or outdoor dining based on weather"""
-        temp = weather_data['temperature']
-        description = weather_data['description'].lower()
-
-        if temp < 10 or temp > 35:
-            return "indoor"
-        elif any(word in description for word in ['rain', 'storm', 'snow']):
-            return "indoor"
-        else:
-            return "outdoor"
-
-
-""" example code:     
-
-if __name__ == "__main__":
-    weather_service = WeatherService()
-    weather_data = weather_service.get_weather("Chandigarh")
-    print(f"Weather: {weather_data}")
-    print(f"Dining suggestion: {weather_service.suggest_dining_type(weather_data)}")
-
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+
+from cache import TTLCache, normalize_city
+from circuit_breaker import CircuitBreaker, CircuitOpen, get_breaker
+from geocode_cache import GeocodeCache
+from knowledge_pack import KnowledgePack, default_pack
+from lazy import lazy_property
+from metrics import metrics, progress
+from rate_limiter import THROTTLE_STATUSES, AdaptiveRateLimiter, get_limiter
+from singleflight import SingleFlight, default_group
+
+if TYPE_CHECKING:
+    import requests
+
+
+class Attempts:
+    """Retry bookkeeping for one Open-Meteo request, shared by the blocking and async clients
+
+    Regular retries (failed connections, 5xx) and throttled responses have
+    separate budgets, as described in WeatherService._send.
+    """
+
+    def __init__(self, service: 'WeatherService'):
+        self.service = service
+        self.retries = 0
+        self.throttled = 0
+
+    def last(self) -> bool:
+        """Whether the regular retry budget is used up"""
+        return self.retries == self.service.max_retries
+
+    def after_response(self, response) -> Optional[float]:
+        """Seconds to wait before retrying, or None when response is final
+
+        A final error response raises through raise_for_status.
+        """
+        service = self.service
+        if response.status_code in THROTTLE_STATUSES and self.throttled < service.max_throttle_retries:
+            service.rate_limiter.on_throttle()
+            self.throttled += 1
+            return self.retry(service._retry_after(response))
+        if response.status_code not in service.retry_statuses or self.last():
+            response.raise_for_status()
+            service.rate_limiter.on_success()
+            return None
+        return self.retry()
+
+    def retry(self, delay: float = None) -> float:
+        """Count a retry; without delay, back off and use up one regular retry"""
+        if delay is None:
+            delay = self.service._backoff(self.retries)
+            self.retries += 1
+        self.service._count_retry()
+        return delay
+
+
+class WeatherService:
+    # Maximum number of locations sent in one forecast request
+    batch_size = 100
+    # Responses worth retrying: rate limiting and transient server errors
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, geocode_cache: GeocodeCache = None, weather_ttl: float = 900,
+                 pool_size: int = 10, connect_timeout: float = 3.05, read_timeout: float = 10,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8,
+                 max_throttle_retries: int = 6, rate_limiter: AdaptiveRateLimiter = None,
+                 flights: SingleFlight = None, breaker: CircuitBreaker = None,
+                 knowledge_pack: KnowledgePack = None, use_knowledge_pack: bool = True,
+                 geocoding_url: str = "https://geocoding-api.open-meteo.com/v1/search",
+                 weather_url: str = "https://api.open-meteo.com/v1/forecast"):
+        # Using Open-Meteo API (free, no API key required)
+        self.geocoding_url = geocoding_url
+        self.weather_url = weather_url
+        # Coordinates never change, so they are cached on disk across runs
+        self.geocode_cache = geocode_cache if geocode_cache is not None else GeocodeCache()
+        # Precomputed coordinates for popular cities, consulted before geocoding
+        self.knowledge_pack = (knowledge_pack or default_pack()) if use_knowledge_pack else None
+        # Current conditions keyed by (lat, lon), reused within 15-minute windows
+        self.weather_cache = TTLCache(ttl=weather_ttl)
+        # Concurrent requests for the same city share one geocode + fetch
+        self.flights = flights or default_group()
+        # Runs lookups that must finish within a deadline, so a late one can
+        # complete (and fill the caches) after the caller has moved on
+        self._background = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="weather")
+        # Runs batched prefetches; kept apart from _background, whose threads
+        # may be waiting for a prefetch to finish
+        self._prefetcher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather-prefetch")
+
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Rate-limited responses slow every caller down through the shared
+        # limiter and are retried on their own budget instead of falling back
+        self.max_throttle_retries = max_throttle_retries
+        self.rate_limiter = rate_limiter or get_limiter('open-meteo')
+        # While Open-Meteo keeps failing, requests fail fast and mock weather is used
+        self.breaker = breaker or get_breaker('open-meteo')
+        self._adapter = None
+        self._stats_lock = threading.Lock()
+        self._requests_sent = 0
+        self._retries = 0
+
+    @lazy_property
+    def session(self) -> 'requests.Session':
+        """Keep-alive connections shared by every request, opened on first use
+
+        pool_size should match the number of threads calling the service
+        concurrently.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        session.mount('https://', self._adapter)
+        session.mount('http://', self._adapter)
+        return session
+
+    def _get_coordinates(self, city: str) -> tuple:
+        """Get latitude and longitude for a city"""
+        cached = self._cached_coordinates(city)
+        if cached is not None:
+            return cached
+
+        with metrics.span('geocode'):
+            lat, lon = self._geocode(city)
+        return self._store_coordinates(city, lat, lon)
+
+    def _cached_coordinates(self, city: str) -> Optional[tuple]:
+        cached = self.geocode_cache.get(city)
+        metrics.inc('cache_lookups_total', cache='geocode', result='miss' if cached is None else 'hit')
+        if cached is None and self.knowledge_pack is not None:
+            cached = self.knowledge_pack.coordinates(city)
+        return cached
+
+    def _store_coordinates(self, city: str, lat: Optional[float], lon: Optional[float]) -> tuple:
+        if lat is not None and lon is not None:
+            self.geocode_cache.set(city, lat, lon)
+        return lat, lon
+
+    def preload_coordinates(self, cities: List[str]) -> int:
+        """Geocode and cache a list of cities ahead of time"""
+        return self.geocode_cache.preload(cities, self._geocode)
+
+    def _geocode(self, city: str) -> tuple:
+        """Look up latitude and longitude with the Open-Meteo geocoding API"""
+        try:
+            response = self._request(self.geocoding_url, params={'name': city, 'count': 1})
+            return self._parse_geocode(response.json())
+        except:
+            return None, None
+
+    @staticmethod
+    def _parse_geocode(data: Dict[str, Any]) -> tuple:
+        if data.get('results'):
+            result = data['results'][0]
+            return result['latitude'], result['longitude']
+        return None, None
+
+    def get_weather(self, city: str, timeout: float = None) -> Dict[str, Any]:
+        """Get current weather for a city using Open-Meteo API
+
+        When timeout expires, mock weather is returned while the lookup
+        finishes in the background and fills the caches.
+        """
+        if timeout is None:
+            weather = self.flights.do('weather', normalize_city(city), self._get_weather_one, city)
+            return dict(weather, city=city)
+
+        future = self._background.submit(self.flights.do, 'weather', normalize_city(city),
+                                         self._get_weather_one, city)
+        try:
+            weather = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            metrics.inc('deadline_fallback_total', stage='weather')
+            return self._get_mock_weather(city)
+        return dict(weather, city=city)
+
+    def _get_weather_one(self, city: str) -> Dict[str, Any]:
+        return self.get_weather_many([city])[0]
+
+    def get_weather_many(self, cities: List[str]) -> List[Dict[str, Any]]:
+        """Get current weather for several cities with batched Open-Meteo requests
+
+        Results are returned in input order. Locations already fetched in the
+        current cache window are served locally; the rest are requested in
+        chunks of batch_size locations per call.
+        """
+        import requests
+
+        coordinates = [self._get_coordinates(city) for city in cities]
+        results, pending = self._from_weather_cache(cities, coordinates)
+
+        for chunk in self._chunks(list(pending)):
+            try:
+                with metrics.span('weather_fetch'):
+                    currents = self._fetch_current(chunk)
+                metrics.inc('weather_locations_fetched_total', len(chunk))
+            except (requests.RequestException, KeyError, CircuitOpen) as e:
+                self._fill_mock_weather(cities, results, pending, chunk, e)
+                continue
+            self._fill_weather(cities, results, pending, chunk, currents)
+
+        return results
+
+    def prefetch_weather(self, cities: List[str]):
+        """Start fetching weather for many cities in batched requests, without waiting for them
+
+        Only cities whose coordinates are already cached are included, so no
+        geocoding holds up the caller or the batch. Their get_weather calls
+        share the batch instead of sending their own request, and still give
+        up at their own timeout; the other cities are looked up as usual.
+        """
+        try:
+            located = self._located(cities)
+            claimed = self.flights.start_many('weather', located)
+        except Exception as e:
+            progress(f"Weather prefetch failed: {e}")
+            return
+        for start in range(0, len(claimed), self.batch_size):
+            keys = claimed[start:start + self.batch_size]
+            self._prefetcher.submit(self._prefetch_chunk, keys, [located[key] for key in keys])
+
+    def _prefetch_chunk(self, keys: List[str], cities: List[str]):
+        try:
+            self.flights.finish_many('weather', keys, self.get_weather_many, cities)
+        except Exception as e:
+            progress(f"Weather prefetch failed: {e}")
+
+    def _located(self, cities: List[str]) -> Dict[str, str]:
+        """Cities with cached coordinates, keyed by normalized name"""
+        located = {}
+        for city in cities:
+            if self._cached_coordinates(city) is not None:
+                located.setdefault(normalize_city(city), city)
+        return located
+
+    def _from_weather_cache(self, cities: List[str], coordinates: List[tuple]):
+        """Results served from mock data or the weather cache, plus the locations still to fetch
+
+        pending maps each (lat, lon) to fetch to the indices of the cities there.
+        """
+        results = [None] * len(cities)
+        pending = {}
+
+        for index, (city, (lat, lon)) in enumerate(zip(cities, coordinates)):
+            if not lat or not lon:
+                results[index] = self._get_mock_weather(city)
+                continue
+
+            location = (round(lat, 4), round(lon, 4))
+            current = self.weather_cache.get(location)
+            if current is not None:
+                results[index] = self._format_weather(city, current)
+            else:
+                pending.setdefault(location, []).append(index)
+        return results, pending
+
+    def _chunks(self, locations: List[tuple]) -> List[List[tuple]]:
+        return [locations[start:start + self.batch_size] for start in range(0, len(locations), self.batch_size)]
+
+    def _fill_weather(self, cities, results, pending, chunk, currents):
+        for location, current in zip(chunk, currents):
+            self.weather_cache.set(location, current)
+            for index in pending[location]:
+                results[index] = self._format_weather(cities[index], current)
+        if len(currents) < len(chunk):
+            # Locations missing from the response get mock weather, like a failed request
+            error = ValueError(f"Open-Meteo returned {len(currents)} of {len(chunk)} locations")
+            self._fill_mock_weather(cities, results, pending, chunk[len(currents):], error)
+
+    def _fill_mock_weather(self, cities, results, pending, chunk, error: Exception):
+        for location in chunk:
+            for index in pending[location]:
+                progress(f"Error fetching weather for {cities[index]}: {error}")
+                results[index] = self._get_mock_weather(cities[index])
+
+    def _fetch_current(self, locations: List[tuple]) -> List[Dict[str, Any]]:
+        """Fetch current conditions for a list of (lat, lon) pairs in one request"""
+        response = self._request(self.weather_url, self._current_params(locations))
+        return self._parse_current(response.json())
+
+    @staticmethod
+    def _current_params(locations: List[tuple]) -> Dict[str, Any]:
+        return {
+            'latitude': ','.join(str(lat) for lat, _ in locations),
+            'longitude': ','.join(str(lon) for _, lon in locations),
+            'current': 'temperature_2m,relative_humidity_2m,weather_code',
+            'timezone': 'auto'
+        }
+
+    @staticmethod
+    def _parse_current(data) -> List[Dict[str, Any]]:
+        # A single location returns an object, several return a list
+        if isinstance(data, dict):
+            data = [data]
+        return [item['current'] for item in data]
+
+    def _request(self, url: str, params: Dict[str, Any]) -> 'requests.Response':
+        """_send through the Open-Meteo circuit breaker
+
+        While the breaker is open this raises CircuitOpen without sending
+        anything, and callers fall back to mock weather straight away.
+        """
+        with self.breaker.guard():
+            return self._send(url, params)
+
+    def _send(self, url: str, params: Dict[str, Any]) -> 'requests.Response':
+        """GET with timeouts, retrying transient failures with jittered backoff
+
+        Every attempt waits for the shared rate limiter. 429/503 responses
+        lower its rate and are retried up to max_throttle_retries times,
+        honouring Retry-After, without using up the regular retry budget.
+        """
+        import requests
+
+        attempts = Attempts(self)
+        while True:
+            self.rate_limiter.acquire()
+            self._count_request()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempts.last():
+                    raise
+                delay = attempts.retry()
+            else:
+                delay = attempts.after_response(response)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent retries from arriving in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _count_request(self):
+        with self._stats_lock:
+            self._requests_sent += 1
+
+    def _count_retry(self):
+        with self._stats_lock:
+            self._retries += 1
+
+    def _retry_after(self, response: 'requests.Response') -> float:
+        """Seconds to wait before retrying a throttled response, capped at backoff_max"""
+        try:
+            return min(self.backoff_max, max(0.0, float(response.headers.get('Retry-After', 0))))
+        except ValueError:
+            # HTTP-date values are rare here; the limiter already slows things down
+            return 0.0
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """Requests sent versus TCP/TLS connections opened by the session pool"""
+        pools = self._adapter.poolmanager.pools if self._adapter is not None else {}
+        opened = sum(pools[key].num_connections for key in pools.keys())
+        with self._stats_lock:
+            sent, retries = self._requests_sent, self._retries
+        return {
+            'requests': sent,
+            'connections_opened': opened,
+            'connections_reused': max(0, sent - opened),
+            'retries': retries,
+            'rate_limit': self.rate_limiter.stats(),
+            'circuit_breaker': self.breaker.stats()
+        }
+
+    def _format_weather(self, city: str, current: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the weather dict used by the workflow from Open-Meteo current data"""
+        return {
+            'city': city,
+            'temperature': round(current['temperature_2m']),
+            'description': self._get_weather_description(current['weather_code']),
+            'feels_like': round(current['temperature_2m']),  # Simplified
+            'humidity': current['relative_humidity_2m']
+        }
+
+    def _get_weather_description(self, code: int) -> str:
+        """Convert weather code to description"""
+        descriptions = {
+            0: 'clear sky', 1: 'mainly clear', 2: 'partly cloudy', 3: 'overcast',
+            45: 'fog', 48: 'fog', 51: 'light drizzle', 53: 'drizzle', 55: 'heavy drizzle',
+            61: 'light rain', 63: 'rain', 65: 'heavy rain', 71: 'light snow',
+            73: 'snow', 75: 'heavy snow', 95: 'thunderstorm'
+        }
+        return descriptions.get(code, 'partly cloudy')
+
+    def _get_mock_weather(self, city: str) -> Dict[str, Any]:
+        """Fallback mock weather data"""
+        metrics.inc('fallback_total', kind='weather')
+        return {
+            'city': city,
+            'temperature': 20,
+            'description': 'partly cloudy',
+            'feels_like': 20,
+            'humidity': 60
+        }
+
+    def suggest_dining_type(self, weather_data: Dict[str, Any]) -> str:
+        """Suggest indoor or outdoor dining based on weather"""
+        temp = weather_data['temperature']
+        description = weather_data['description'].lower()
+
+        if temp < 10 or temp > 35:
+            return "indoor"
+        elif any(word in description for word in ['rain', 'storm', 'snow']):
+            return "indoor"
+        else:
+            return "outdoor"
+
+
+""" example code:     
+
+if __name__ == "__main__":
+    weather_service = WeatherService()
+    weather_data = weather_service.get_weather("Chandigarh")
+    print(f"Weather: {weather_data}")
+    print(f"Dining suggestion: {weather_service.suggest_dining_type(weather_data)}")
+
 """
\ No newline at end of file